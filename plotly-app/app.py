@@ -7,6 +7,9 @@ import dash
 
 
 from pages.utils.kerasWrapper import KerasWrapper
+from db_utils import pool_stats, statement_stats
+from pages.utils.tiles import fbk_tiles
+from pages.utils import singleflight, notify, inference
 
 pd.options.mode.chained_assignment = None  # default='warn'
 
@@ -89,6 +92,21 @@ content = html.Div([dash.page_container], id="page-content", className="content"
 
 app.layout = html.Div([dcc.Location(id="url"), sidebar, content])
 server = app.server
+
+
+# internal counters, exposed only in debug mode or with STATS_ROUTES set
+STATS = {
+    "db": lambda: {"pool": pool_stats(), "statements": statement_stats()},
+    "tiles": fbk_tiles.stats,
+    "singleflight": singleflight.stats,
+    "notify": notify.stats,
+    "inference": inference.stats,
+}
+if os.getenv("DEBUG") or os.getenv("STATS_ROUTES"):
+    for _name, _stats in STATS.items():
+        server.add_url_rule(f"/stats/{_name}", f"{_name}_stats", _stats)
+
+
 if __name__ == "__main__":
     if os.getenv("DEBUG"):
         app.run(debug=True)
@@ -0,0 +1,83 @@
+/*
+ * Linked x axes: zooming or panning a graph of a group applies the same x
+ * range to the other graphs of the group, in the browser. Only date axes are
+ * linked; a figure opts out with layout.meta.linked = false.
+ */
+(function () {
+    var GROUPS = [
+        ["resistance-plot", "heater-plot", "voltage-plot", "bosch-plot"],
+        ["main-plot", "year-plot", "week-plot"],
+    ];
+
+    function plotDiv(id) {
+        var graph = document.getElementById(id);
+        return graph && graph.querySelector(".js-plotly-plot");
+    }
+
+    function linkable(gd) {
+        var layout = gd && gd._fullLayout;
+        var meta = gd && gd.layout && gd.layout.meta;
+        return Boolean(
+            layout && layout.xaxis && layout.xaxis.type === "date" &&
+            !(meta && meta.linked === false)
+        );
+    }
+
+    function xUpdate(event) {
+        if (event["xaxis.autorange"]) {
+            return {"xaxis.autorange": true};
+        }
+        if ("xaxis.range[0]" in event && "xaxis.range[1]" in event) {
+            return {"xaxis.range": [event["xaxis.range[0]"], event["xaxis.range[1]"]]};
+        }
+        if (event["xaxis.range"]) {
+            return {"xaxis.range": event["xaxis.range"].slice()};
+        }
+        return null;
+    }
+
+    function link(gd, group) {
+        // plotly drops the listeners (and _ev) when a graph is purged
+        if (gd._linkedAxes === gd._ev) {
+            return;
+        }
+        gd._linkedAxes = gd._ev;
+        gd.on("plotly_relayout", function (event) {
+            if (gd._linkedSync) {
+                // our own relayout, do not bounce it back
+                gd._linkedSync = false;
+                return;
+            }
+            var update = xUpdate(event || {});
+            if (!update || !linkable(gd)) {
+                return;
+            }
+            group.forEach(function (id) {
+                var other = plotDiv(id);
+                if (other && other !== gd && linkable(other)) {
+                    other._linkedSync = true;
+                    window.Plotly.relayout(other, update).then(function () {
+                        other._linkedSync = false;
+                    });
+                }
+            });
+        });
+    }
+
+    function linkAll() {
+        GROUPS.forEach(function (group) {
+            group.forEach(function (id) {
+                var gd = plotDiv(id);
+                if (gd && gd.on) {
+                    link(gd, group);
+                }
+            });
+        });
+    }
+
+    // graphs come and go with the pages
+    new MutationObserver(linkAll).observe(document.documentElement, {
+        childList: true,
+        subtree: true,
+    });
+})();
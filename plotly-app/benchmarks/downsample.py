@@ -0,0 +1,74 @@
+"""
+Payload size and serialisation time of a resistance-plot-like figure (eight
+sensors) with and without server-side downsampling. Uses synthetic data, no
+database needed:
+
+    python -m benchmarks.downsample
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from pages.utils import downsample
+
+SENSORS = 8
+# period -> readings per sensor (one every 10 seconds)
+PERIODS = {
+    "last day": 8640,
+    "last week": 7 * 8640,
+    "custom 30 days": 30 * 8640,
+}
+CONFIGS = {
+    "raw": None,
+    "lttb 2000": ("lttb", 2000),
+    "minmax 1000": ("minmax", 1000),
+}
+
+
+def synthetic(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    ts = pd.date_range("2023-01-01", periods=rows, freq="10s", tz="UTC")
+    drift = np.sin(np.arange(rows) / 2000.0)
+    return pd.DataFrame(
+        {
+            "ts": np.tile(ts, SENSORS),
+            "sensor_description": np.repeat([f"S{i}" for i in range(SENSORS)], rows),
+            "signal_res": np.concatenate(
+                [1e5 * (i + 1) * (1 + drift + rng.normal(0, 0.05, rows)) for i in range(SENSORS)]
+            ),
+        }
+    )
+
+
+def build(df: pd.DataFrame, config) -> go.Figure:
+    fig = go.Figure()
+    for sensor, group in df.groupby("sensor_description"):
+        x, y = group["ts"], group["signal_res"]
+        if config:
+            method, points = config
+            x, y = downsample.downsample(x, y, points, method)
+        fig.add_trace(go.Scatter(x=x, y=y, name=sensor))
+    return fig
+
+
+def measure(df: pd.DataFrame, config):
+    start = time.perf_counter()
+    fig = build(df, config)
+    built = time.perf_counter()
+    payload = fig.to_json()
+    done = time.perf_counter()
+    return built - start, done - built, len(payload)
+
+
+if __name__ == "__main__":
+    print(f"{'period':<16}{'config':<14}{'build (s)':>10}{'json (s)':>10}{'payload (MB)':>14}")
+    for period, rows in PERIODS.items():
+        df = synthetic(rows)
+        for name, config in CONFIGS.items():
+            build_time, json_time, size = measure(df, config)
+            print(
+                f"{period:<16}{name:<14}{build_time:>10.2f}{json_time:>10.2f}"
+                f"{size / 2**20:>14.2f}"
+            )
@@ -0,0 +1,41 @@
+"""
+Compares the two fetch engines of db_utils.load_data_from_psql on the
+heaviest dashboard pulls: wall time and peak python heap (tracemalloc).
+
+Run from plotly-app/ against a populated database:
+
+    python -m benchmarks.fetch_engines
+"""
+import time
+import tracemalloc
+
+from db_utils import load_data_from_psql
+from pages.utils import querys
+
+QUERIES = {
+    "6 months raw": querys.query_6moths,
+    "6 months avg (node 1)": querys.query_6moths_avg_node_1,
+    "month avg": querys.query_month_avg,
+}
+ENGINES = ["fetchall", "copy"]
+
+
+def measure(query: str, engine: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = load_data_from_psql(query, engine=engine)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(df), df.memory_usage(deep=True).sum()
+
+
+if __name__ == "__main__":
+    print(f"{'query':<24}{'engine':<10}{'rows':>10}{'time (s)':>10}{'peak (MB)':>11}{'frame (MB)':>12}")
+    for name, query in QUERIES.items():
+        for engine in ENGINES:
+            elapsed, peak, rows, size = measure(query, engine)
+            print(
+                f"{name:<24}{engine:<10}{rows:>10}{elapsed:>10.2f}"
+                f"{peak / 2**20:>11.1f}{size / 2**20:>12.1f}"
+            )
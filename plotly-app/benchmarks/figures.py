@@ -0,0 +1,81 @@
+"""
+Time to build the traces of the resistance, heater and voltage plots from
+1e6 readings (eight sensors): per-trace boolean masks of the long frame, a
+groupby per plot, and pages.utils.figures (one pivot for the three plots).
+Synthetic data, no database:
+
+    python -m benchmarks.figures
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from pages.utils import downsample, figures
+
+ROWS = 1_000_000
+SENSORS = 8
+REPEATS = 3
+# value -> (method, points) of its plot, as in fbk-raw
+PLOTS = {
+    "signal_res": ("lttb", 2000),
+    "heater_res": ("minmax", 1000),
+    "volt": ("minmax", 1000),
+}
+
+
+def synthetic() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    per_sensor = ROWS // SENSORS
+    ts = pd.date_range("2023-01-01", periods=per_sensor, freq="10s", tz="UTC")
+    df = pd.DataFrame(
+        {
+            # packet order: the sensors of a packet one after the other
+            "ts": np.repeat(ts, SENSORS),
+            "sensor_description": np.tile([f"S{i}" for i in range(SENSORS)], per_sensor),
+        }
+    )
+    for value in PLOTS:
+        df[value] = rng.normal(100, 5, len(df))
+    return df
+
+
+def masks(df: pd.DataFrame) -> list:
+    traces = []
+    for value, (method, points) in PLOTS.items():
+        for sensor, _ in df.groupby("sensor_description"):
+            x = df[df["sensor_description"] == sensor]["ts"]
+            y = df[df["sensor_description"] == sensor][value]
+            x, y = downsample.downsample(x, y, points, method)
+            traces.append(go.Scatter(x=x, y=y, name=sensor))
+    return traces
+
+
+def groupby(df: pd.DataFrame) -> list:
+    traces = []
+    for value, (method, points) in PLOTS.items():
+        for sensor, group in df.groupby("sensor_description"):
+            x, y = downsample.downsample(group["ts"], group[value], points, method)
+            traces.append(go.Scatter(x=x, y=y, name=sensor))
+    return traces
+
+
+def pivot(df: pd.DataFrame) -> list:
+    wide = figures.pivot(df, "ts", "sensor_description", list(PLOTS))
+    traces = []
+    for value, downsampling in PLOTS.items():
+        traces += figures.traces(wide, value, downsampling)
+    return traces
+
+
+if __name__ == "__main__":
+    df = synthetic()
+    print(f"{len(df)} rows, {SENSORS} sensors, {len(PLOTS)} plots")
+    print(f"{'construction':<14}{'traces':>8}{'time (s)':>10}")
+    for name, build in [("masks", masks), ("groupby", groupby), ("pivot", pivot)]:
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            traces = build(df)
+        seconds = (time.perf_counter() - start) / REPEATS
+        print(f"{name:<14}{len(traces):>8}{seconds:>10.2f}")
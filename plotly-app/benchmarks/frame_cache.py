@@ -0,0 +1,54 @@
+"""
+Cache file size, write time and hit time of an appa_data-like frame (ten
+years, hourly, every station and pollutant) stored by the default pickle
+serializer and by pages.utils.frame_cache. Synthetic data, no database:
+
+    python -m benchmarks.frame_cache
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from flask_caching.backends.filesystemcache import FileSystemCache
+
+from pages.utils.frame_cache import FrameFileSystemCache
+
+STATIONS = ["Parco S. Chiara", "Via Bolzano", "Rovereto", "Riva del Garda", "Borgo Valsugana"]
+POLLUTANTS = ["NO2", "PM10", "PM2.5", "O3"]
+HOURS = 10 * 365 * 24
+REPEATS = 5
+
+
+def synthetic() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    series = len(STATIONS) * len(POLLUTANTS)
+    return pd.DataFrame(
+        {
+            "Station": np.repeat(STATIONS, HOURS * len(POLLUTANTS)).astype(object),
+            "Pollutant": np.tile(np.repeat(POLLUTANTS, HOURS), len(STATIONS)).astype(object),
+            "Date": np.tile(pd.date_range("2014-01-01", periods=HOURS, freq="h", tz="UTC"), series),
+            "Value": rng.gamma(2.0, 15.0, HOURS * series).round(1),
+        }
+    )
+
+
+def measure(backend, df: pd.DataFrame):
+    start = time.perf_counter()
+    backend.set("frame", df)
+    written = time.perf_counter()
+    for _ in range(REPEATS):
+        backend.get("frame")
+    read = time.perf_counter()
+    size = sum(entry.stat().st_size for entry in os.scandir(backend._path))
+    return written - start, (read - written) / REPEATS, size
+
+
+if __name__ == "__main__":
+    df = synthetic()
+    print(f"{len(df)} rows")
+    print(f"{'serializer':<12}{'write (s)':>10}{'hit (s)':>10}{'file (MB)':>11}")
+    for name, cls in [("pickle", FileSystemCache), ("columnar", FrameFileSystemCache)]:
+        write, hit, size = measure(cls(tempfile.mkdtemp()), df)
+        print(f"{name:<12}{write:>10.2f}{hit:>10.3f}{size / 2**20:>11.1f}")
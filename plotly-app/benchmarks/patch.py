@@ -0,0 +1,139 @@
+"""
+Bytes sent each way and server time of the fbk-raw interactions that only
+change the layout (y axis type, history lines) or the visible window (zoom),
+with the four figures round-tripped as State (before) and as Patch partial
+updates (now). A "last day" view of eight sensors, synthetic data, no
+database:
+
+    python -m benchmarks.patch
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from dash import Patch
+from plotly.io.json import to_json_plotly
+
+SENSORS = 8
+# one reading per sensor every 10 seconds
+ROWS = 8640
+REPEATS = 5
+FIGURES = ["resistance", "heater", "volt", "bosch"]
+
+
+def synthetic(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    ts = pd.date_range("2023-01-01", periods=rows, freq="10s", tz="UTC")
+    df = pd.DataFrame(
+        {
+            "ts": np.tile(ts, SENSORS),
+            "sensor_description": np.repeat([f"S{i}" for i in range(SENSORS)], rows),
+        }
+    )
+    for column in ["signal_res", "heater_res", "volt", "t", "rh", "p"]:
+        df[column] = rng.normal(100, 5, len(df))
+    return df
+
+
+def build(df: pd.DataFrame) -> list:
+    figures = []
+    for column in ["signal_res", "heater_res", "volt"]:
+        figure = go.Figure()
+        for sensor, group in df.groupby("sensor_description"):
+            figure.add_trace(go.Scatter(x=group["ts"], y=group[column], name=sensor))
+        figures.append(figure)
+    bosch = df.drop_duplicates("ts")
+    figures.append(
+        go.Figure([go.Scatter(x=bosch["ts"], y=bosch[column]) for column in ["t", "rh", "p"]])
+    )
+    return figures
+
+
+def history_shapes(df: pd.DataFrame) -> list:
+    return [
+        dict(type="line", x0=x, x1=x, xref="x", y0=0, y1=1, yref="y domain")
+        for x in df["ts"].iloc[:: len(df) // 4]
+    ]
+
+
+def state_roundtrip(states: list, change) -> tuple:
+    """
+    Before: the figures come in as State, are changed and sent back whole
+    """
+    request = to_json_plotly(states)
+    start = time.perf_counter()
+    figures = [go.Figure(state) for state in states]
+    change(figures)
+    response = to_json_plotly(figures)
+    return len(request), len(response), time.perf_counter() - start
+
+
+def patch_roundtrip(change) -> tuple:
+    """
+    Now: nothing comes in but the inputs, a Patch per changed figure goes out
+    """
+    start = time.perf_counter()
+    response = to_json_plotly(change())
+    return 0, len(response), time.perf_counter() - start
+
+
+def measure(roundtrip, *args) -> tuple:
+    runs = [roundtrip(*args) for _ in range(REPEATS)]
+    return runs[0][0], runs[0][1], sum(run[2] for run in runs) / REPEATS
+
+
+if __name__ == "__main__":
+    df = synthetic(ROWS)
+    states = [figure.to_plotly_json() for figure in build(df)]
+    window = df[df["ts"] < df["ts"].iloc[ROWS // 8]]
+    zoomed = build(window)
+    zoom_range = [window["ts"].min(), window["ts"].max()]
+
+    def axis_state(figures):
+        figures[0].update_yaxes(type="log")
+
+    def axis_patch():
+        patched = Patch()
+        patched["layout"]["yaxis"]["type"] = "log"
+        return patched
+
+    def history_state(figures):
+        figures[0].update_layout(shapes=history_shapes(df))
+
+    def history_patch():
+        patched = Patch()
+        patched["layout"]["shapes"] = history_shapes(df)
+        return patched
+
+    def zoom_state(figures):
+        figures[:] = zoomed
+        for figure in figures:
+            figure.update_xaxes(range=zoom_range, autorange=False)
+
+    def zoom_patch():
+        patches = []
+        for figure in zoomed:
+            patched = Patch()
+            patched["data"] = figure.to_plotly_json()["data"]
+            patched["layout"]["xaxis"]["range"] = zoom_range
+            patched["layout"]["xaxis"]["autorange"] = False
+            patches.append(patched)
+        return patches
+
+    interactions = {
+        "yaxis type": (axis_state, axis_patch),
+        "history": (history_state, history_patch),
+        "zoom 3h": (zoom_state, zoom_patch),
+    }
+    print(f"{len(df)} rows, {len(FIGURES)} figures")
+    print(f"{'interaction':<13}{'update':<8}{'in (KB)':>10}{'out (KB)':>10}{'server (s)':>12}")
+    for name, (state_change, patch_change) in interactions.items():
+        for update, (sent, received, seconds) in [
+            ("state", measure(state_roundtrip, states, state_change)),
+            ("patch", measure(patch_roundtrip, patch_change)),
+        ]:
+            print(
+                f"{name:<13}{update:<8}{sent / 2**10:>10.1f}{received / 2**10:>10.1f}"
+                f"{seconds:>12.3f}"
+            )
@@ -1,18 +1,419 @@
+import io
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
 import pandas as pd
 import psycopg2
+from psycopg2 import errors as pg_errors
+from psycopg2 import extensions as pg_extensions
+from psycopg2 import pool as pg_pool
+
+DB_CONFIG = dict(
+    database=os.getenv("PGDATABASE", "webvalley2022"),
+    user=os.getenv("PGUSER", "postgres"),
+    password=os.getenv("PGPASSWORD", "postgres"),
+    host=os.getenv("PGHOST", "localhost"),
+    port=os.getenv("PGPORT", "5432"),
+)
+
+# pool sizing is per process: every gunicorn worker gets its own pool
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "8"))
+# seconds a checkout waits for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# connections idle for longer than this are pinged before being handed out
+HEALTH_CHECK_AFTER = float(os.getenv("DB_HEALTH_CHECK_AFTER", "30"))
+
+
+class PooledConnection(pg_extensions.connection):
+    """
+    psycopg2 connection that remembers which statements are prepared on it
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 pool that blocks (instead of failing) when all
+    connections are checked out and validates idle connections on checkout.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, **dsn):
+        self._pool = pg_pool.ThreadedConnectionPool(
+            minconn, maxconn, connection_factory=PooledConnection, **dsn
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.stats = {"checkouts": 0, "waits": 0, "reconnects": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0)
+        if idle < HEALTH_CHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as curs:
+                curs.execute("select 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            if not self._slots.acquire(timeout=self._timeout):
+                raise pg_pool.PoolError(
+                    f"no free connection after {self._timeout}s ({self.maxconn} in use)"
+                )
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self._count("reconnects")
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        self._count("checkouts")
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        try:
+            if close or conn.closed:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# pools inherited through fork: their sockets belong to the parent, so they
+# are never closed from the child (that would terminate the parent's sessions)
+_inherited_pools = []
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the pool of the current process, creating it on first use and
+    again after a fork (e.g. in every gunicorn worker)
+
+    Returns:
+        ConnectionPool: the process-wide pool
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            _pool = ConnectionPool(
+                POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT, **DB_CONFIG
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def pool_stats() -> dict:
+    """
+    Returns the checkout/wait/reconnect counters of this process' pool
+    """
+    pool = get_pool()
+    with pool._lock:
+        stats = dict(pool.stats)
+    stats.update(pid=_pool_pid, minconn=pool.minconn, maxconn=pool.maxconn)
+    return stats
+
+
+@contextmanager
+def get_connection():
+    """
+    Checks a connection out of the pool and returns it when the block exits.
+    Broken connections are discarded instead of being put back.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+class Statement:
+    """
+    A named statement with $1..$n placeholders. It is PREPAREd once per pooled
+    connection and then EXECUTEd with bound parameters, so postgres parses it
+    only once no matter how many distinct values it is called with.
+    """
+
+    def __init__(self, name: str, sql: str, types: tuple = ()):
+        self.name = name
+        self.sql = sql.strip().rstrip(";")
+        self.types = tuple(types)
+
+    def __call__(self, *params) -> "BoundQuery":
+        if len(params) != len(self.types):
+            raise TypeError(
+                f"statement {self.name} takes {len(self.types)} parameters, got {len(params)}"
+            )
+        return BoundQuery(self, params)
+
+    def __repr__(self):
+        return f"Statement({self.name!r})"
+
+
+class BoundQuery:
+    """
+    A Statement together with the values of its parameters
+    """
+
+    def __init__(self, statement: Statement, params: tuple):
+        self.statement = statement
+        self.params = tuple(params)
+
+    def __repr__(self):
+        return f"{self.statement.name}{self.params}"
+
+
+# name -> Statement, filled by the modules defining the queries
+STATEMENTS = {}
+# name -> timing counters, see statement_stats()
+_statement_stats = {}
+_stats_lock = threading.Lock()
+
+
+def statement(name: str, sql: str, types: tuple = ()) -> Statement:
+    """
+    Registers a named, parameterised statement
+
+    Args:
+        name (str): unique statement name, a valid SQL identifier
+        sql (str): the query, with $1..$n placeholders
+        types (tuple, optional): postgres types of the parameters
+
+    Returns:
+        Statement: call it with the parameter values to get a BoundQuery
+    """
+    if name in STATEMENTS and STATEMENTS[name].sql != sql.strip().rstrip(";"):
+        raise ValueError(f"statement {name} is already registered")
+    STATEMENTS[name] = Statement(name, sql, types)
+    return STATEMENTS[name]
+
+
+def _record(name: str, phase: str, elapsed: float):
+    with _stats_lock:
+        stats = _statement_stats.setdefault(
+            name, {"prepares": 0, "prepare_s": 0.0, "executions": 0, "execute_s": 0.0}
+        )
+        if phase == "prepare":
+            stats["prepares"] += 1
+            stats["prepare_s"] += elapsed
+        else:
+            stats["executions"] += 1
+            stats["execute_s"] += elapsed
+
+
+def statement_stats() -> list:
+    """
+    Returns the per-statement prepare (parse/analyse) and execute (plan, run
+    and fetch) timings of this process, slowest statement first
+    """
+    with _stats_lock:
+        rows = [dict(name=name, **stats) for name, stats in _statement_stats.items()]
+    for row in rows:
+        row["execute_avg_s"] = row["execute_s"] / max(row["executions"], 1)
+    return sorted(rows, key=lambda row: row["execute_s"], reverse=True)
+
+
+# $n placeholders, skipping the ones inside literals, identifiers and comments
+_PLACEHOLDER = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|\$(\d+)""")
+
+
+def _inline(curs, query) -> str:
+    """
+    Renders a BoundQuery as plain SQL with its parameters quoted in, for the
+    paths that cannot EXECUTE a prepared statement (COPY, named cursors)
+    """
+    if not isinstance(query, BoundQuery):
+        return query
+    params = query.params
+
+    def quote(match):
+        if match.group(1) is None:
+            # a string literal, quoted identifier or comment: kept as is
+            return match.group(0)
+        return curs.mogrify("%s", (params[int(match.group(1)) - 1],)).decode()
+
+    return _PLACEHOLDER.sub(quote, query.statement.sql)
+
+
+def _execute(curs, query):
+    """
+    Executes a plain SQL string, or a BoundQuery through its prepared statement
+    """
+    if not isinstance(query, BoundQuery):
+        curs.execute(query)
+        return
+    stmt = query.statement
+    conn = curs.connection
+    if stmt.name not in conn.prepared:
+        start = time.perf_counter()
+        types = f" ({', '.join(stmt.types)})" if stmt.types else ""
+        curs.execute(f"PREPARE {stmt.name}{types} AS {stmt.sql};")
+        conn.prepared.add(stmt.name)
+        _record(stmt.name, "prepare", time.perf_counter() - start)
+    args = f" ({', '.join(['%s'] * len(query.params))})" if query.params else ""
+    try:
+        curs.execute(f"EXECUTE {stmt.name}{args};", query.params)
+    except pg_errors.InvalidSqlStatementName:
+        # the session lost it (e.g. DISCARD ALL): prepare again next time
+        conn.prepared.discard(stmt.name)
+        raise
+
+
+# postgres type oids, used by the copy engine to type the columns up front
+_FLOAT_OIDS = {700, 701, 1700}  # float4, float8, numeric
+_INT_OIDS = {20, 21, 23}  # int8, int2, int4
+_TIMESTAMP_OIDS = {1114: False, 1184: True, 1082: False}  # oid -> tz-aware
+
+
+def _strip_query(query: str) -> str:
+    return query.strip().rstrip(";")
+
+
+def _fetch_rows(curs, query, columns=None):
+    start = time.perf_counter()
+    _execute(curs, query)
+    result = curs.fetchall()
+    if isinstance(query, BoundQuery):
+        _record(query.statement.name, "execute", time.perf_counter() - start)
+    if columns is None:
+        columns = [desc[0] for desc in curs.description]
+    return pd.DataFrame(result, columns=columns)
+
+
+def _fetch_copy(curs, query, columns=None) -> pd.DataFrame:
+    """
+    Streams the result through COPY ... TO STDOUT (CSV) and parses it with
+    the C csv reader straight into typed columns, skipping the per-row
+    tuples and Decimal objects of fetchall
+    """
+    start = time.perf_counter()
+    statement_name = query.statement.name if isinstance(query, BoundQuery) else None
+    query = _strip_query(_inline(curs, query))
+    # a zero-row execution gives us the column names and types
+    curs.execute(f"select * from ({query}\n) as q limit 0;")
+    description = [(desc[0], desc[1]) for desc in curs.description]
+    names = list(columns) if columns is not None else [d[0] for d in description]
+
+    buffer = io.BytesIO()
+    curs.copy_expert(f"COPY ({query}\n) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+
+    dtypes = {}
+    for name, (_, oid) in zip(names, description):
+        if oid in _FLOAT_OIDS:
+            dtypes[name] = "float64"
+        elif oid in _INT_OIDS:
+            dtypes[name] = "Int64"
+        else:
+            dtypes[name] = "object"
+    df = pd.read_csv(buffer, names=names, header=None, dtype=dtypes)
+    for name, (_, oid) in zip(names, description):
+        if oid in _TIMESTAMP_OIDS:
+            # timestamptz values carry their own offset (+01/+02 across DST)
+            df[name] = pd.to_datetime(df[name], utc=_TIMESTAMP_OIDS[oid])
+    if statement_name is not None:
+        _record(statement_name, "execute", time.perf_counter() - start)
+    return df
+
+
+FETCH_ENGINES = {
+    "fetchall": _fetch_rows,
+    "copy": _fetch_copy,
+}
+
+
+def load_data_from_psql(
+    query, columns=None, engine: str = "fetchall", **kwargs
+) -> pd.DataFrame:
+    """
+    Runs the query on a pooled connection and returns the result
+
+    Args:
+        query (str | BoundQuery): the select to run, or a prepared statement
+            bound to its parameters
+        columns (list, optional): column names. Defaults to the query's ones.
+        engine (str, optional): "fetchall" builds the frame from python rows,
+            "copy" streams CSV through COPY into float64/datetime64 columns.
+            Defaults to "fetchall".
+
+    Returns:
+        pd.DataFrame: the result
+    """
+    fetch = FETCH_ENGINES[engine]
+    with get_connection() as conn:
+        # the connection's with block commits/rolls back, it does not close it
+        with conn:
+            with conn.cursor() as curs:
+                df = fetch(curs, query, columns)
+    if kwargs:
+        df = pd.DataFrame(df, **kwargs)
+    return df
+
+
+def iter_data_from_psql(query, chunk_size: int = 50000, columns=None):
+    """
+    Runs the query through a server-side (named) cursor and yields the result
+    in DataFrame chunks, so only one chunk at a time is held in memory.
+    The pooled connection stays checked out until the generator is exhausted
+    or closed.
+
+    Args:
+        query (str | BoundQuery): the select to run
+        chunk_size (int, optional): rows per chunk. Defaults to 50000.
+        columns (list, optional): column names. Defaults to the query's ones.
 
-def load_data_from_psql(query: str, columns=None, **kwargs) -> pd.DataFrame:
-    # todo: reuse connection maybe?
-    with psycopg2.connect(
-        database="webvalley2022", user='postgres',
-        password='postgres',
-        host='localhost', port='5432'
-    ) as conn:
-        with conn.cursor() as curs:
-            curs.execute(query)
-            result = curs.fetchall()
-            if columns is None:
-                columns = [desc[0] for desc in curs.description]
-    # for some reason exiting the connection’s with block doesn’t close the connection automatically
-    conn.close()
-    return pd.DataFrame(result, columns=columns, **kwargs)
+    Yields:
+        pd.DataFrame: the next chunk of rows
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor(name=f"chunked_{uuid.uuid4().hex}") as curs:
+                curs.itersize = chunk_size
+                # DECLARE cannot wrap an EXECUTE, so bound queries are inlined
+                curs.execute(_inline(curs, query))
+                while True:
+                    rows = curs.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    if columns is None:
+                        columns = [desc[0] for desc in curs.description]
+                    yield pd.DataFrame(rows, columns=columns)
@@ -1,7 +1,7 @@
 from dash import html, dcc, Input, Output, callback, callback_context, State
-from db_utils import load_data_from_psql
-from datetime import datetime, date
-from .utils import utils, querys
+from db_utils import load_data_from_psql, iter_data_from_psql
+from datetime import datetime, date, timezone
+from .utils import utils, querys, planner, downsample, figures, localtime, refresher, singleflight, notify
 
 
 import dash_bootstrap_components as dbc
@@ -27,7 +27,10 @@ threshold = {
 
 cache = Cache(
     dash.get_app().server,
-    config={"CACHE_TYPE": "filesystem", "CACHE_DIR": "cache-directory"},
+    config={
+        "CACHE_TYPE": "pages.utils.frame_cache.FrameFileSystemCache",
+        "CACHE_DIR": "cache-directory",
+    },
 )
 
 MONTHS = [
@@ -48,7 +51,7 @@ MONTHS = [
 dash.register_page(__name__)
 
 stations = list(
-    load_data_from_psql("select distinct stazione from appa_data;").stazione
+    load_data_from_psql(querys.query_appa_stations).stazione
 )
 
 stations = stations
@@ -63,13 +66,37 @@ limit_pollutants = {
 }
 
 
-@cache.memoize(timeout=604800 * 2)  # cached 7 day
-def get_all_data() -> pd.DataFrame:
-    start = datetime.now()
-    df = load_data_from_psql(
-        "select stazione, inquinante, ts, valore from appa_data where date_part('year', ts) >= date_part('year', CURRENT_DATE) - 10"
-    )
-    print(f"QUERY TIME just query: {datetime.now() - start}")
+# rows per chunk when streaming the ten years of appa_data
+APPA_CHUNK_SIZE = 100000
+
+# figure -> (method, points per trace), None keeps every point
+DOWNSAMPLING = {
+    "main-plot": ("lttb", 1500),
+    "compare-years": ("lttb", 1000),
+}
+
+WEEKDAYS = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+def clean_appa_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Renames the appa_data columns, drops the "n.d." readings and types the
+    Date and Value columns
+
+    Args:
+        df (pd.DataFrame): a chunk of appa_data rows
+
+    Returns:
+        pd.DataFrame: the cleaned chunk
+    """
     df = df.rename(
         {
             "stazione": "Station",
@@ -81,32 +108,78 @@ def get_all_data() -> pd.DataFrame:
     )
     # keep only rows with a value that's not NA
     df = df[df.Value != "n.d."]
-    df["Date"] = pd.to_datetime(df["Date"], utc=True)
-    year = date.today().year
-    year = f"{year-9}-01-01"
-    df = df[df["Date"] >= year]
+    df["Date"] = localtime.to_local(df["Date"])
     df["Value"] = df["Value"].astype(float)
+    return df
+
+
+@singleflight.coalesce
+def load_all_data() -> pd.DataFrame:
+    """
+    Daily means of every station and pollutant since the first of January
+    nine years ago, from the daily buckets of the planner (a row per station,
+    pollutant and day rather than every reading)
+    """
+    start = datetime.now()
+    first = datetime(date.today().year - 9, 1, 1, tzinfo=timezone.utc)
+    df = planner.load_appa(
+        first, datetime.now(timezone.utc), bucket_seconds=86400, transform=clean_appa_chunk
+    )
 
     print(f"QUERY TIME final df: {datetime.now() - start}")
     return df
 
 
-def get_appa_data(selected_period: str) -> pd.DataFrame:
+def _profile_keys(df: pd.DataFrame) -> list:
+    return [
+        df.Date.dt.year.rename("Year"),
+        df.Date.dt.month.rename("Month_num"),
+        df.Date.dt.day_of_week.rename("Weekday_num"),
+    ]
+
+
+@cache.memoize(timeout=604800 * 2)  # cached 7 day
+@singleflight.coalesce
+def get_profiles(station: str, pollutant: str) -> tuple:
+    """
+    Folds the last ten years of one station and pollutant, chunk by chunk,
+    into per (year, month, weekday) sums and counts of the readings. Both the
+    year comparison and the weekday plots are derived from these.
+
+    Args:
+        station (str): the appa station
+        pollutant (str): the pollutant
+
+    Returns:
+        tuple: (sums, counts) dataframes of Value
+    """
+    chunks = iter_data_from_psql(
+        querys.query_appa_station_history(station, pollutant),
+        columns=["Date", "Value"],
+        chunk_size=APPA_CHUNK_SIZE,
+    )
+    chunks = (clean_appa_chunk(chunk) for chunk in chunks)
+    sums, counts = utils.fold_sum_count(chunks, _profile_keys)
+    if sums is None:
+        index = pd.MultiIndex.from_arrays(
+            [[], [], []], names=["Year", "Month_num", "Weekday_num"]
+        )
+        sums = counts = pd.DataFrame({"Value": []}, index=index)
+    return sums, counts
+
+
+def get_season(month: pd.Series) -> pd.Series:
+    season = pd.Series("Summer", index=month.index)
+    season[(month >= 4) & (month <= 6)] = "Spring"
+    season[(month >= 10) & (month <= 12)] = "Fall"
+    season[(month >= 1) & (month <= 3)] = "Winter"
+    return season
+
+
+@singleflight.coalesce
+def load_appa_data(selected_period: str) -> pd.DataFrame:
     start = datetime.now()
-    if selected_period in "last day":
-        query = "select stazione, inquinante, ts, valore from appa_data where ts >= NOW() - interval '24 hours';"
-    elif selected_period in "last week":
-        query = "select stazione, inquinante, ts, valore from appa_data where ts >= NOW() - interval '7 days';"
-    elif selected_period in "last month":
-        query = "select stazione, inquinante, ts, valore from appa_data where ts >= NOW() - interval '30 days';"
-    elif selected_period in "last 6 months":
-        query = querys.q_custom_appa_from_now("180 days", 6)
-    elif selected_period in "last year":
-        query = querys.q_custom_appa_from_now("1 years", 12)
-    elif selected_period in "all data":
-        query = querys.query_appa_one_data_per_week
-
-    df = load_data_from_psql(query)
+    df = planner.load_appa(*planner.period_range(selected_period))
     logging.info("Query time", datetime.now() - start)
 
     df = df.rename(
@@ -120,11 +193,79 @@ def get_appa_data(selected_period: str) -> pd.DataFrame:
     )
     # keep only rows with a value that's not NA
     df = df[df.Value != "n.d."]
-    df["Date"] = pd.to_datetime(df["Date"], utc=True)
+    df["Date"] = localtime.to_local(df["Date"])
     print(f"QUERY TIME {selected_period}: {datetime.now() - start}")
     return df
 
 
+@singleflight.coalesce
+def load_custom_range(start_date, end_date, station: str, pollutant: str) -> pd.DataFrame:
+    """
+    Loads one station and pollutant between two dates
+    """
+    df = planner.load_appa(
+        start_date,
+        end_date,
+        stations=[station],
+        pollutants=[pollutant],
+    )
+
+    df = df.rename(
+        {
+            "stazione": "Station",
+            "inquinante": "Pollutant",
+            "ts": "Date",
+            "valore": "Value",
+        },
+        axis=1,
+    )
+    # keep only rows with a value that's not NA
+    df = df[df.Value != "n.d."]
+    df["Date"] = localtime.to_local(df["Date"])
+    return df
+
+
+# period -> seconds after which the refresher reloads it
+PERIOD_REFRESH = {
+    "last day": 900,
+    "last week": 1800,
+    "last month": 3600,
+    "last 6 months": 3 * 3600,
+    "last year": 6 * 3600,
+    "all data": 86400,
+}
+for _period, _every in PERIOD_REFRESH.items():
+    refresher.register(
+        f"appa {_period}", lambda period=_period: load_appa_data(period), _every
+    )
+refresher.register("appa last 10 years", load_all_data, 86400)
+
+
+def on_appa_readings(rows: list):
+    """
+    Insert notifications: reloads the periods holding the new readings and
+    forgets the profiles of the stations and pollutants they belong to. The
+    full history stays on its daily refresh.
+    """
+    for period, every in PERIOD_REFRESH.items():
+        if every < 86400:
+            refresher.expire(f"appa {period}")
+    for row in rows:
+        cache.delete_memoized(get_profiles, row["stazione"], row["inquinante"])
+
+
+notify.subscribe(notify.APPA_CHANNEL, on_appa_readings)
+notify.start()
+
+
+def get_appa_data(selected_period: str) -> pd.DataFrame:
+    return refresher.get(f"appa {selected_period}")
+
+
+def get_all_data() -> pd.DataFrame:
+    return refresher.get("appa last 10 years")
+
+
 def filter_df(df: pd.DataFrame, station: str, pollutant: str) -> pd.DataFrame:
     """
     returns a dataframe formed of all the records of the selected station and pollutant
@@ -158,13 +299,16 @@ def plot_compare_years(start_date, end_date, selected_appa_station, pollutant):
     )
     # keep only rows with a value that's not NA
     df = df[df.Value != "n.d."]
-    df["Date"] = pd.to_datetime(df["Date"], utc=False)
+    df["Date"] = localtime.to_local(df["Date"])
     df["Year"] = df.Date.dt.year
     df["Date"] = df["Date"].dt.strftime("2000-%m-%d %H")
     df["Date"] = pd.to_datetime(df["Date"], utc=False)
 
     df = filter_df(df, selected_appa_station, pollutant)
     df.sort_values(by="Date", inplace=True)
+    df = downsample.downsample_frame(
+        df, "Date", "Value", *DOWNSAMPLING["compare-years"], by="Year"
+    )
 
     fig = px.line(
         df,
@@ -186,6 +330,8 @@ def plot_compare_years(start_date, end_date, selected_appa_station, pollutant):
             font_size=16,
         ),
         modebar=dict(bgcolor="#ffffff"),
+        # the years are folded onto 2000: not the dates of the main plot
+        meta=dict(linked=False),
     )
     fig.update_yaxes(
         title="μg/m3",
@@ -250,6 +396,7 @@ def line_plot(
     title_size: int = 14,
     color: str = None,
     sort=False,
+    figure: str = "main-plot",
 ) -> go.Figure:
     """
     Generates a line plot based on the dataframe, x and y given
@@ -259,10 +406,13 @@ def line_plot(
         x (str): the column to select as X axis
         y (str): the column to select as Y axis
         color (str, optional): the column to assign different colors for multiple plots. Defaults to None.
+        figure (str, optional): the DOWNSAMPLING entry to apply. Defaults to "main-plot".
 
     Returns:
         go.Figure: the line plot
     """
+    df = downsample.downsample_frame(df, x, y, *DOWNSAMPLING[figure])
+
 
     colors = []
     for i in df[y]:
@@ -375,9 +525,7 @@ def get_pollutants(selected_appa_station: str) -> dbc.RadioItems:
         dbc.RadioItems: the radio items of the pollutants
     """
 
-    df = load_data_from_psql(
-        f"select distinct inquinante as Pollutant from appa_data where stazione = '{selected_appa_station}';"
-    )
+    df = load_data_from_psql(querys.query_appa_pollutants(selected_appa_station))
 
     # get pollutants and build dict from it
     pollutants = df.pollutant.unique()
@@ -456,21 +604,9 @@ def update_main_plot(
         and end_date
     ):
         LAST_CLICKED = "btn_search_date"
-        q = querys.q_custom_appa(start_date, end_date, 1)
-        df = load_data_from_psql(q)
-
-        df = df.rename(
-            {
-                "stazione": "Station",
-                "inquinante": "Pollutant",
-                "min": "Date",
-                "avg": "Value",
-            },
-            axis=1,
+        df = load_custom_range(
+            start_date, end_date, selected_appa_station, selected_pollutant
         )
-        # keep only rows with a value that's not NA
-        df = df[df.Value != "n.d."]
-        df["Date"] = pd.to_datetime(df["Date"], utc=True)
     else:
         LAST_CLICKED = "else"
         df = get_appa_data(selected_appa_period)
@@ -493,15 +629,14 @@ def update_main_plot(
         )
     # ----------------------------------------------------------------------------------
 
-    df = get_all_data()
-    data = filter_df(df, selected_appa_station, selected_pollutant)
-
-    df_year = data.groupby(
-        [data.Date.dt.year, data.Date.dt.month_name(), data.Date.dt.month]
-    ).mean(numeric_only=True)
+    sums, counts = get_profiles(selected_appa_station, selected_pollutant)
 
-    df_year.index.names = ["Year", "Month", "Month_num"]
+    df_year = (
+        sums.groupby(level=["Year", "Month_num"]).sum()
+        / counts.groupby(level=["Year", "Month_num"]).sum()
+    )
     df_year = df_year.reset_index()
+    df_year["Month"] = [MONTHS[m - 1] for m in df_year["Month_num"]]
 
     # set the ordering (e.g. January < February) for the column 'Month'
     df_year["Month"] = pd.Categorical(df_year["Month"], categories=MONTHS, ordered=True)
@@ -509,18 +644,11 @@ def update_main_plot(
     # sort the values based on the ordering given before
     df_year.sort_values("Month_num", inplace=True)
 
-    fig_year = go.Figure()
-
-    for year, group in df_year.groupby("Year"):
-        fig_year.add_trace(
-            go.Scatter(
-                x=df_year[df_year["Year"] == year]["Month"],
-                y=df_year[df_year["Year"] == year]["Value"],
-                name=year,
-                mode="lines",
-                line_shape="spline",
-            )
-        )
+    # one pivot (month x year), one trace per year
+    wide = figures.pivot(df_year, "Month", "Year", ["Value"])
+    fig_year = go.Figure(
+        figures.traces(wide, "Value", mode="lines", line_shape="spline")
+    )
     fig_year.update_traces(
         line=dict(width=2),
         opacity=0.8,
@@ -549,26 +677,21 @@ def update_main_plot(
     fig_year.update_layout(hovermode="x unified")
 
     # -------------------------------------------------------------------------------------
-    df_week = data
     if callback_context.triggered_id == "selected-weekday-period":
         if selected_weekday_period != "All years":
-            df_week = data[data["Date"].dt.year == selected_weekday_period]
-
-    df_week["Month"] = data.Date.dt.month
-
-    # add new column
-    df_week["Season"] = "Summer"
+            year_level = sums.index.get_level_values("Year")
+            sums = sums[year_level == selected_weekday_period]
+            counts = counts[year_level == selected_weekday_period]
 
-    # set January to March and October to December as 'Inverno' True
-    df_week.loc[(df_week.Month >= 4) & (df_week.Month <= 6), "Season"] = "Spring"
-    df_week.loc[(df_week.Month >= 10) & (df_week.Month <= 12), "Season"] = "Fall"
-    df_week.loc[(df_week.Month >= 1) & (df_week.Month <= 3), "Season"] = "Winter"
+    sums = sums.reset_index()
+    counts = counts.reset_index()
+    for part in (sums, counts):
+        part["Season"] = get_season(part["Month_num"])
+        part["Weekday"] = [WEEKDAYS[d] for d in part["Weekday_num"]]
 
     # make daily average of pollutant level
-    df_week = df_week.groupby(
-        ["Season", df_week.Date.dt.day_name(), df_week.Date.dt.day_of_week]
-    ).mean(numeric_only=True)
-    df_week.index.names = ["Season", "Weekday", "Weekday_num"]
+    keys = ["Season", "Weekday", "Weekday_num"]
+    df_week = sums.groupby(keys)[["Value"]].sum() / counts.groupby(keys)[["Value"]].sum()
     df_week = df_week.reset_index()
     df_week = df_week.sort_values("Weekday_num")
 
@@ -6,12 +6,10 @@ from dash import (
     callback,
     State,
     callback_context,
-    DiskcacheManager,
+    Patch,
 )
-from db_utils import load_data_from_psql
 from datetime import datetime
-from .utils import utils, querys
-import json
+from .utils import utils, querys, planner, downsample, figures, health, sensor_meta, localtime, tiles, refresher, singleflight, livetail, notify
 
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
@@ -22,7 +20,6 @@ import os
 import dash_daq as daq
 
 from flask_caching import Cache
-import diskcache
 
 
 ###################
@@ -32,14 +29,13 @@ import diskcache
 
 cache = Cache(
     dash.get_app().server,
-    config={"CACHE_TYPE": "filesystem", "CACHE_DIR": "cache-directory"},
+    config={
+        "CACHE_TYPE": "pages.utils.frame_cache.FrameFileSystemCache",
+        "CACHE_DIR": "cache-directory",
+    },
 )
 
 
-
-cache_disk = diskcache.Cache("./cache_disk")
-background_callback_manager = DiskcacheManager(cache_disk)
-
 # cache = Cache(dash.get_app().server, config={
 #     # try 'filesystem' if you don't want to setup redis
 #     'CACHE_TYPE': 'redis',
@@ -49,55 +45,140 @@ background_callback_manager = DiskcacheManager(cache_disk)
 dash.register_page(__name__, path="/")
 
 
-@cache.memoize(timeout=360)  # cached 5 min
-def get_data_hours() -> pd.DataFrame:
-    print("NOT CACHED HOURS")
-    fbk_data = load_data_from_psql(querys.query_hour)
-    return utils.filter_fbk_data(fbk_data)
+# nodes of the two stations shown on this page
+STATION_NODES = [1, 6]
+
+
+# figure -> (method, points per trace), None keeps every point
+DOWNSAMPLING = {
+    "resistance-plot": ("lttb", 2000),
+    "heater-plot": ("minmax", 1000),
+    "voltage-plot": ("minmax", 1000),
+    "bosch-plot": ("lttb", 1000),
+}
+# values of the resistance, heater and voltage plots (one trace per sensor)
+SENSOR_VALUES = ["signal_res", "heater_res", "volt"]
+
+
+# live period -> readings a trace holds (one per FBK_RAW_STEP): the live
+# figures are drawn with every reading and extended keeping at most this many
+LIVE_POINTS = {
+    period: int(span.total_seconds() // planner.FBK_RAW_STEP)
+    for period, span in livetail.PERIODS.items()
+}
+
+
+def sampling(figure: str, live: bool = False) -> tuple:
+    """
+    The (method, points) downsampling of a figure, see DOWNSAMPLING. The live
+    views keep every reading, so trimming them to LIVE_POINTS keeps their span.
+    """
+    method, points = DOWNSAMPLING.get(figure) or ("lttb", None)
+    return (method, None) if live else (method, points)
+
+
+def downsample_trace(figure: str, x: pd.Series, y: pd.Series, live: bool = False) -> dict:
+    """
+    Downsamples one trace as configured for its figure, see sampling
+
+    Returns:
+        dict: the x and y arguments of the trace
+    """
+    method, points = sampling(figure, live)
+    x, y = downsample.downsample(x, y, points, method)
+    return dict(x=x, y=y)
+
+
+def zoom_window(relayout_data) -> tuple:
+    """
+    Returns the UTC window of the x-range zoomed to on a plot, or None when
+    the relayout is not an x zoom
+    """
+    if not relayout_data:
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        shown = [relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]]
+    elif "xaxis.range" in relayout_data:
+        shown = list(relayout_data["xaxis.range"])
+    else:
+        return None
+    return tuple(localtime.to_utc(bound) for bound in shown)
+
+
+@singleflight.coalesce
+def load_period(period: str) -> pd.DataFrame:
+    """
+    Assembles one of the dashboard periods from the shared tile cache: only
+    the tiles never seen and the one holding "now" hit the database
+    """
+    start, end = planner.period_range(period)
+    return tiles.fbk_tiles.load(
+        STATION_NODES, start, end, transform=utils.filter_fbk_data
+    )
+
+
+# the last hour and day come from the live tail
+live_tail = livetail.LiveTail(STATION_NODES)
+live_tail.start()
 
+# sensor table and latest params, for the tooltips and the history lines
+station_sensors = sensor_meta.SensorMeta(STATION_NODES)
 
-@cache.memoize(timeout=1800)  # cached 30 min
-def get_data_day() -> pd.DataFrame:
-    print("NOT CACHED DAY")
-    fbk_data = load_data_from_psql(querys.query_day)
-    return utils.filter_fbk_data(fbk_data)
 
+def on_packets(rows: list):
+    """
+    Insert notifications: drops the tiles the new packets fall in and, when
+    they belong to the dashboard stations, wakes the live tail and expires
+    the latest sensor params
+    """
+    for row in rows:
+        tiles.fbk_tiles.invalidate(row["node_id"], row["start"], row["end"])
+    if any(row["node_id"] in STATION_NODES for row in rows):
+        live_tail.poke()
+        station_sensors.expire_params()
 
-@cache.memoize(timeout=3600)  # cached 1 hour
-def get_data_week() -> pd.DataFrame:
-    print("NOT CACHED WEEK")
-    fbk_data = load_data_from_psql(querys.query_week_avg)
-    return utils.filter_fbk_data(fbk_data)
 
+notify.subscribe(notify.PACKET_CHANNEL, on_packets)
+notify.start()
 
-@cache.memoize(timeout=864000)  # cached 1 day
-def get_data_month() -> pd.DataFrame:
-    print("NOT CACHED MONTH")
-    fbk_data = load_data_from_psql(querys.query_month_avg)
-    return utils.filter_fbk_data(fbk_data)
 
+def live_period(period: str) -> pd.DataFrame:
+    """
+    Slices one of livetail.PERIODS from the live tail, or assembles it from
+    the tiles while the tail is not filled (database unreachable at start)
+    """
+    try:
+        return utils.filter_fbk_data(live_tail.period(period))
+    except TimeoutError:
+        return load_period(period)
 
-@cache.memoize(timeout=604800)  # cached 7 day
-def get_data_6months() -> pd.DataFrame:
-    print("NOT CACHED 6_MONTHS")
-    fbk_data = load_data_from_psql(querys.query_6moths_avg_node_1)
-    fbk_data_1 = load_data_from_psql(querys.query_6moths_avg_node_6)
-    fbk = pd.concat([fbk_data, fbk_data_1])
-    return utils.filter_fbk_data(fbk)
+
+# period -> seconds after which the refresher reloads it
+PERIOD_REFRESH = {
+    "last week": 900,
+    "last month": 1800,
+    "last 6 months": 3600,
+}
+for _period, _every in PERIOD_REFRESH.items():
+    refresher.register(
+        f"fbk {_period}", lambda period=_period: load_period(period), _every
+    )
+
+
+@singleflight.coalesce
+def load_window(node: int, start, end) -> pd.DataFrame:
+    """
+    Loads a zoomed window of one node from the tile cache
+    """
+    return utils.filter_fbk_data(tiles.fbk_tiles.window(node, start, end))
 
 
 def cache_fbk_data(selected_period: str) -> pd.DataFrame:
     start = datetime.now()
-    if selected_period in "last hour":
-        fbk_data = get_data_hours()
-    elif selected_period in "last day":
-        fbk_data = get_data_day()
-    elif selected_period in "last week":
-        fbk_data = get_data_week()
-    elif selected_period in "last month":
-        fbk_data = get_data_month()
-    elif selected_period in "last 6 months":
-        fbk_data = get_data_6months()
+    if selected_period in livetail.PERIODS:
+        fbk_data = live_period(selected_period)
+    else:
+        fbk_data = refresher.get(f"fbk {selected_period}")
     logging.info("Query time", datetime.now() - start)
     print(f"QUERY TIME {selected_period}: ", datetime.now() - start)
     return fbk_data
@@ -127,29 +208,23 @@ def make_tooltip_sensor(sensor: str):
     )
 
 
-def saturated(station):
-    df = get_data_hours()
-    d = {
-        "S1_ID": None,
-        "S2_ID": None,
-        "S3_ID": None,
-        "S4_ID": None,
-        "S5_ID": None,
-        "S6_ID": None,
-        "S7_ID": None,
-        "S8_ID": None,
-    }
-    for s in d.keys():
-        tmp = df.loc[
-            (df["sensor_description"] == s)
-            & (df["node_id"] == dict_stations[station])
-        ].reset_index()
-        if (tmp["signal_res"] == tmp["signal_res"][0]).all():
-            d[s] = True
-        else:
-            d[s] = False
-    #print(d)
-    return d
+# per sensor health flags of the last hour, recomputed when the live tail
+# gets new packets
+sensor_health = health.SensorHealth(live_tail)
+SENSORS = ["S" + str(s) + "_ID" for s in range(1, 9)]
+FLAG_LABELS = {
+    "saturated": "Saturated",
+    "flatline": "Flatline",
+    "dropout": "Dropout",
+    "out_of_range": "Out of range",
+}
+
+
+def sensor_flags(station) -> dict:
+    """
+    Returns sensor -> {flag: bool} (see health.FLAGS) for the station
+    """
+    return sensor_health.flags(dict_stations[station], SENSORS)
 
 
 LAST_CLICKED = None
@@ -292,6 +367,10 @@ header = html.Div(
         title,
         download_btn,
         download_it,
+        # live figures: polled every 5 s and extended with the readings after
+        # the last one drawn, see push_live_updates
+        dcc.Interval(id="live-interval", interval=5000),
+        dcc.Store(id="live-cursor"),
         sensors_wrapper,
         dropdown_wrapper,
         popovers_wrapper,
@@ -310,20 +389,9 @@ def create_download_file(n_clicks):
     return dcc.send_data_frame(get_fbk_data().to_csv, "fbk_raw_data.csv")"""
     print("CACHE DELETED")
     cache.clear()
+    tiles.fbk_tiles.clear()
 
 
-@callback(
-    Output("interval-component", "max_intervals"),
-    [Input("interval-component", "n_intervals")],
-    preprevent_initial_call=True,
-    background=True,
-    manager=background_callback_manager,
-)
-def background_cache(_):
-    print("BACKGROUND CACHING")
-    get_data_6months()
-    print("END BACKGROUD CACHING")
-
 @callback(
     [
         Output("card-S1", "className"),
@@ -339,11 +407,11 @@ def background_cache(_):
 )
 def update_color(station):
     ll = []
-    d_saturation = saturated(station)
+    d_flags = sensor_flags(station)
     for s in range(1, 9):
         ll.append(
             "card-sensors card-sensors-red"
-            if d_saturation["S" + str(s) + "_ID"]
+            if any(d_flags["S" + str(s) + "_ID"].values())
             else "card-sensors card-sensors-green"
         )
 
@@ -366,7 +434,6 @@ def update_color(station):
 def update_desc(station):
     appa1 = 1
     appa2 = 6
-    sensors = load_data_from_psql(querys.query_history_sensor)
     d = {
         "S1_ID": None,
         "S2_ID": None,
@@ -378,30 +445,29 @@ def update_desc(station):
         "S8_ID": None,
     }
 
-    d_saturation = saturated(station)
+    d_flags = sensor_flags(station)
     station = appa1 if (station.split(" - ")[-1] == "S. Chiara") else appa2
-    params = load_data_from_psql(querys.query_params(station))
-    sensors = sensors.loc[(sensors["node_id"] == station) & (sensors["active"] == True)]
-    for _, row in sensors.iterrows():
-        s_id = row["name"]
+    sensors = station_sensors.active(station)
+    # latest params of all the sensors, aligned once
+    params = station_sensors.params(station).reindex(sensors.index)
+    for s_id, row in sensors.iterrows():
         try:
             date = row["attrs"]["active since"]
         except:
             date = ""
 
-        d[row["name"]] = dict(
+        d[s_id] = dict(
             description=row["description"],
             active_since=date,
-            res=params.loc[params["sensor_description"] == s_id]["heater_res"].values[
-                0
-            ],
-            volt=params.loc[params["sensor_description"] == s_id]["volt"].values[0],
+            res=params.at[s_id, "heater_res"],
+            volt=params.at[s_id, "volt"],
         )
     # print(d)
     list_tooltips = []
     for s in range(1, 9):
         s = str(s)
         id = "S" + s + "_ID"
+        problems = [FLAG_LABELS[flag] for flag, on in d_flags[id].items() if on]
         body = dbc.PopoverBody(
             [
                 html.Div(
@@ -413,9 +479,9 @@ def update_desc(station):
                             f"Installed on: {d[id]['active_since']}", id="inst-S" + s
                         ),
                         html.P(
-                            "Saturated" if d_saturation[id] else "Good",
+                            ", ".join(problems) if problems else "Good",
                             id="status-S" + s,
-                            style={"color": "red" if d_saturation[id] else "green"},
+                            style={"color": "red" if problems else "green"},
                         ),
                     ],
                     className="text-muted px-4 mt-4",
@@ -428,37 +494,65 @@ def update_desc(station):
     return list_tooltips
 
 
-def check_line_history(
-    selected_station, history, res_state, het_state, volt_state, bosch_state
-):
+def history_lines(selected_station: str, start, end) -> list:
+    """
+    Returns the vertical lines (layout shapes) marking the sensor changes
+    ("active since") of the station between start and end
+    """
     station = 1 if (selected_station.split(" - ")[-1] == "S. Chiara") else 6
-    sensors = load_data_from_psql(querys.query_history_sensor)
-    sensors = sensors.loc[sensors["node_id"] == station]
-    sensors["attrs"] = sensors["attrs"].astype(str)
-    res_state = go.Figure(res_state)
-    sensors = sensors.groupby("attrs")
-    for tmp, group in sensors:
-        tmp = tmp.replace("'", '"')
-        d = json.loads(tmp)
-        try:
-            pos_x = pd.to_datetime(d["active since"]).tz_localize(None)
-            first = res_state["data"][0]["x"][0]
-            first = pd.to_datetime(first).tz_localize(None)
+    return [
+        dict(
+            type="line",
+            x0=pos_x,
+            x1=pos_x,
+            xref="x",
+            y0=0,
+            y1=1,
+            yref="y domain",
+            line=dict(width=3, dash="dash", color="green"),
+        )
+        for pos_x in station_sensors.changes(station, start, end)
+    ]
 
-            last = res_state["data"][0]["x"][-1]
-            last = pd.to_datetime(last).tz_localize(None)
 
-            if first < pos_x and pos_x < last:
-                if history:
-                    res_state.add_vline(
-                        x=pos_x, line_width=3, line_dash="dash", line_color="green"
-                    )
-                else:
-                    res_state.layout.shapes = None
-        except Exception as e:
-            pass
+@callback(
+    Output("resistance-plot", "figure", allow_duplicate=True),
+    Input("yaxis-type", "value"),
+    prevent_initial_call=True,
+)
+def update_yaxis_type(yaxis_type):
+    """
+    Switches the resistance axis between linear and log without resending
+    the figure
+    """
+    patched = Patch()
+    patched["layout"]["yaxis"]["type"] = "linear" if not yaxis_type else "log"
+    return patched
 
-    return res_state, het_state, volt_state, bosch_state
+
+@callback(
+    [
+        Output("resistance-plot", "figure", allow_duplicate=True),
+        Output("heater-plot", "figure", allow_duplicate=True),
+        Output("voltage-plot", "figure", allow_duplicate=True),
+    ],
+    Input("check_history", "value"),
+    State("selected-station", "value"),
+    State("live-cursor", "data"),
+    prevent_initial_call=True,
+)
+def update_history_lines(history, selected_station, cursor):
+    """
+    Adds (or removes) the sensor change lines on the sensor plots, without
+    resending the figures
+    """
+    if not cursor or cursor["start"] is None:
+        return [dash.no_update] * 3
+    patched = Patch()
+    patched["layout"]["shapes"] = (
+        history_lines(selected_station, cursor["start"], cursor["ts"]) if history else []
+    )
+    return [patched] * 3
 
 
 @callback(
@@ -467,20 +561,17 @@ def check_line_history(
         Output("heater-plot", "figure"),
         Output("voltage-plot", "figure"),
         Output("bosch-plot", "figure"),
+        Output("live-cursor", "data"),
     ],
     [
         Input("selected-period", "value"),
         Input("selected-station", "value"),
-        Input("yaxis-type", "value"),
         Input("btn_search_date", "n_clicks"),
-        Input("check_history", "value"),
         Input("resistance-plot", "relayoutData"),
     ],
     [
-        State("resistance-plot", "figure"),
-        State("heater-plot", "figure"),
-        State("voltage-plot", "figure"),
-        State("bosch-plot", "figure"),
+        State("yaxis-type", "value"),
+        State("check_history", "value"),
         State("my-date-picker-range", "start_date"),
         State("my-date-picker-range", "end_date"),
     ],
@@ -489,57 +580,32 @@ def check_line_history(
 def update_plots(
     selected_period,
     selected_station,
-    yaxis_type,
     btn_date,
-    history,
     res_relayout_data,
-    res_state,
-    het_state,
-    volt_state,
-    bosch_state,
+    yaxis_type,
+    history,
     start_date,
     end_date,
 ):
     global LAST_CLICKED
-    if het_state and volt_state and bosch_state and res_state and "resistance-plot" == callback_context.triggered_id:
-        try:
-            het_state["layout"]["xaxis"]["range"] = [
-                res_relayout_data["xaxis.range[0]"],
-                res_relayout_data["xaxis.range[1]"],
-            ]
-            het_state["layout"]["xaxis"]["autorange"] = False
-            volt_state["layout"]["xaxis"]["range"] = [
-                res_relayout_data["xaxis.range[0]"],
-                res_relayout_data["xaxis.range[1]"],
-            ]
-            volt_state["layout"]["xaxis"]["autorange"] = False
-            bosch_state["layout"]["xaxis"]["range"] = [
-                res_relayout_data["xaxis.range[0]"],
-                res_relayout_data["xaxis.range[1]"],
-            ]
-            bosch_state["layout"]["xaxis"]["autorange"] = False
-            return res_state, het_state, volt_state, bosch_state
-        except Exception as e:
-            het_state["layout"]["xaxis"]["autorange"] = True
-            volt_state["layout"]["xaxis"]["autorange"] = True
-            bosch_state["layout"]["xaxis"]["autorange"] = True
-            return res_state, het_state, volt_state, bosch_state
-
-    if "yaxis-type" == callback_context.triggered_id:
-        res_state["layout"]["yaxis"]["type"] = "linear" if not yaxis_type else "log"
-        return res_state, het_state, volt_state, bosch_state
-
-    elif "check_history" == callback_context.triggered_id:
-        return check_line_history(
-            selected_station, history, res_state, het_state, volt_state, bosch_state
-        )
-
-    if "btn_search_date" == callback_context.triggered_id or (
-        "selected-station" == callback_context.triggered_id
+    zoom = None
+    if "resistance-plot" == callback_context.triggered_id:
+        zoom = zoom_window(res_relayout_data)
+        if zoom is None and not (res_relayout_data or {}).get("xaxis.autorange"):
+            # not an x zoom (y zoom, drag mode...): nothing to reload
+            return [dash.no_update] * 5
+
+    if zoom is not None:
+        # only the visible window, at the resolution it needs
+        start = datetime.now()
+        fbk_data = load_window(dict_stations[selected_station], *zoom)
+        print(f"ZOOM QUERY TIME : ", datetime.now() - start)
+    elif "btn_search_date" == callback_context.triggered_id or (
+        callback_context.triggered_id in ["selected-station", "resistance-plot"]
         and LAST_CLICKED == "btn_search_date"
     ):
         start = datetime.now()
-        fbk_data = utils.query_custom(start_date, end_date)
+        fbk_data = utils.query_custom(start_date, end_date, nodes=STATION_NODES)
         print(f"QUERY CUSTOM TIME : ", datetime.now() - start)
         LAST_CLICKED = "btn_search_date"
     else:
@@ -549,10 +615,18 @@ def update_plots(
     dfFBK1 = fbk_data[
         fbk_data["node_id"] == dict_stations[selected_station]
     ].dropna(inplace=False)
+    # extended by push_live_updates until the next full redraw
+    live = (
+        zoom is None
+        and LAST_CLICKED == "selected-period"
+        and selected_period in livetail.PERIODS
+    )
 
     dfFBK1["Data"] = pd.to_datetime(dfFBK1.ts.dt.date)
 
     fbk_data_ResV = dfFBK1
+    # one pivot (ts x sensor) for the traces of the three sensor plots
+    wide = figures.pivot(fbk_data_ResV, "ts", "sensor_description", SENSOR_VALUES)
 
     # ---------------------------RESISTANCE PLOT---------------------------
 
@@ -567,20 +641,15 @@ def update_plots(
         "last month",
         "last 6 months",
     ]:
-        for SensingMaterial, group in fbk_data_ResV.groupby("sensor_description"):
-            resistance_plot.add_trace(
-                go.Scatter(
-                    x=fbk_data_ResV[
-                        fbk_data_ResV["sensor_description"] == SensingMaterial
-                    ]["ts"],
-                    y=fbk_data_ResV[
-                        fbk_data_ResV["sensor_description"] == SensingMaterial
-                    ]["signal_res"],
-                    name=SensingMaterial,
-                    line=dict(width=1.5),
-                    # line_shape='spline',
-                )
+        resistance_plot.add_traces(
+            figures.traces(
+                wide,
+                "signal_res",
+                sampling("resistance-plot", live),
+                line=dict(width=1.5),
+                # line_shape='spline',
             )
+        )
 
     resistance_plot.update_layout(
         # legend_title_text="Sensing Material",
@@ -620,19 +689,11 @@ def update_plots(
         "last month",
         "last 6 months",
     ]:
-        for SensingMaterial, group in fbk_data_ResV.groupby("sensor_description"):
-            heater_plot.add_trace(
-                go.Scatter(
-                    x=fbk_data_ResV[
-                        fbk_data_ResV["sensor_description"] == SensingMaterial
-                    ]["ts"],
-                    y=fbk_data_ResV[
-                        fbk_data_ResV["sensor_description"] == SensingMaterial
-                    ]["heater_res"],
-                    name=SensingMaterial,
-                    line=dict(width=1.5),
-                )
+        heater_plot.add_traces(
+            figures.traces(
+                wide, "heater_res", sampling("heater-plot", live), line=dict(width=1.5)
             )
+        )
 
     heater_plot.update_layout(
         legend_title_text="Sensing Material",
@@ -665,19 +726,11 @@ def update_plots(
         "last month",
         "last 6 months",
     ]:
-        for SensingMaterial, group in fbk_data_ResV.groupby("sensor_description"):
-            volt_plot.add_trace(
-                go.Scatter(
-                    x=fbk_data_ResV[
-                        fbk_data_ResV["sensor_description"] == SensingMaterial
-                    ]["ts"],
-                    y=fbk_data_ResV[
-                        fbk_data_ResV["sensor_description"] == SensingMaterial
-                    ]["volt"],
-                    name=SensingMaterial,
-                    line=dict(width=1.5),
-                )
+        volt_plot.add_traces(
+            figures.traces(
+                wide, "volt", sampling("voltage-plot", live), line=dict(width=1.5)
             )
+        )
 
     volt_plot.update_layout(
         legend_title_text="Sensing Material",
@@ -700,14 +753,12 @@ def update_plots(
 
     # ---------------------------BOSCH PLOT---------------------------
 
-    fbk_data_bosch = dfFBK1
-
-    fbk_data_bosch.sort_values(by="ts", inplace=True)
+    # t, rh and p belong to the packet: one row per timestamp is enough
+    fbk_data_bosch = dfFBK1.drop_duplicates("ts").sort_values(by="ts")
 
     # Temperature graph
     trace1 = go.Scatter(
-        x=fbk_data_bosch["ts"],
-        y=fbk_data_bosch["t"],
+        **downsample_trace("bosch-plot", fbk_data_bosch["ts"], fbk_data_bosch["t"], live),
         name="Temp",
         mode="lines",
         yaxis="y1",
@@ -717,8 +768,7 @@ def update_plots(
 
     # Humidity graph
     trace2 = go.Scatter(
-        x=fbk_data_bosch["ts"],
-        y=fbk_data_bosch["rh"],
+        **downsample_trace("bosch-plot", fbk_data_bosch["ts"], fbk_data_bosch["rh"], live),
         name="RH",
         mode="lines",
         yaxis="y1",
@@ -728,8 +778,7 @@ def update_plots(
 
     # Pressure graph
     trace3 = go.Scatter(
-        x=fbk_data_bosch["ts"],
-        y=fbk_data_bosch["p"],
+        **downsample_trace("bosch-plot", fbk_data_bosch["ts"], fbk_data_bosch["p"], live),
         name="Press",
         yaxis="y2",
         mode="lines",
@@ -768,7 +817,99 @@ def update_plots(
     bosch_plot.update_yaxes(fixedrange=True)
     bosch_plot.update_layout(modebar=dict(bgcolor="#ffffff"))
 
-    return [resistance_plot, heater_plot, volt_plot, bosch_plot]
+    # what push_live_updates needs to extend these figures
+    cursor = dict(
+        live=live,
+        period=selected_period,
+        node=dict_stations[selected_station],
+        start=dfFBK1["ts"].min().isoformat() if not dfFBK1.empty else None,
+        ts=dfFBK1["ts"].max().isoformat() if not dfFBK1.empty else None,
+        sensors=wide.columns,
+    )
+
+    plots = [resistance_plot, heater_plot, volt_plot, bosch_plot]
+    if zoom is not None:
+        # the browser already shows the zoomed range on the four plots (see
+        # assets/linked_axes.js): only the traces change
+        patches = []
+        for figure in plots:
+            patched = Patch()
+            patched["data"] = figure.to_plotly_json()["data"]
+            patches.append(patched)
+        return *patches, cursor
+    for figure in plots:
+        # a new view resets the zoom, the zoomed traces (same revision) do not
+        figure.update_layout(uirevision=datetime.now().isoformat())
+    if history and cursor["start"] is not None:
+        lines = history_lines(selected_station, cursor["start"], cursor["ts"])
+        for figure in [resistance_plot, heater_plot, volt_plot]:
+            figure.update_layout(shapes=lines)
+    return *plots, cursor
+
+
+@callback(
+    [
+        Output("resistance-plot", "extendData"),
+        Output("heater-plot", "extendData"),
+        Output("voltage-plot", "extendData"),
+        Output("bosch-plot", "extendData"),
+        Output("live-cursor", "data", allow_duplicate=True),
+    ],
+    Input("live-interval", "n_intervals"),
+    State("live-cursor", "data"),
+    prevent_initial_call=True,
+)
+def push_live_updates(n_intervals, cursor):
+    """
+    Appends to the live figures the readings later than the last one drawn
+    (the cursor ts, the same in every worker). Nothing is sent while the live
+    tail has none.
+    """
+    if not cursor or not cursor["live"]:
+        return [dash.no_update] * 5
+    drawn = pd.Timestamp(cursor["ts"]) if cursor["ts"] is not None else None
+    latest = live_tail.latest(cursor["node"])
+    if latest is None or (drawn is not None and latest <= drawn):
+        return [dash.no_update] * 5
+
+    fbk_data = live_period(cursor["period"])
+    dfFBK1 = fbk_data[fbk_data["node_id"] == cursor["node"]].dropna(inplace=False)
+    if drawn is not None:
+        dfFBK1 = dfFBK1[dfFBK1["ts"] > drawn]
+    if dfFBK1.empty:
+        return [dash.no_update] * 5
+
+    # drop the oldest readings as new ones come: the view keeps its span
+    max_points = LIVE_POINTS[cursor["period"]]
+    updates = []
+    wide = figures.pivot(dfFBK1, "ts", "sensor_description", SENSOR_VALUES)
+    for column in SENSOR_VALUES:
+        x, y, indices = [], [], []
+        for sensor, sensor_x, sensor_y in wide.series(column):
+            if sensor in cursor["sensors"]:
+                x.append(localtime.wall(sensor_x).astype(str).tolist())
+                y.append(sensor_y.tolist())
+                indices.append(cursor["sensors"].index(sensor))
+        updates.append(
+            [dict(x=x, y=y), indices, max_points] if indices else dash.no_update
+        )
+
+    # same order as the traces of the bosch plot: t, rh, p
+    fbk_data_bosch = dfFBK1.drop_duplicates("ts").sort_values(by="ts")
+    bosch_x = localtime.wall(fbk_data_bosch["ts"]).astype(str).tolist()
+    updates.append(
+        [
+            dict(
+                x=[bosch_x] * 3,
+                y=[fbk_data_bosch[column].tolist() for column in ["t", "rh", "p"]],
+            ),
+            [0, 1, 2],
+            max_points,
+        ]
+    )
+
+    cursor["ts"] = dfFBK1["ts"].max().isoformat()
+    return updates + [cursor]
 
 
 @callback(
@@ -995,11 +1136,6 @@ layout = html.Div(
                     ],
                     width=4,
                 ),
-                dcc.Interval(
-                    id="interval-component",
-                    interval=1000 * 604800,  # milliseconds | 7 days
-                    n_intervals=0,
-                ),
             ],
         ),
     ],
@@ -1,5 +1,5 @@
 from dash import html, dcc, Input, Output, callback, callback_context, State
-from .utils import utils, querys
+from .utils import utils, querys, planner, downsample, localtime, inference, notify, scoring
 from db_utils import load_data_from_psql
 import dash_bootstrap_components as dbc
 import plotly.graph_objs as go
@@ -7,91 +7,38 @@ import dash_daq as daq
 import pandas as pd
 import numpy as np
 import dash
-import joblib
-import tensorflow as tf
 from datetime import timedelta, datetime
 import pytz
-from .utils.kerasWrapper import KerasWrapper
-
-import __main__
-__main__.KerasWrapper = KerasWrapper
 
 dash.register_page(__name__)
 
-def get_data_day(start, end) -> pd.DataFrame:
+def get_data_day(node, start, end) -> pd.DataFrame:
     print("NOT CACHED DAY")
-    fbk_data=  load_data_from_psql(testnewdf(start, end))
+    fbk_data=  load_data_from_psql(testnewdf(start, end, node))
     #print(fbk_data)
     return (fbk_data)
 
 def testnewdf(start, end, node=1):
-    
-    return f"""WITH sensor_data AS (
-    SELECT
-        p.node_id,
-        s.name AS sensor_description,
-        p.sensor_ts AS ts,
-        pd.r1 AS heater_res,
-        pd.r2 AS signal_res,
-        pd.volt AS volt,
-        p.p,
-        p.t,
-        p.rh
-    FROM packet_data pd
-        LEFT JOIN packet p ON p.id = pd.packet_id
-        LEFT JOIN sensor s ON s.id = pd.sensor_id
-    where p.sensor_ts BETWEEN '{start}' AND '{end}' and p.node_id = {node}
+    return querys.query_fbk_wide(start, end, node)
+
+# predictions cached per (model files, node, day): a new model starts afresh;
+# the fallback while the scoring job has not stored them
+predictions = inference.InferenceService(
+    scoring.predict, get_data_day, model=scoring.model_name()
 )
-SELECT
-    ts,
-    MAX(p) AS p,
-    MAX(t) AS t,
-    MAX(rh) AS rh,
-    MAX(CASE WHEN sensor_description = 'S1_ID' THEN heater_res END) AS S1_R1,
-    MAX(CASE WHEN sensor_description = 'S1_ID' THEN signal_res END) AS S1_R2,
-    MAX(CASE WHEN sensor_description = 'S1_ID' THEN volt END) AS S1_Voltage,
-    MAX(CASE WHEN sensor_description = 'S2_ID' THEN heater_res END) AS S2_R1,
-    MAX(CASE WHEN sensor_description = 'S2_ID' THEN signal_res END) AS S2_R2,
-    MAX(CASE WHEN sensor_description = 'S2_ID' THEN volt END) AS S2_Voltage,
-    MAX(CASE WHEN sensor_description = 'S3_ID' THEN heater_res END) AS S3_R1,
-    MAX(CASE WHEN sensor_description = 'S3_ID' THEN signal_res END) AS S3_R2,
-    MAX(CASE WHEN sensor_description = 'S3_ID' THEN volt END) AS S3_Voltage,
-    MAX(CASE WHEN sensor_description = 'S4_ID' THEN heater_res END) AS S4_R1,
-    MAX(CASE WHEN sensor_description = 'S4_ID' THEN signal_res END) AS S4_R2,
-    MAX(CASE WHEN sensor_description = 'S4_ID' THEN volt END) AS S4_Voltage,
-    MAX(CASE WHEN sensor_description = 'S5_ID' THEN heater_res END) AS S5_R1,
-    MAX(CASE WHEN sensor_description = 'S5_ID' THEN signal_res END) AS S5_R2,
-    MAX(CASE WHEN sensor_description = 'S5_ID' THEN volt END) AS S5_Voltage,
-    MAX(CASE WHEN sensor_description = 'S6_ID' THEN heater_res END) AS S6_R1,
-    MAX(CASE WHEN sensor_description = 'S6_ID' THEN signal_res END) AS S6_R2,
-    MAX(CASE WHEN sensor_description = 'S6_ID' THEN volt END) AS S6_Voltage,
-    MAX(CASE WHEN sensor_description = 'S7_ID' THEN heater_res END) AS S7_R1,
-    MAX(CASE WHEN sensor_description = 'S7_ID' THEN signal_res END) AS S7_R2,
-    MAX(CASE WHEN sensor_description = 'S7_ID' THEN volt END) AS S7_Voltage,
-    MAX(CASE WHEN sensor_description = 'S8_ID' THEN heater_res END) AS S8_R1,
-    MAX(CASE WHEN sensor_description = 'S8_ID' THEN signal_res END) AS S8_R2,
-    MAX(CASE WHEN sensor_description = 'S8_ID' THEN volt END) AS S8_Voltage
-FROM sensor_data
-GROUP BY ts
-ORDER BY ts;"""
-import os
-
-os.environ["CUDA_VISIBLE_DEVICES"] = ""  
-
-
-pipeline2 = joblib.load('data/pipeline.pkl')
-
-# Load the Keras model separately
-
-model = tf.keras.models.load_model('data/model.h5')
-#predictions = inference_func(input_data)['output'].numpy()
-
-# Assign the loaded model to the pipeline
-pipeline2.steps[-1][1].model = model
-
-print(pipeline2.steps[-1][1].model)
-
-pipeline2.steps[-1][1].model.compile(loss='mean_absolute_error', optimizer='adam', metrics=['mean_squared_error'])
+
+
+def on_packets(rows: list):
+    """
+    Insert notifications: drops the cached predictions the new packets
+    fall in (the scoring process gets them too)
+    """
+    for row in rows:
+        predictions.invalidate(row["node_id"], row["start"], row["end"])
+
+
+notify.subscribe(notify.PACKET_CHANNEL, on_packets)
+notify.start()
 
 df = utils.get_prediction_data()
 df["Time"] = pd.to_datetime(df["Time"])
@@ -272,6 +219,47 @@ def period_to_interval(period):
 
 LAST_CLICKED = None
 
+
+def hourly_predictions(start, end) -> pd.DataFrame:
+    """
+    Hourly means of the current model's outputs between start and end: the
+    hours the scoring job has finished are read from the table, the rest
+    (table missing, not backfilled yet, or the hours the job has not reached)
+    comes from the inference service
+
+    Returns:
+        pd.DataFrame: ts (local time) + planner.PREDICTION_COLUMNS
+    """
+    model = scoring.model_name()
+    # both paths serve the current model: the cached tiles of a former one
+    # are no longer read
+    predictions.model = model
+    start, end = planner._as_utc(start), planner._as_utc(end)
+    frames = []
+    if scoring.available():
+        until = scoring.scored_until(scoring.FITTED_NODE, model, end)
+        # the hour of the latest scored reading may still miss readings
+        split = until.floor("h") if until is not None else start
+        if split > start:
+            stored = planner.load_predictions(
+                start, split - timedelta(microseconds=1), model,
+                nodes=[scoring.FITTED_NODE], bucket_seconds=3600,
+            )
+            frames.append(stored.drop(columns="node_id"))
+            start = split
+    if start < end or not frames:
+        computed = predictions.predictions(scoring.FITTED_NODE, start, end)
+        frames.append(computed.set_index("ts").resample("1h").mean().reset_index())
+    df = pd.concat(frames, ignore_index=True)
+    df["ts"] = localtime.to_local(df["ts"])
+    return df
+
+# trace -> (method, points), None keeps every point
+DOWNSAMPLING = {
+    "FBK": ("lttb", 1500),
+    "APPA": ("lttb", 1500),
+}
+
 @callback(
     Output("comparison-graph", "figure"),
     State("my-date-picker-range", "start_date"),
@@ -323,36 +311,26 @@ def update_comparison_graph(
         LAST_CLICKED = "else"
         start, end = period_to_interval(selected_period)
     
-    raw_data = get_data_day(start, end)    
-    raw_data['ts'] = raw_data['ts'].apply(lambda x: x + timedelta(hours=2) if (x.month >= 4 and x.month <= 10) else x + timedelta(hours=1))
-    test = raw_data.drop('ts',axis=1)
-    
-    y_pred=pipeline2.predict(test.values)
-    
-    #np.savetxt('data.csv', y_pred, delimiter=',')
-
-    appa_data = load_data_from_psql(querys.q_custom_appa(start=start, end=end))
+    # the same for every pollutant: a toggle only reads them again
+    new_df = hourly_predictions(start, end)
+
+    appa_data = planner.load_appa(
+        start, end, stations=["Parco S. Chiara"], bucket_seconds=3600
+    ).rename(columns={"ts": "min", "valore": "avg"})
+    # same local time as the predictions, for the join below
+    appa_data["min"] = localtime.to_local(appa_data["min"])
     
     fig = go.Figure()
     
-    new_df = pd.DataFrame()
-    new_df['ts'] = raw_data['ts'].copy()
-
-    new_df['O3'] = y_pred[:,3].tolist()
-    new_df['PM10'] = y_pred[:,0].tolist()
-    new_df['NO2'] = y_pred[:,1].tolist()
-    new_df['SO2'] = y_pred[:,2].tolist()
-    
-    
-    new_df= new_df.set_index('ts').resample('1H').mean().reset_index()
     data = appa_data[(appa_data['stazione'] == 'Parco S. Chiara') & (appa_data['inquinante'] == selected_pollutant) & (['avg'])] 
     df = new_df.merge(data[['min','avg']], left_on='ts', right_on='min', how="left").drop('min',axis=1)
     
     #df.to_csv('export_dataframe.csv', header=True, )
     
+    x, y = downsample.downsample(df["ts"], df[selected_pollutant], *DOWNSAMPLING["FBK"])
     fig.add_trace(
         go.Scatter(
-            x=df["ts"], y=df[selected_pollutant], mode="lines+markers", name="FBK", line=dict(color="red")
+            x=x, y=y, mode="lines+markers", name="FBK", line=dict(color="red")
         )
     )
 
@@ -360,10 +338,11 @@ def update_comparison_graph(
 
     if toggle_comparison:
         # appa data graph
+        x, y = downsample.downsample(df["ts"], df["avg"], *DOWNSAMPLING["APPA"])
         fig.add_trace(
             go.Scatter(
-                x=df["ts"],
-                y=df['avg'],
+                x=x,
+                y=y,
                 mode="lines+markers",
                 name="APPA",
                 line=dict(color="blue")
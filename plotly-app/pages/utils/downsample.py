@@ -0,0 +1,164 @@
+"""
+Server-side downsampling of time series before they are turned into traces.
+
+Both methods split the series into equal-count buckets and keep one (LTTB)
+or two (min/max envelope) points per bucket, always keeping the first and
+last point. They are vectorised over the buckets: no Python loop runs per
+point or per bucket.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _as_float(values) -> np.ndarray:
+    if isinstance(values, (pd.Series, pd.Index)) and pd.api.types.is_datetime64_any_dtype(values):
+        return pd.DatetimeIndex(values).asi8.astype(np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _buckets(n: int, n_buckets: int) -> tuple:
+    """
+    Splits the points 1..n-2 into n_buckets contiguous buckets
+
+    Returns:
+        tuple: (starts, counts) of the buckets, relative to point 1
+    """
+    edges = np.linspace(0, n - 2, n_buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    keep = counts > 0
+    return starts[keep], counts[keep]
+
+
+def _first_arg(mask: np.ndarray, bucket_of: np.ndarray) -> np.ndarray:
+    # position of the first True of every bucket
+    candidates = np.flatnonzero(mask)
+    owners = bucket_of[candidates]
+    first = np.r_[True, owners[1:] != owners[:-1]]
+    return candidates[first]
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets. Every bucket keeps the point forming the
+    largest triangle with the mean of the previous bucket and the mean of the
+    next one (the sequential variant anchors on the previously selected
+    point instead; using the mean lets all buckets be solved at once and
+    gives visually identical results)
+
+    Args:
+        x: the x values (numbers or datetimes)
+        y: the y values, without NaNs
+        n_out (int): number of points to keep
+
+    Returns:
+        np.ndarray: sorted indices of the points to keep
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xs, ys = _as_float(x), _as_float(y)
+    starts, counts = _buckets(n, n_out - 2)
+    bucket_of = np.repeat(np.arange(len(starts)), counts)
+    middle = slice(1, n - 1)
+
+    mean_x = np.add.reduceat(xs[middle], starts) / counts
+    mean_y = np.add.reduceat(ys[middle], starts) / counts
+    # anchors: previous bucket mean (first point for the first bucket) and
+    # next bucket mean (last point for the last bucket)
+    prev_x = np.r_[xs[0], mean_x[:-1]][bucket_of]
+    prev_y = np.r_[ys[0], mean_y[:-1]][bucket_of]
+    next_x = np.r_[mean_x[1:], xs[-1]][bucket_of]
+    next_y = np.r_[mean_y[1:], ys[-1]][bucket_of]
+
+    area = np.abs(
+        (prev_x - next_x) * (ys[middle] - prev_y)
+        - (prev_x - xs[middle]) * (next_y - prev_y)
+    )
+    best = np.maximum.reduceat(area, starts)[bucket_of]
+    picked = _first_arg(area == best, bucket_of) + 1
+    return np.r_[0, picked, n - 1]
+
+
+def minmax_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Min/max envelope: every bucket keeps its lowest and highest point, so
+    spikes are never lost (n_out / 2 buckets)
+
+    Args:
+        x: the x values (unused, the buckets are equal-count)
+        y: the y values, without NaNs
+        n_out (int): number of points to keep
+
+    Returns:
+        np.ndarray: sorted indices of the points to keep
+    """
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    ys = _as_float(y)
+    starts, counts = _buckets(n, (n_out - 2) // 2)
+    bucket_of = np.repeat(np.arange(len(starts)), counts)
+    middle = ys[1 : n - 1]
+
+    lows = _first_arg(middle == np.minimum.reduceat(middle, starts)[bucket_of], bucket_of)
+    highs = _first_arg(middle == np.maximum.reduceat(middle, starts)[bucket_of], bucket_of)
+    picked = np.unique(np.r_[lows, highs]) + 1
+    return np.r_[0, picked, n - 1]
+
+
+METHODS = {
+    "lttb": lttb_indices,
+    "minmax": minmax_indices,
+}
+
+
+def downsample(x, y, n_out: int, method: str = "lttb") -> tuple:
+    """
+    Downsamples a series to at most n_out points
+
+    Args:
+        x (pd.Series | np.ndarray): the x values
+        y (pd.Series | np.ndarray): the y values
+        n_out (int): maximum number of points, None to keep them all
+        method (str, optional): "lttb" or "minmax". Defaults to "lttb".
+
+    Returns:
+        tuple: the kept (x, y), of the same types as the inputs
+    """
+    if n_out is None or len(y) <= n_out:
+        return x, y
+    valid = ~pd.isna(np.asarray(y))
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    idx = METHODS[method](x, y, n_out)
+    take = lambda values: values.iloc[idx] if hasattr(values, "iloc") else values[idx]
+    return take(x), take(y)
+
+
+def downsample_frame(df: pd.DataFrame, x: str, y: str, n_out: int, method: str = "lttb", by=None) -> pd.DataFrame:
+    """
+    Keeps only the rows of df selected by downsampling column y over column
+    x, separately for every group of `by` (one group per trace)
+
+    Args:
+        df (pd.DataFrame): the data, sorted by x
+        x (str): the x column
+        y (str): the y column
+        n_out (int): maximum number of rows per group, None to keep them all
+        method (str, optional): "lttb" or "minmax". Defaults to "lttb".
+        by (optional): the column(s) identifying the traces. Defaults to None.
+
+    Returns:
+        pd.DataFrame: the kept rows
+    """
+    if n_out is None:
+        return df
+    groups = df.groupby(by, sort=False) if by is not None else [(None, df)]
+    kept = []
+    for _, group in groups:
+        if len(group) > n_out:
+            group = group[group[y].notna()]
+            group = group.iloc[METHODS[method](group[x], group[y], n_out)]
+        kept.append(group)
+    return pd.concat(kept) if kept else df
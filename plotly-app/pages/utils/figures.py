@@ -0,0 +1,91 @@
+"""
+Trace construction from a single pivot of the data.
+
+The readings are pivoted once into a wide (index x column) NumPy array per
+value, e.g. ts x sensor for the resistance, heater and voltage plots, and
+every trace of every figure is a column of those arrays: no per-trace
+filtering of the long frame.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from . import downsample, localtime
+
+
+class Wide:
+    """
+    Values pivoted to (index x column) arrays, NaN where a column has no
+    reading at an index
+
+    Args:
+        index (pd.Index): the sorted index values (e.g. the timestamps)
+        columns (list): the sorted column values (e.g. the sensors)
+        arrays (dict): value name -> 2D float array
+    """
+
+    def __init__(self, index: pd.Index, columns: list, arrays: dict):
+        self.index = index
+        self.columns = columns
+        self.arrays = arrays
+
+    def series(self, value: str):
+        """
+        Yields (column, x, y) for every column having readings of `value`,
+        without the indices where it has none
+        """
+        array = self.arrays[value]
+        present = ~np.isnan(array)
+        for position, column in enumerate(self.columns):
+            keep = present[:, position]
+            if keep.all():
+                yield column, self.index, array[:, position]
+            elif keep.any():
+                yield column, self.index[keep], array[keep, position]
+
+
+def pivot(df: pd.DataFrame, index: str, columns: str, values: list) -> Wide:
+    """
+    Pivots the long frame df once for all the given values. A (index,
+    column) pair appearing more than once keeps its last row.
+
+    Args:
+        df (pd.DataFrame): the long data
+        index (str): the column giving the rows (the x of the traces)
+        columns (str): the column giving the columns (one trace each)
+        values (list): the value columns to pivot
+
+    Returns:
+        Wide: the pivoted values
+    """
+    rows, index_values = pd.factorize(df[index], sort=True)
+    cols, column_values = pd.factorize(df[columns], sort=True)
+    shape = (len(index_values), len(column_values))
+    arrays = {}
+    for value in values:
+        array = np.full(shape, np.nan)
+        array[rows, cols] = df[value].to_numpy(dtype=float, na_value=np.nan)
+        arrays[value] = array
+    return Wide(pd.Index(index_values), list(column_values), arrays)
+
+
+def traces(wide: Wide, value: str, downsampling: tuple = None, **style) -> list:
+    """
+    Builds one scatter trace per column of `value`
+
+    Args:
+        wide (Wide): the pivoted values
+        value (str): the value to plot
+        downsampling (tuple, optional): (method, points) per trace, see
+            downsample.downsample. Defaults to None (all the points).
+        **style: further go.Scatter arguments, the same for every trace
+
+    Returns:
+        list: the go.Scatter traces, in column order
+    """
+    method, points = downsampling or ("lttb", None)
+    built = []
+    for column, x, y in wide.series(value):
+        x, y = downsample.downsample(x, y, points, method)
+        built.append(go.Scatter(x=localtime.wall(x), y=y, name=column, **style))
+    return built
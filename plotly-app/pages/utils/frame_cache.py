@@ -0,0 +1,302 @@
+"""
+Columnar binary serialisation of the DataFrames kept in the flask_caching
+filesystem cache.
+
+A cached frame is written as a JSON header followed by raw, 64-byte aligned
+NumPy blocks:
+
+- float columns of the same dtype share one 2D block (one row per column);
+- integer, bool and datetime columns (timezone kept in the header) get a
+  block each, nullable ones an extra mask block;
+- string and categorical columns are stored as categorical codes with the
+  categories in the header; string columns are cast back to their dtype on
+  read (a copy), so a hit returns the dtypes of a miss;
+- Decimal (numeric) columns are stored as float64.
+
+On read the cache file is memory-mapped (copy-on-write) and the columns are
+views of the mapping: a hit costs no parsing and no copy (except for
+timezone-aware timestamps, which pandas can only localize into a new array,
+and string columns),
+and the pages are shared through the OS page cache by every gunicorn worker
+reading the same file. Anything that is not a DataFrame (or a tuple/list of them) is pickled,
+and files written by the default pickle serializer are still readable.
+
+Enable it with `"CACHE_TYPE": "pages.utils.frame_cache.FrameFileSystemCache"`.
+"""
+import io
+import json
+import mmap
+import pickle
+import struct
+
+import numpy as np
+import pandas as pd
+from cachelib.serializers import FileSystemSerializer
+from flask_caching.backends.filesystemcache import FileSystemCache
+
+MAGIC = b"NPFRAME1"
+PICKLED = b"NPPICKLE"
+ALIGN = 64
+
+
+class Unsupported(Exception):
+    """
+    The value cannot be stored column by column (it is pickled instead)
+    """
+
+
+def _pad(position: int) -> int:
+    return -position % ALIGN
+
+
+# inferred types of object columns stored as float64
+NUMERIC_OBJECTS = {"decimal", "integer", "floating", "mixed-integer-float", "empty"}
+
+
+def _encode_frame(df: pd.DataFrame, blocks: list) -> dict:
+    """
+    Describes one frame in the header and appends its arrays to blocks
+    """
+    if not all(isinstance(name, (str, int)) for name in df.columns) or not df.columns.is_unique:
+        raise Unsupported("column names must be unique str or int")
+
+    index = df.index
+    if isinstance(index, pd.RangeIndex):
+        index_header = {
+            "kind": "range",
+            "start": index.start,
+            "step": index.step,
+            "name": index.name,
+        }
+    else:
+        names = [f"__index_{i}__" for i in range(index.nlevels)]
+        index_header = {"kind": "columns", "columns": names, "names": list(index.names)}
+        df = df.reset_index(names=names)
+
+    def add_block(array: np.ndarray) -> int:
+        blocks.append(np.ascontiguousarray(array))
+        return len(blocks) - 1
+
+    columns = []
+    floats = {}
+    for position, name in enumerate(df.columns):
+        values = df.iloc[:, position]
+        dtype = values.dtype
+        column = {"name": name}
+
+        strings = pd.api.types.is_string_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype)
+        if pd.api.types.is_object_dtype(dtype):
+            inferred = pd.api.types.infer_dtype(values, skipna=True)
+            strings = inferred == "string"
+            if not strings and inferred not in NUMERIC_OBJECTS:
+                raise Unsupported(f"column {name!r} holds {inferred} objects")
+            if not strings:
+                values = values.astype(np.float64)
+                dtype = values.dtype
+
+        if isinstance(dtype, pd.CategoricalDtype) or strings:
+            categorical = values.astype("category")
+            categories = categorical.cat.categories
+            if not all(isinstance(c, (str, int, float)) for c in categories):
+                raise Unsupported(f"column {name!r} has unsupported categories")
+            column.update(
+                kind="category",
+                block=add_block(categorical.cat.codes.to_numpy()),
+                categories=categories.tolist(),
+                ordered=bool(categorical.cat.ordered),
+                # the string dtype to restore, None for a categorical column
+                dtype=str(dtype) if strings else None,
+            )
+        elif isinstance(dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(dtype):
+            if isinstance(dtype, pd.DatetimeTZDtype):
+                values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+            array = values.to_numpy()
+            column.update(
+                kind="datetime",
+                unit=np.datetime_data(array.dtype)[0],
+                tz=str(dtype.tz) if isinstance(dtype, pd.DatetimeTZDtype) else None,
+                block=add_block(array.view(np.int64)),
+            )
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in "iufb":
+            # nullable Int64 / Float64 / boolean
+            numpy_dtype = np.dtype(dtype.numpy_dtype)
+            column.update(
+                kind="masked",
+                dtype=str(dtype),
+                block=add_block(values.to_numpy(dtype=numpy_dtype, na_value=0)),
+                mask=add_block(values.isna().to_numpy()),
+            )
+        elif dtype.kind == "f":
+            floats.setdefault(dtype.str, []).append((column, values.to_numpy()))
+        elif dtype.kind in "iub":
+            column.update(kind="array", block=add_block(values.to_numpy()))
+        else:
+            raise Unsupported(f"column {name!r} has dtype {dtype}")
+        columns.append(column)
+
+    for dtype, members in floats.items():
+        block = add_block(np.vstack([array for _, array in members]))
+        for row, (column, _) in enumerate(members):
+            column.update(kind="float", block=block, row=row)
+
+    return {"rows": len(df), "columns": columns, "index": index_header}
+
+
+def encode(value) -> tuple:
+    """
+    Returns the (header, blocks) describing a frame or a tuple/list of frames
+
+    Raises:
+        Unsupported: if the value cannot be stored column by column
+    """
+    if isinstance(value, pd.DataFrame):
+        container, frames = None, [value]
+    elif isinstance(value, (tuple, list)) and value and all(isinstance(v, pd.DataFrame) for v in value):
+        container, frames = type(value).__name__, list(value)
+    else:
+        raise Unsupported(type(value).__name__)
+    blocks = []
+    header = {"container": container, "frames": [_encode_frame(df, blocks) for df in frames]}
+    return header, blocks
+
+
+def write(value, f, start: int = 0):
+    """
+    Writes a value to a binary stream. `start` is the position of the stream
+    in its file, so that the blocks end up aligned in the mapping.
+    """
+    try:
+        header, blocks = encode(value)
+    except Unsupported:
+        f.write(PICKLED)
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        return
+
+    # block offsets are relative to the (aligned) end of the header
+    offset = 0
+    header["blocks"] = []
+    for block in blocks:
+        header["blocks"].append({"dtype": block.dtype.str, "shape": list(block.shape), "offset": offset})
+        offset += block.nbytes + _pad(block.nbytes)
+    encoded = json.dumps(header).encode()
+
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", len(encoded)))
+    f.write(encoded)
+    f.write(b"\0" * _pad(start + len(MAGIC) + 8 + len(encoded)))
+    for block in blocks:
+        f.write(block.tobytes())
+        f.write(b"\0" * _pad(block.nbytes))
+
+
+def _array(buffer, data: int, meta: dict) -> np.ndarray:
+    dtype = np.dtype(meta["dtype"])
+    count = int(np.prod(meta["shape"]))
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data + meta["offset"])
+    return array.reshape(meta["shape"])
+
+
+def _decode_frame(header: dict, arrays: list) -> pd.DataFrame:
+    parts = {}
+    for column in header["columns"]:
+        name, kind = column["name"], column["kind"]
+        array = arrays[column["block"]]
+        if kind == "float":
+            values = array[column["row"]]
+        elif kind == "array":
+            values = array
+        elif kind == "datetime":
+            values = array.view(f"datetime64[{column['unit']}]")
+            values = pd.DatetimeIndex(values, copy=False)
+            if column["tz"]:
+                values = values.tz_localize("UTC").tz_convert(column["tz"])
+            values = values.array
+        elif kind == "masked":
+            array_type = pd.api.types.pandas_dtype(column["dtype"]).construct_array_type()
+            values = array_type(array, arrays[column["mask"]])
+        else:
+            values = pd.Categorical.from_codes(
+                array,
+                categories=pd.Index(column["categories"]),
+                ordered=column["ordered"],
+            )
+        parts[name] = pd.Series(values, copy=False)
+        if kind == "category" and column.get("dtype"):
+            parts[name] = parts[name].astype(column["dtype"])
+
+    names = [column["name"] for column in header["columns"]]
+    df = pd.DataFrame(parts, columns=names, copy=False) if parts else pd.DataFrame(index=range(header["rows"]))
+
+    index = header["index"]
+    if index["kind"] == "range":
+        df.index = pd.RangeIndex(
+            index["start"],
+            index["start"] + index["step"] * header["rows"],
+            index["step"],
+            name=index["name"],
+        )
+    else:
+        df = df.set_index(index["columns"])
+        df.index.names = index["names"]
+    return df
+
+
+def read(buffer, base: int = 0):
+    """
+    Reads a value written by `write` from a buffer (bytes or a mapping),
+    without copying the column data. `base` is the position of the magic.
+    """
+    (length,) = struct.unpack_from("<Q", buffer, base + len(MAGIC))
+    start = base + len(MAGIC) + 8
+    header = json.loads(bytes(buffer[start : start + length]))
+    data = start + length + _pad(start + length)
+    arrays = [_array(buffer, data, meta) for meta in header["blocks"]]
+    frames = [_decode_frame(frame, arrays) for frame in header["frames"]]
+    if header["container"] is None:
+        return frames[0]
+    return tuple(frames) if header["container"] == "tuple" else frames
+
+
+def dumps(value) -> bytes:
+    f = io.BytesIO()
+    write(value, f)
+    return f.getvalue()
+
+
+def loads(data: bytes):
+    if data[: len(MAGIC)] == MAGIC:
+        return read(data)
+    if data[: len(PICKLED)] == PICKLED:
+        return pickle.loads(data[len(PICKLED) :])
+    return pickle.loads(data)
+
+
+class FrameSerializer(FileSystemSerializer):
+    """
+    FileSystemCache serializer writing frames with `write` and memory-mapping
+    them on load
+    """
+
+    def dump(self, value, f, protocol: int = pickle.HIGHEST_PROTOCOL):
+        write(value, f, start=f.tell())
+
+    def load(self, f):
+        base = f.tell()
+        magic = f.read(len(MAGIC))
+        if magic == MAGIC:
+            # private copy-on-write mapping: writes never reach the file
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            return read(mapping, base)
+        if magic == PICKLED:
+            return pickle.load(f)
+        # written by the default pickle serializer
+        f.seek(base)
+        return super().load(f)
+
+
+class FrameFileSystemCache(FileSystemCache):
+    """
+    flask_caching filesystem backend storing frames with FrameSerializer
+    """
+
+    serializer = FrameSerializer()
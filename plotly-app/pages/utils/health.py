@@ -0,0 +1,145 @@
+"""
+Sensor health flags computed from the live tail.
+
+The readings of the window are sorted once by node, sensor and time; the run
+lengths, gaps and range checks are computed on the whole frame and a single
+groupby aggregates them per (node, sensor). The aggregate is recomputed only
+when the live tail appended readings (its version changed); the flags that
+depend on the current time are derived from it on read.
+
+Flags:
+    saturated: the signal resistance did not change over the whole window
+    flatline: it stayed unchanged for FLATLINE_AFTER or more (not the whole
+        window)
+    dropout: no reading for DROPOUT_AFTER or more, within the window or up
+        to now (also set for sensors without readings)
+    out_of_range: a reading outside RANGES
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from . import planner
+
+FLAGS = ["saturated", "flatline", "dropout", "out_of_range"]
+# livetail period the flags are computed on
+WINDOW = "last hour"
+FLATLINE_AFTER = timedelta(minutes=15)
+DROPOUT_AFTER = timedelta(seconds=5 * planner.FBK_RAW_STEP)
+# plausible physical range of each value, bounds excluded
+RANGES = {
+    "signal_res": (0, 1e9),
+    "heater_res": (0, 1e4),
+    "volt": (0, 5),
+}
+COLUMNS = ["node_id", "sensor_description", "ts", *RANGES]
+
+
+def assess(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates the readings per (node, sensor)
+
+    Args:
+        df (pd.DataFrame): readings with node_id, sensor_description, ts and
+            the RANGES values
+
+    Returns:
+        pd.DataFrame: per (node_id, sensor_description): readings, last
+        (ts), saturated, longest_flat, max_gap and out_of_range
+    """
+    df = df.sort_values(["node_id", "sensor_description", "ts"], ignore_index=True)
+    node = df["node_id"].to_numpy()
+    sensor = df["sensor_description"].to_numpy()
+    res = df["signal_res"].to_numpy(dtype=float)
+    ts = df["ts"]
+
+    first = np.ones(len(df), dtype=bool)
+    first[1:] = (node[1:] != node[:-1]) | (sensor[1:] != sensor[:-1])
+    changed = first.copy()
+    changed[1:] |= res[1:] != res[:-1]
+
+    gap = ts.diff().mask(first, pd.Timedelta(0))
+    # time the value has been unchanged, at every reading
+    flat = ts - ts.where(changed).ffill()
+    out = np.zeros(len(df), dtype=bool)
+    for column, (low, high) in RANGES.items():
+        values = df[column].to_numpy(dtype=float)
+        out |= ~((values > low) & (values < high))
+
+    stats = (
+        df.assign(gap=gap, flat=flat, out=out)
+        .groupby(["node_id", "sensor_description"])
+        .agg(
+            readings=("ts", "size"),
+            last=("ts", "max"),
+            res_min=("signal_res", "min"),
+            res_max=("signal_res", "max"),
+            longest_flat=("flat", "max"),
+            max_gap=("gap", "max"),
+            out_of_range=("out", "any"),
+        )
+    )
+    stats["saturated"] = stats["res_min"] == stats["res_max"]
+    return stats.drop(columns=["res_min", "res_max"])
+
+
+class SensorHealth:
+    """
+    Health flags of the sensors of a live tail, recomputed only when the
+    tail got new readings
+
+    Args:
+        tail (livetail.LiveTail): the live tail
+        window (str, optional): the livetail period to assess. Defaults to
+            WINDOW.
+    """
+
+    def __init__(self, tail, window: str = WINDOW):
+        self.tail = tail
+        self.window = window
+        self._stats = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def stats(self) -> pd.DataFrame:
+        """
+        Returns the assess() aggregate of the window, empty while the tail
+        is not filled
+        """
+        with self._lock:
+            if self._stats is None or self._version != self.tail.version:
+                version = self.tail.version
+                try:
+                    self._stats = assess(self.tail.period(self.window))
+                except TimeoutError:
+                    # no readings yet: every sensor shows as dropped out
+                    return assess(pd.DataFrame(columns=COLUMNS))
+                self._version = version
+            return self._stats
+
+    def flags(self, node: int, sensors: list) -> dict:
+        """
+        Returns sensor -> {flag: bool} for the given sensors of a node
+        """
+        stats = self.stats()
+        now = pd.Timestamp.now(tz="UTC")
+        flags = {}
+        for sensor in sensors:
+            try:
+                row = stats.loc[(node, sensor)]
+            except KeyError:
+                flags[sensor] = dict.fromkeys(FLAGS, False) | {"dropout": True}
+                continue
+            flags[sensor] = dict(
+                saturated=bool(row["saturated"]),
+                flatline=bool(
+                    not row["saturated"] and row["longest_flat"] >= FLATLINE_AFTER
+                ),
+                dropout=bool(
+                    row["max_gap"] >= DROPOUT_AFTER or now - row["last"] >= DROPOUT_AFTER
+                ),
+                out_of_range=bool(row["out_of_range"]),
+            )
+        return flags
@@ -0,0 +1,231 @@
+"""
+Cached, batched model inference for the Fitted FBK page.
+
+The model outputs do not depend on the pollutant shown, so they are computed
+once per reading and cached per (model, node, tile), a tile being TILE_SECONDS
+of readings aligned on the epoch. A request reads its tiles from the cache;
+the readings of the tiles not cached yet are loaded with one query per run of
+consecutive tiles and predicted in BATCH_SIZE rows batches (the last one
+padded, so the model always sees the same input shape). The tile holding
+"now" is kept too: the next request predicts only the readings after its
+last cached one.
+
+The tiles live in a diskcache directory shared by every worker and kept
+across restarts.
+"""
+import os
+import threading
+
+import diskcache
+import numpy as np
+import pandas as pd
+
+from . import planner
+
+# model outputs, in the order of the prediction columns
+OUTPUTS = planner.PREDICTION_COLUMNS
+# seconds of readings per cached tile
+TILE_SECONDS = 86400
+# rows per model call
+BATCH_SIZE = 1024
+# shared prediction store, least recently used tiles evicted past the size limit
+INFERENCE_DIR = os.getenv("INFERENCE_DIR", "./cache_inference")
+INFERENCE_SIZE_LIMIT = int(os.getenv("INFERENCE_SIZE_LIMIT", 2**29))
+
+EPOCH = pd.Timestamp(0, tz="UTC")
+TILE = pd.Timedelta(seconds=TILE_SECONDS)
+
+# per worker, like db_utils.pool_stats
+_stats = {"hits": 0, "misses": 0, "fetches": 0, "rows": 0, "batches": 0, "invalidations": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats() -> dict:
+    """
+    Tile hits/misses and predicted rows of this worker
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else None
+    return stats
+
+
+def tile_range(start, end) -> range:
+    """
+    Indices of the tiles covering [start, end) (the tile of start if empty)
+    """
+    first = int((planner._as_utc(start) - EPOCH) // TILE)
+    # ceil, so an end on a tile boundary does not add the next tile
+    stop = -int((EPOCH - planner._as_utc(end)) // TILE)
+    return range(first, max(stop, first + 1))
+
+
+def tile_bounds(tile: int) -> tuple:
+    return EPOCH + tile * TILE, EPOCH + (tile + 1) * TILE
+
+
+def predict_batches(predict, features: np.ndarray, batch_size: int = BATCH_SIZE) -> np.ndarray:
+    """
+    Calls predict on fixed-size batches of rows, padding the last one by
+    repeating its last row
+
+    Args:
+        predict (callable): rows -> 2D array of len(OUTPUTS) columns
+        features (np.ndarray): the input rows
+        batch_size (int, optional): rows per call. Defaults to BATCH_SIZE.
+
+    Returns:
+        np.ndarray: the predictions, one row per input row
+    """
+    results = []
+    for first in range(0, len(features), batch_size):
+        batch = features[first:first + batch_size]
+        rows = len(batch)
+        if rows < batch_size:
+            batch = np.pad(batch, ((0, batch_size - rows), (0, 0)), mode="edge")
+        results.append(np.asarray(predict(batch))[:rows])
+        _count("batches")
+    if not results:
+        return np.empty((0, len(OUTPUTS)))
+    return np.concatenate(results)
+
+
+class InferenceService:
+    """
+    Predictions of a model for the readings of the nodes, cached per tile.
+    A cached tile is {"frame": ts + OUTPUTS, "complete": bool}, complete once
+    it was loaded after its end.
+
+    Args:
+        predict (callable): feature rows -> 2D array of len(OUTPUTS) columns
+        load (callable): (node, start, end) -> the readings between start and
+            end, a ts column followed by the model features
+        model (str): names the model in the cache keys, change it when the
+            model changes
+        directory (str, optional): the diskcache directory. Defaults to INFERENCE_DIR.
+        size_limit (int, optional): bytes stored before evicting. Defaults to INFERENCE_SIZE_LIMIT.
+        batch_size (int, optional): rows per model call. Defaults to BATCH_SIZE.
+    """
+
+    def __init__(self, predict, load, model: str, directory: str = INFERENCE_DIR,
+                 size_limit: int = INFERENCE_SIZE_LIMIT, batch_size: int = BATCH_SIZE):
+        self._predict = predict
+        self._load = load
+        self.model = model
+        self.batch_size = batch_size
+        self._tiles = diskcache.Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+
+    def _key(self, node: int, tile: int) -> tuple:
+        return (self.model, node, tile)
+
+    def _score(self, readings: pd.DataFrame) -> pd.DataFrame:
+        """
+        Predicts the readings, returning ts + OUTPUTS
+        """
+        features = readings.drop(columns="ts").to_numpy(dtype=float)
+        predictions = predict_batches(self._predict, features, self.batch_size)
+        _count("rows", len(features))
+        scored = pd.DataFrame(predictions, columns=OUTPUTS)
+        scored.insert(0, "ts", readings["ts"].reset_index(drop=True))
+        return scored
+
+    def _fetch(self, node: int, tiles: list, after=None):
+        """
+        Loads and predicts a contiguous run of tiles with one query, only
+        the readings later than `after` (the last one cached) if given
+        """
+        _count("fetches")
+        start, _ = tile_bounds(tiles[0])
+        _, end = tile_bounds(tiles[-1])
+        readings = self._load(node, after or start, end - pd.Timedelta(microseconds=1))
+        readings["ts"] = pd.to_datetime(readings["ts"], utc=True)
+        if after is not None:
+            readings = readings[readings["ts"] > after]
+        scored = self._score(readings.sort_values("ts", kind="stable"))
+        tile_of = (scored["ts"] - EPOCH) // TILE
+        now = pd.Timestamp.now(tz="UTC")
+        for tile in tiles:
+            frame = scored[tile_of == tile].reset_index(drop=True)
+            if after is not None:
+                cached = self._tiles.get(self._key(node, tile))
+                if cached is not None:
+                    frame = pd.concat([cached["frame"], frame], ignore_index=True)
+            complete = bool(tile_bounds(tile)[1] <= now)
+            self._tiles.set(self._key(node, tile), {"frame": frame, "complete": complete})
+
+    def predictions(self, node: int, start, end) -> pd.DataFrame:
+        """
+        Returns the predictions for the readings of a node with
+        start <= ts < end, predicting only the readings not cached yet
+
+        Args:
+            node (int): the node id
+            start, end: the window (naive values are UTC)
+
+        Returns:
+            pd.DataFrame: ts (UTC) + OUTPUTS, sorted by ts
+        """
+        tiles = list(tile_range(start, end))
+        entries = {tile: self._tiles.get(self._key(node, tile)) for tile in tiles}
+        missing = [tile for tile, entry in entries.items() if entry is None]
+        _count("misses", len(missing))
+        _count("hits", len(tiles) - len(missing))
+
+        # one query per run of consecutive missing tiles
+        run = []
+        for tile in missing:
+            if run and tile != run[-1] + 1:
+                self._fetch(node, run)
+                run = []
+            run.append(tile)
+        if run:
+            self._fetch(node, run)
+        # the growing tiles: only the readings after the cached ones
+        for tile, entry in entries.items():
+            if entry is not None and not entry["complete"]:
+                frame = entry["frame"]
+                after = frame["ts"].iloc[-1] if len(frame) else None
+                self._fetch(node, [tile], after)
+
+        frames = []
+        for tile in tiles:
+            entry = self._tiles.get(self._key(node, tile))
+            if entry is None:
+                # evicted meanwhile: predict it again
+                self._fetch(node, [tile])
+                entry = self._tiles.get(self._key(node, tile))
+            frames.append(entry["frame"])
+        df = pd.concat(frames, ignore_index=True)
+        start, end = planner._as_utc(start), planner._as_utc(end)
+        return df[(df["ts"] >= start) & (df["ts"] < end)].reset_index(drop=True)
+
+    def invalidate(self, node: int, start, end):
+        """
+        Drops the tiles overlapping [start, end] after readings were inserted
+        there; a growing tile is kept when they all follow its last cached
+        reading (the next request predicts them)
+        """
+        start = planner._as_utc(start)
+        # the reading at end belongs to the tile starting there
+        end = planner._as_utc(end) + pd.Timedelta(microseconds=1)
+        for tile in tile_range(start, end):
+            entry = self._tiles.get(self._key(node, tile))
+            if entry is None:
+                continue
+            frame = entry["frame"]
+            if entry["complete"] or (len(frame) and frame["ts"].iloc[-1] >= start):
+                self._tiles.delete(self._key(node, tile))
+        _count("invalidations")
+
+    def clear(self):
+        self._tiles.clear()
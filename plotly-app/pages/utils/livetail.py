@@ -0,0 +1,281 @@
+"""
+Live tail of the most recent FBK packets.
+
+Every worker keeps, per node, a columnar ring buffer of the readings of the
+last WINDOW. A poller thread re-reads the readings from LOOKBACK before the
+latest one seen, appends those not in the buffer yet (by packet and sensor)
+and evicts the readings that fell out of the window, so the
+"last hour" and "last day" views are sliced from memory instead of being
+queried again. Re-reading an overlap rather than the ids above the last one
+seen keeps the packets whose ids committed out of order, and the readings
+whose packet_data rows landed after the poll. The insert notifications (see
+notify) wake the poller as soon as packets arrive; POLL_EVERY is only the
+fallback.
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from db_utils import load_data_from_psql, statement
+from . import planner
+
+# readings older than this are evicted
+WINDOW = timedelta(days=1, hours=1)
+# readings re-read before the latest one seen, for the late commits
+LOOKBACK = timedelta(minutes=15)
+# seconds between two polls when no notification wakes the poller earlier
+POLL_EVERY = 60
+# seconds a reader waits for the first fill before giving up
+READY_TIMEOUT = 60
+
+# views served from the buffer
+PERIODS = {
+    "last hour": timedelta(hours=1),
+    "last day": timedelta(days=1),
+}
+
+COLUMNS = ["packet_id", "sensor_id", "node_id", "sensor_description", "ts"] + planner.FBK_COLUMNS
+
+_tail = statement(
+    "livetail_since",
+    """
+select
+    p.id as packet_id,
+    pd.sensor_id,
+    p.node_id,
+    s.name as sensor_description,
+    p.sensor_ts as ts,
+    pd.r1 as heater_res,
+    pd.r2 as signal_res,
+    pd.volt as volt,
+    p.p,
+    p.t,
+    p.rh
+from packet p
+    join packet_data pd on pd.packet_id = p.id
+    left join sensor s on s.id = pd.sensor_id
+where p.sensor_ts >= $1
+    and p.node_id = any($2)
+order by p.sensor_ts, p.id;""",
+    ("timestamptz", "integer[]"),
+)
+
+
+class RingBuffer:
+    """
+    Columnar buffer of one node's readings, in packet order. Rows are
+    appended at the end and evicted from the start; the arrays are compacted
+    (or grown) only when the end reaches their capacity.
+
+    Args:
+        capacity (int, optional): initial number of rows. Defaults to 16384.
+    """
+
+    def __init__(self, capacity: int = 16384):
+        self.capacity = capacity
+        self._columns = None
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def _reserve(self, n: int):
+        if self._end + n <= self.capacity:
+            return
+        size = len(self)
+        capacity = max(self.capacity, 2 * (size + n))
+        for name, array in self._columns.items():
+            kept = array[self._start : self._end]
+            if capacity != self.capacity:
+                array = np.empty(capacity, dtype=array.dtype)
+                self._columns[name] = array
+            array[:size] = kept
+        self.capacity = capacity
+        self._start, self._end = 0, size
+
+    def append(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        if self._columns is None:
+            self._columns = {
+                name: np.empty(self.capacity, dtype=df[name].to_numpy().dtype)
+                for name in df.columns
+            }
+        self._reserve(len(df))
+        for name, array in self._columns.items():
+            array[self._end : self._end + len(df)] = df[name].to_numpy()
+        self._end += len(df)
+
+    def evict(self, before: np.datetime64):
+        """
+        Drops the leading rows older than `before`
+        """
+        if not len(self):
+            return
+        older = self._columns["ts"][self._start : self._end] < before
+        self._start += len(older) if older.all() else int(np.argmin(older))
+
+    def latest(self):
+        """
+        The latest reading time, None if empty
+        """
+        if not len(self):
+            return None
+        return self._columns["ts"][self._start : self._end].max()
+
+    def keys(self, since: np.datetime64) -> pd.MultiIndex:
+        """
+        The (packet_id, sensor_id) of the rows at or after `since`
+        """
+        if self._columns is None:
+            return pd.MultiIndex.from_arrays([[], []], names=["packet_id", "sensor_id"])
+        keep = self._columns["ts"][self._start : self._end] >= since
+        return pd.MultiIndex.from_arrays(
+            [self._columns[name][self._start : self._end][keep] for name in ["packet_id", "sensor_id"]],
+            names=["packet_id", "sensor_id"],
+        )
+
+    def frame(self, since: np.datetime64) -> pd.DataFrame:
+        """
+        Copies out the rows at or after `since`
+        """
+        if self._columns is None:
+            return pd.DataFrame(columns=COLUMNS)
+        ts = self._columns["ts"][self._start : self._end]
+        keep = ts >= since
+        return pd.DataFrame(
+            {
+                name: array[self._start : self._end][keep]
+                for name, array in self._columns.items()
+            }
+        )
+
+
+class LiveTail:
+    """
+    Ring buffers of the given nodes, kept up to date by a poller thread
+
+    Args:
+        nodes (list): the node ids to follow
+    """
+
+    def __init__(self, nodes: list):
+        self.nodes = list(nodes)
+        # latest reading time seen (UTC)
+        self.last_ts = None
+        self.polled_at = None
+        # bumped whenever readings are appended
+        self.version = 0
+        self._buffers = {node: RingBuffer() for node in self.nodes}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._started_in = None
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        df["ts"] = pd.to_datetime(df["ts"], utc=True).dt.tz_localize(None).astype("datetime64[ns]")
+        for column in ["packet_id", "sensor_id"]:
+            df[column] = df[column].astype("int64")
+        for column in planner.FBK_COLUMNS:
+            df[column] = df[column].astype(float)
+        df["sensor_description"] = df["sensor_description"].astype(object)
+        return df
+
+    def poll(self) -> int:
+        """
+        Appends the readings from LOOKBACK before the latest one seen that are
+        not in the buffers yet, and evicts the readings older than WINDOW
+
+        Returns:
+            int: the number of readings appended
+        """
+        now = pd.Timestamp.now(tz="UTC")
+        since = now - WINDOW
+        if self.last_ts is not None:
+            since = max(since, self.last_ts - LOOKBACK)
+        df = load_data_from_psql(_tail(since, self.nodes))
+        appended = 0
+        with self._lock:
+            if not df.empty:
+                df = self._typed(df)
+                overlap = since.tz_localize(None).to_datetime64()
+                for node, rows in df.groupby("node_id"):
+                    buffer = self._buffers[node]
+                    keys = pd.MultiIndex.from_frame(rows[["packet_id", "sensor_id"]])
+                    rows = rows[~keys.isin(buffer.keys(overlap))]
+                    buffer.append(rows[COLUMNS])
+                    appended += len(rows)
+                latest = pd.Timestamp(df["ts"].max(), tz="UTC")
+                self.last_ts = latest if self.last_ts is None else max(self.last_ts, latest)
+                if appended:
+                    self.version += 1
+            cutoff = (now - WINDOW).tz_localize(None).to_datetime64()
+            for buffer in self._buffers.values():
+                buffer.evict(cutoff)
+            self.polled_at = time.time()
+        self._ready.set()
+        return appended
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"LIVETAIL POLL FAILED: {e}")
+            self._wake.wait(POLL_EVERY)
+            self._wake.clear()
+
+    def poke(self):
+        """
+        Wakes the poller: new packets were inserted
+        """
+        self._wake.set()
+
+    def start(self):
+        """
+        Starts the poller thread of this process (again after a fork)
+        """
+        with self._lock:
+            if self._started_in == os.getpid():
+                return
+            if self._started_in is not None:
+                # forked: the buffers were copied, the thread was not
+                self._ready.clear()
+            threading.Thread(target=self._run, name="livetail", daemon=True).start()
+            self._started_in = os.getpid()
+
+    def ready(self, timeout: float = READY_TIMEOUT) -> bool:
+        self.start()
+        return self._ready.wait(timeout)
+
+    def latest(self, node: int):
+        """
+        Time (UTC) of the latest reading of a node in the buffer, None if
+        there is none
+        """
+        with self._lock:
+            latest = self._buffers[node].latest()
+        return None if latest is None else pd.Timestamp(latest, tz="UTC")
+
+    def period(self, period: str, nodes=None) -> pd.DataFrame:
+        """
+        Returns the readings of one of PERIODS for the given nodes, with the
+        planner.load_fbk columns and UTC timestamps
+
+        Raises:
+            TimeoutError: if the buffers could not be filled
+        """
+        if not self.ready():
+            raise TimeoutError("live tail not filled yet")
+        since = (pd.Timestamp.now(tz="UTC") - PERIODS[period]).tz_localize(None).to_datetime64()
+        with self._lock:
+            frames = [self._buffers[node].frame(since) for node in (nodes or self.nodes)]
+        df = pd.concat(frames, ignore_index=True).drop(columns=["packet_id", "sensor_id"])
+        df["ts"] = pd.to_datetime(df["ts"]).dt.tz_localize("UTC")
+        # late readings are appended after later ones
+        return df.sort_values("ts", kind="stable", ignore_index=True)
@@ -0,0 +1,56 @@
+"""
+Conversion between the stored UTC timestamps and the displayed local time.
+
+Every timestamp column is converted once, vectorised, to DISPLAY_TZ with its
+real DST boundaries; naive values are taken as UTC. Plotly has no time
+zones, so the traces get the local wall time (see wall) and the ranges read
+back from a plot are wall times to be localised again (see to_utc).
+"""
+import pandas as pd
+
+DISPLAY_TZ = "Europe/Rome"
+
+
+def to_local(values) -> pd.Series:
+    """
+    Converts timestamps to DISPLAY_TZ
+
+    Args:
+        values (pd.Series | array-like): UTC timestamps, naive or tz-aware,
+            or strings
+
+    Returns:
+        pd.Series: datetime64[ns, DISPLAY_TZ] values
+    """
+    values = pd.to_datetime(pd.Series(values), utc=True)
+    return values.dt.tz_convert(DISPLAY_TZ).dt.as_unit("ns")
+
+
+def wall(values):
+    """
+    Drops the time zone of local timestamps keeping their wall time, as
+    plotly shows them
+
+    Args:
+        values (pd.Series | pd.DatetimeIndex): the timestamps
+
+    Returns:
+        the same type, naive
+    """
+    if isinstance(values, pd.Series):
+        return values.dt.tz_localize(None) if values.dt.tz is not None else values
+    if isinstance(values, pd.DatetimeIndex) and values.tz is not None:
+        return values.tz_localize(None)
+    return values
+
+
+def to_utc(value) -> pd.Timestamp:
+    """
+    Returns the UTC instant of a displayed (wall time) timestamp. A wall time
+    repeated when DST ends is taken in summer time, one skipped when it
+    starts is moved forward.
+    """
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.tz_localize(DISPLAY_TZ, ambiguous=True, nonexistent="shift_forward").tz_convert("UTC")
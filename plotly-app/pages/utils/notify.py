@@ -0,0 +1,162 @@
+"""
+Push notifications of new packets and APPA readings.
+
+Statement-level insert triggers on `packet` and `appa_data` send one
+NOTIFY per insert, with the ids and time ranges touched per node (or
+station and pollutant). A listener thread per worker LISTENs on both
+channels and hands the payloads to the handlers the pages subscribed, which
+invalidate exactly the affected cache entries and wake the live tail.
+Without the triggers nothing is notified and the caches fall back to their
+timers.
+
+Install the triggers once with:
+
+    cd plotly-app && python -m pages.utils.notify
+"""
+import json
+import os
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions as pg_extensions
+
+from db_utils import DB_CONFIG, get_connection
+
+PACKET_CHANNEL = "packet_inserted"
+APPA_CHANNEL = "appa_inserted"
+# seconds between two checks of the connection while idle
+LISTEN_TIMEOUT = 30
+# seconds before reconnecting after the connection dropped
+RECONNECT_AFTER = 5
+
+_ddl = f"""
+create or replace function notify_packet_inserted() returns trigger as $$
+begin
+    perform pg_notify('{PACKET_CHANNEL}', coalesce((
+        select json_agg(t)::text from (
+            select node_id, max(id) as max_id, min(sensor_ts) as start, max(sensor_ts) as end
+            from inserted
+            group by node_id
+        ) t
+    ), '[]'));
+    return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists packet_inserted_notify on packet;
+create trigger packet_inserted_notify
+    after insert on packet
+    referencing new table as inserted
+    for each statement execute procedure notify_packet_inserted();
+
+create or replace function notify_appa_inserted() returns trigger as $$
+begin
+    perform pg_notify('{APPA_CHANNEL}', coalesce((
+        select json_agg(t)::text from (
+            select stazione, inquinante, min(ts) as start, max(ts) as end
+            from inserted
+            group by stazione, inquinante
+        ) t
+    ), '[]'));
+    return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists appa_inserted_notify on appa_data;
+create trigger appa_inserted_notify
+    after insert on appa_data
+    referencing new table as inserted
+    for each statement execute procedure notify_appa_inserted();
+"""
+
+_handlers = {PACKET_CHANNEL: [], APPA_CHANNEL: []}
+_started_in = None
+_start_lock = threading.Lock()
+# per worker, like db_utils.pool_stats
+_stats = {"notifications": 0, "reconnects": 0}
+
+
+def create_triggers():
+    """
+    Creates (or replaces) the notify triggers
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute(_ddl)
+
+
+def subscribe(channel: str, handler):
+    """
+    Calls handler(rows) for every notification on the channel, rows being
+    the list of per node (or per station and pollutant) dicts of the payload
+    """
+    _handlers[channel].append(handler)
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+def _dispatch(notify):
+    _stats["notifications"] += 1
+    try:
+        rows = json.loads(notify.payload)
+    except ValueError:
+        print(f"NOTIFY {notify.channel}: bad payload {notify.payload!r}")
+        return
+    for handler in _handlers.get(notify.channel, []):
+        try:
+            handler(rows)
+        except Exception as e:
+            print(f"NOTIFY {notify.channel} HANDLER FAILED: {e}")
+
+
+def _listen():
+    # LISTEN needs its own long-lived connection, outside the pool
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        conn.set_isolation_level(pg_extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as curs:
+            for channel in _handlers:
+                curs.execute(f"LISTEN {channel};")
+        while True:
+            if select.select([conn], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                # idle: make sure the connection is still there
+                with conn.cursor() as curs:
+                    curs.execute("select 1;")
+                continue
+            conn.poll()
+            while conn.notifies:
+                _dispatch(conn.notifies.pop(0))
+    finally:
+        conn.close()
+
+
+def _run():
+    while True:
+        try:
+            _listen()
+        except psycopg2.Error as e:
+            print(f"NOTIFY LISTENER DISCONNECTED: {e}")
+        _stats["reconnects"] += 1
+        time.sleep(RECONNECT_AFTER)
+
+
+def start():
+    """
+    Starts the listener thread of this process (again after a fork)
+    """
+    global _started_in
+    with _start_lock:
+        if _started_in == os.getpid():
+            return
+        threading.Thread(target=_run, name="notify", daemon=True).start()
+        _started_in = os.getpid()
+
+
+if __name__ == "__main__":
+    create_triggers()
+    print("notify triggers created")
@@ -0,0 +1,341 @@
+"""
+Resolution-aware query planner shared by the FBK and APPA pages.
+
+Given a time range, the nodes/sensors (or stations/pollutants) shown and
+how many points a trace should have at most, it derives the bucket size,
+picks the coarsest source that is still finer than the bucket (raw data or
+one of the rollups) and re-buckets it in SQL, so the size of the result
+stays flat however wide the range is.
+"""
+import math
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from db_utils import load_data_from_psql, statement
+from . import rollups
+
+# points per trace when the caller does not ask for a number
+DEFAULT_POINTS = 1500
+# buckets shorter than the native spacing of the raw readings return them
+# unaggregated; longer ones are rounded to a multiple of it
+FBK_RAW_STEP = 60
+APPA_RAW_STEP = 3600
+# a rollup up to this many times coarser than the ideal bucket is preferred
+# to aggregating raw data (it costs at most a third of the points)
+ROLLUP_SLACK = 1.5
+
+PERIODS = {
+    "last hour": timedelta(hours=1),
+    "last day": timedelta(days=1),
+    "last week": timedelta(days=7),
+    "last month": timedelta(days=30),
+    "last 6 months": timedelta(days=180),
+    "last year": timedelta(days=365),
+    "all data": timedelta(days=365 * 30),
+}
+
+QueryPlan = namedtuple("QueryPlan", ["source", "bucket_seconds", "query"])
+
+FBK_COLUMNS = ["heater_res", "signal_res", "volt", "p", "t", "rh"]
+# model outputs, as stored by scoring
+PREDICTION_COLUMNS = ["PM10", "NO2", "SO2", "O3"]
+
+_fbk_filters = """
+    and ($3::integer[] is null or p.node_id = any($3))
+    and ($4::text[] is null or s.name = any($4))"""
+
+_fbk_raw = statement(
+    "plan_fbk_raw",
+    f"""
+select
+    p.node_id,
+    s.name as sensor_description,
+    p.sensor_ts as ts,
+    pd.r1 as heater_res,
+    pd.r2 as signal_res,
+    pd.volt as volt,
+    p.p,
+    p.t,
+    p.rh
+from packet_data pd
+    left join packet p on p.id = pd.packet_id
+    left join sensor s on s.id = pd.sensor_id
+where p.sensor_ts BETWEEN $1 AND $2{_fbk_filters}
+order by p.sensor_ts;""",
+    ("timestamptz", "timestamptz", "integer[]", "text[]"),
+)
+
+_fbk_raw_bucketed = statement(
+    "plan_fbk_raw_bucketed",
+    f"""
+select
+    p.node_id,
+    s.name as sensor_description,
+    {rollups.bucket_sql("p.sensor_ts", "$5")} as ts,
+    avg(pd.r1) as heater_res,
+    avg(pd.r2) as signal_res,
+    avg(pd.volt) as volt,
+    avg(p.p) as p,
+    avg(p.t) as t,
+    avg(p.rh) as rh
+from packet_data pd
+    left join packet p on p.id = pd.packet_id
+    left join sensor s on s.id = pd.sensor_id
+where p.sensor_ts BETWEEN $1 AND $2{_fbk_filters}
+group by 1, 2, 3
+order by 3;""",
+    ("timestamptz", "timestamptz", "integer[]", "text[]", "double precision"),
+)
+
+
+def _weighted(column: str) -> str:
+    # rollup rows are averages of n readings: weight them when re-bucketing
+    return (
+        f"sum(r.{column} * r.n) / nullif(sum(r.n) filter (where r.{column} is not null), 0)"
+        f" as {column}"
+    )
+
+
+_fbk_rollup = {
+    name: statement(
+        f"plan_fbk_{name}",
+        f"""
+select
+    r.node_id,
+    s.name as sensor_description,
+    {rollups.bucket_sql("r.ts", "$5")} as ts,
+    {(',' + chr(10) + '    ').join(_weighted(c) for c in FBK_COLUMNS)}
+from packet_rollup_{name} r
+    left join sensor s on s.id = r.sensor_id
+where r.ts BETWEEN $1 AND $2
+    and ($3::integer[] is null or r.node_id = any($3))
+    and ($4::text[] is null or s.name = any($4))
+group by 1, 2, 3
+order by 3;""",
+        ("timestamptz", "timestamptz", "integer[]", "text[]", "double precision"),
+    )
+    for name in rollups.FBK_RESOLUTIONS
+}
+
+_appa_filters = """
+    and ($3::text[] is null or stazione = any($3))
+    and ($4::text[] is null or inquinante = any($4))"""
+
+_appa_raw = statement(
+    "plan_appa_raw",
+    f"""
+select
+    stazione,
+    inquinante,
+    ts,
+    valore
+from appa_data
+where ts BETWEEN $1 AND $2{_appa_filters}
+order by ts;""",
+    ("timestamptz", "timestamptz", "text[]", "text[]"),
+)
+
+_appa_raw_bucketed = statement(
+    "plan_appa_raw_bucketed",
+    f"""
+select
+    stazione,
+    inquinante,
+    {rollups.bucket_sql("ts", "$5")} as ts,
+    avg(valore) as valore
+from appa_data
+where ts BETWEEN $1 AND $2{_appa_filters}
+group by 1, 2, 3
+order by 3;""",
+    ("timestamptz", "timestamptz", "text[]", "text[]", "double precision"),
+)
+
+_appa_rollup = {
+    name: statement(
+        f"plan_appa_{name}",
+        f"""
+select
+    r.stazione,
+    r.inquinante,
+    {rollups.bucket_sql("r.ts", "$5")} as ts,
+    {_weighted("valore")}
+from appa_rollup_{name} r
+where r.ts BETWEEN $1 AND $2
+    and ($3::text[] is null or r.stazione = any($3))
+    and ($4::text[] is null or r.inquinante = any($4))
+group by 1, 2, 3
+order by 3;""",
+        ("timestamptz", "timestamptz", "text[]", "text[]", "double precision"),
+    )
+    for name in rollups.APPA_RESOLUTIONS
+}
+
+_prediction_raw = statement(
+    "plan_prediction_raw",
+    f"""
+select
+    node_id,
+    ts,
+    {(',' + chr(10) + '    ').join(f'{c.lower()} as "{c}"' for c in PREDICTION_COLUMNS)}
+from prediction
+where ts BETWEEN $1 AND $2
+    and ($3::integer[] is null or node_id = any($3))
+    and model = $4
+order by ts;""",
+    ("timestamptz", "timestamptz", "integer[]", "text"),
+)
+
+_prediction_bucketed = statement(
+    "plan_prediction_bucketed",
+    f"""
+select
+    node_id,
+    {rollups.bucket_sql("ts", "$5")} as ts,
+    {(',' + chr(10) + '    ').join(f'avg({c.lower()}) as "{c}"' for c in PREDICTION_COLUMNS)}
+from prediction
+where ts BETWEEN $1 AND $2
+    and ($3::integer[] is null or node_id = any($3))
+    and model = $4
+group by 1, 2
+order by 2;""",
+    ("timestamptz", "timestamptz", "integer[]", "text", "double precision"),
+)
+
+
+def _as_utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts
+
+
+def bucket_size(start, end, points: int = DEFAULT_POINTS) -> int:
+    """
+    Returns the bucket length (seconds) giving at most `points` buckets
+    between start and end
+    """
+    seconds = (_as_utc(end) - _as_utc(start)).total_seconds()
+    return max(int(math.ceil(seconds / max(points, 1))), 1)
+
+
+def _pick(bucket: int, resolutions: dict, raw_step: int) -> tuple:
+    """
+    Coarsest rollup not (much) coarser than the bucket, with the bucket
+    rounded up to a multiple of it so rollup rows never straddle two buckets
+    """
+    source = None
+    if rollups.available():
+        for name, seconds in sorted(resolutions.items(), key=lambda item: item[1]):
+            if seconds <= bucket * ROLLUP_SLACK:
+                source = name
+    if source is None:
+        source, step = "raw", raw_step
+        if bucket < raw_step:
+            return source, 0
+    else:
+        step = resolutions[source]
+    return source, int(max(math.ceil(bucket / step), 1) * step)
+
+
+def plan_fbk(start, end, nodes=None, sensors=None, points: int = DEFAULT_POINTS, bucket_seconds=None) -> QueryPlan:
+    """
+    Plans an FBK query
+
+    Args:
+        start, end: the time range
+        nodes (list, optional): node ids to load. Defaults to all.
+        sensors (list, optional): sensor names to load. Defaults to all.
+        points (int, optional): maximum points per trace
+        bucket_seconds (int, optional): forces the bucket size instead, 0 for
+            the raw readings
+
+    Returns:
+        QueryPlan: the source, the bucket size and the query to run
+    """
+    bucket = bucket_size(start, end, points) if bucket_seconds is None else bucket_seconds
+    source, bucket = _pick(bucket, rollups.FBK_RESOLUTIONS, FBK_RAW_STEP)
+    nodes = list(nodes) if nodes is not None else None
+    sensors = list(sensors) if sensors is not None else None
+    if source == "raw" and not bucket:
+        query = _fbk_raw(start, end, nodes, sensors)
+    elif source == "raw":
+        query = _fbk_raw_bucketed(start, end, nodes, sensors, bucket)
+    else:
+        query = _fbk_rollup[source](start, end, nodes, sensors, bucket)
+    return QueryPlan(source, bucket, query)
+
+
+def plan_appa(start, end, stations=None, pollutants=None, points: int = DEFAULT_POINTS, bucket_seconds=None) -> QueryPlan:
+    """
+    Plans an APPA query, see plan_fbk
+    """
+    bucket = bucket_size(start, end, points) if bucket_seconds is None else bucket_seconds
+    source, bucket = _pick(bucket, rollups.APPA_RESOLUTIONS, APPA_RAW_STEP)
+    stations = list(stations) if stations is not None else None
+    pollutants = list(pollutants) if pollutants is not None else None
+    if source == "raw" and not bucket:
+        query = _appa_raw(start, end, stations, pollutants)
+    elif source == "raw":
+        query = _appa_raw_bucketed(start, end, stations, pollutants, bucket)
+    else:
+        query = _appa_rollup[source](start, end, stations, pollutants, bucket)
+    return QueryPlan(source, bucket, query)
+
+
+def plan_predictions(start, end, model: str, nodes=None, points: int = DEFAULT_POINTS, bucket_seconds=None) -> QueryPlan:
+    """
+    Plans a query of the predictions stored by `model` (one per raw reading,
+    no rollups), see plan_fbk
+    """
+    bucket = bucket_size(start, end, points) if bucket_seconds is None else bucket_seconds
+    # as _pick with no rollup
+    bucket = 0 if bucket < FBK_RAW_STEP else int(math.ceil(bucket / FBK_RAW_STEP) * FBK_RAW_STEP)
+    nodes = list(nodes) if nodes is not None else None
+    if not bucket:
+        query = _prediction_raw(start, end, nodes, model)
+    else:
+        query = _prediction_bucketed(start, end, nodes, model, bucket)
+    return QueryPlan("raw", bucket, query)
+
+
+def _run(plan: QueryPlan, transform=None) -> pd.DataFrame:
+    if plan.source != "raw":
+        # kept up to date in the background, never refreshed by a read
+        rollups.start()
+    # results are bounded by the number of points, so they are fetched in one
+    # go: the prepared statement path beats COPY (which has to inline the
+    # parameters) and a server-side cursor would only add round trips
+    df = load_data_from_psql(plan.query)
+    return transform(df) if transform else df
+
+
+def load_fbk(start, end, nodes=None, sensors=None, points: int = DEFAULT_POINTS, transform=None, bucket_seconds=None) -> pd.DataFrame:
+    """
+    Plans and runs an FBK query, `transform` is applied to the result
+    """
+    plan = plan_fbk(start, end, nodes, sensors, points, bucket_seconds)
+    return _run(plan, transform)
+
+
+def load_appa(start, end, stations=None, pollutants=None, points: int = DEFAULT_POINTS, transform=None, bucket_seconds=None) -> pd.DataFrame:
+    """
+    Plans and runs an APPA query, see load_fbk
+    """
+    plan = plan_appa(start, end, stations, pollutants, points, bucket_seconds)
+    return _run(plan, transform)
+
+
+def load_predictions(start, end, model: str, nodes=None, points: int = DEFAULT_POINTS, transform=None, bucket_seconds=None) -> pd.DataFrame:
+    """
+    Plans and runs a query of the predictions stored by `model`, see load_fbk
+    """
+    plan = plan_predictions(start, end, model, nodes, points, bucket_seconds)
+    return _run(plan, transform)
+
+
+def period_range(period: str) -> tuple:
+    """
+    Returns the (start, end) datetimes of one of the dashboard periods
+    """
+    end = datetime.now(timezone.utc)
+    return end - PERIODS[period], end
@@ -1,6 +1,10 @@
-def query_params(node) :
-    return f"""
-select
+from db_utils import statement
+
+# latest reading of every sensor of the given nodes, within the lookback
+_latest_params = statement(
+    "latest_params",
+    """
+select distinct on (p.node_id, s.name)
     p.node_id,
     s.name as sensor_description,
     p.sensor_ts as ts,
@@ -10,14 +14,84 @@ select
     p.p,
     p.t,
     p.rh
-from packet_data pd
-    left join packet p on p.id = pd.packet_id
-    left join sensor s on s.id = pd.sensor_id
-where p.node_id ={node}
-order by p.sensor_ts  DESC limit 8;
-"""
+from packet p
+    join packet_data pd on pd.packet_id = p.id
+    join sensor s on s.id = pd.sensor_id
+where p.node_id = any($1)
+    and p.sensor_ts >= now() - $2
+order by p.node_id, s.name, p.sensor_ts desc;
+""",
+    ("integer[]", "interval"),
+)
+
+def query_latest_params(nodes, lookback):
+    return _latest_params(list(nodes), lookback)
+
+# one row per timestamp of a node, the readings of every sensor as columns:
+# the model features (after ts), in the order the model was fitted on
+_fbk_wide = statement(
+    "fbk_wide",
+    """WITH sensor_data AS (
+    SELECT
+        p.node_id,
+        s.name AS sensor_description,
+        p.sensor_ts AS ts,
+        pd.r1 AS heater_res,
+        pd.r2 AS signal_res,
+        pd.volt AS volt,
+        p.p,
+        p.t,
+        p.rh
+    FROM packet_data pd
+        LEFT JOIN packet p ON p.id = pd.packet_id
+        LEFT JOIN sensor s ON s.id = pd.sensor_id
+    where p.sensor_ts BETWEEN $1 AND $2 and p.node_id = $3
+)
+SELECT
+    ts,
+    MAX(p) AS p,
+    MAX(t) AS t,
+    MAX(rh) AS rh,
+    MAX(CASE WHEN sensor_description = 'S1_ID' THEN heater_res END) AS S1_R1,
+    MAX(CASE WHEN sensor_description = 'S1_ID' THEN signal_res END) AS S1_R2,
+    MAX(CASE WHEN sensor_description = 'S1_ID' THEN volt END) AS S1_Voltage,
+    MAX(CASE WHEN sensor_description = 'S2_ID' THEN heater_res END) AS S2_R1,
+    MAX(CASE WHEN sensor_description = 'S2_ID' THEN signal_res END) AS S2_R2,
+    MAX(CASE WHEN sensor_description = 'S2_ID' THEN volt END) AS S2_Voltage,
+    MAX(CASE WHEN sensor_description = 'S3_ID' THEN heater_res END) AS S3_R1,
+    MAX(CASE WHEN sensor_description = 'S3_ID' THEN signal_res END) AS S3_R2,
+    MAX(CASE WHEN sensor_description = 'S3_ID' THEN volt END) AS S3_Voltage,
+    MAX(CASE WHEN sensor_description = 'S4_ID' THEN heater_res END) AS S4_R1,
+    MAX(CASE WHEN sensor_description = 'S4_ID' THEN signal_res END) AS S4_R2,
+    MAX(CASE WHEN sensor_description = 'S4_ID' THEN volt END) AS S4_Voltage,
+    MAX(CASE WHEN sensor_description = 'S5_ID' THEN heater_res END) AS S5_R1,
+    MAX(CASE WHEN sensor_description = 'S5_ID' THEN signal_res END) AS S5_R2,
+    MAX(CASE WHEN sensor_description = 'S5_ID' THEN volt END) AS S5_Voltage,
+    MAX(CASE WHEN sensor_description = 'S6_ID' THEN heater_res END) AS S6_R1,
+    MAX(CASE WHEN sensor_description = 'S6_ID' THEN signal_res END) AS S6_R2,
+    MAX(CASE WHEN sensor_description = 'S6_ID' THEN volt END) AS S6_Voltage,
+    MAX(CASE WHEN sensor_description = 'S7_ID' THEN heater_res END) AS S7_R1,
+    MAX(CASE WHEN sensor_description = 'S7_ID' THEN signal_res END) AS S7_R2,
+    MAX(CASE WHEN sensor_description = 'S7_ID' THEN volt END) AS S7_Voltage,
+    MAX(CASE WHEN sensor_description = 'S8_ID' THEN heater_res END) AS S8_R1,
+    MAX(CASE WHEN sensor_description = 'S8_ID' THEN signal_res END) AS S8_R2,
+    MAX(CASE WHEN sensor_description = 'S8_ID' THEN volt END) AS S8_Voltage
+FROM sensor_data
+GROUP BY ts
+ORDER BY ts;""",
+    ("unknown", "unknown", "integer"),
+)
+
+def query_fbk_wide(start, end, node=1):
+    return _fbk_wide(start, end, node)
+
+# changes whenever a row of the sensor table is added, removed or updated
+query_sensor_fingerprint = statement("sensor_fingerprint", """
+select md5(coalesce(string_agg(s::text, ',' order by s.id), ''))
+from sensor s;
+""")()
 
-query_hour = """
+query_hour = statement("hour", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -33,9 +107,9 @@ from packet_data pd
     left join sensor s on s.id = pd.sensor_id
 where p.sensor_ts >= NOW() - INTERVAL '1 HOUR'
 order by p.sensor_ts;
-"""
+""")()
 
-query_day = """
+query_day = statement("day", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -51,8 +125,8 @@ from packet_data pd
     left join sensor s on s.id = pd.sensor_id
 where p.sensor_ts >= NOW() - interval '24 hour'
 order by p.sensor_ts;
-"""
-query_week = """
+""")()
+query_week = statement("week", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -68,9 +142,9 @@ from packet_data pd
     left join sensor s on s.id = pd.sensor_id
 where p.sensor_ts >= NOW() - interval '7 days'
 order by p.sensor_ts;
-"""
+""")()
 
-query_week_avg = """
+query_week_avg = statement("week_avg", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -87,8 +161,8 @@ from packet_data pd
 where p.sensor_ts >= NOW() - interval '7 days'
 group by date_trunc('hour', p.sensor_ts), p.node_id, s.name
 order by date_trunc('hour', p.sensor_ts);
-"""
-query_month = """
+""")()
+query_month = statement("month", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -104,8 +178,8 @@ from packet_data pd
     left join sensor s on s.id = pd.sensor_id
 where p.sensor_ts >= NOW() - interval '30 days'
 order by p.sensor_ts;
-"""
-query_month_avg = """
+""")()
+query_month_avg = statement("month_avg", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -122,8 +196,8 @@ from packet_data pd
 where p.sensor_ts >= NOW() - interval '30 days'
 group by date_trunc('hour', p.sensor_ts), p.node_id, s.name
 order by date_trunc('hour', p.sensor_ts);
-"""
-query_6moths = """
+""")()
+query_6moths = statement("six_months", """
 select
     p.node_id,
     s.name as sensor_description,
@@ -139,7 +213,7 @@ from packet_data pd
     left join sensor s on s.id = pd.sensor_id
 where p.sensor_ts >= NOW() - interval '180 days'
 order by p.sensor_ts;
-"""
+""")()
 query_6moths_test= """
 SELECT
     p.node_id,
@@ -179,7 +253,7 @@ GROUP BY date_trunc('day', p.sensor_ts),
     FLOOR(date_part('hour', p.sensor_ts) /8) , p.node_id, s.name
 ORDER BY date_trunc('day', p.sensor_ts);"""
 
-query_6moths_avg_node_1 = """
+query_6moths_avg_node_1 = statement("six_months_avg_node_1", """
 SELECT  p.node_id,
     s.name as sensor_description,
     max(p.sensor_ts) as ts,
@@ -195,9 +269,9 @@ FROM packet_data pd
 where p.sensor_ts >= NOW() - interval '180 days' and p.node_id = 1
 GROUP BY date_trunc('day', p.sensor_ts), 
     FLOOR(date_part('hour', p.sensor_ts) /8) , p.node_id, s.name
-ORDER BY date_trunc('day', p.sensor_ts);"""
+ORDER BY date_trunc('day', p.sensor_ts);""")()
 
-query_6moths_avg_node_6 = """
+query_6moths_avg_node_6 = statement("six_months_avg_node_6", """
 SELECT  p.node_id,
     s.name as sensor_description,
     max(p.sensor_ts) as ts,
@@ -213,9 +287,9 @@ FROM packet_data pd
 where p.sensor_ts >= NOW() - interval '180 days' and p.node_id = 6
 GROUP BY date_trunc('day', p.sensor_ts), 
     FLOOR(date_part('hour', p.sensor_ts) /8) , p.node_id, s.name
-ORDER BY date_trunc('day', p.sensor_ts);"""
+ORDER BY date_trunc('day', p.sensor_ts);""")()
 
-query_sensor = """
+query_sensor = statement("sensor", """
 select
     id,
     name,
@@ -223,9 +297,9 @@ select
     active,
     node_id
 from sensor pd;
-"""
+""")()
 
-query_history_sensor = """
+query_history_sensor = statement("history_sensor", """
 select
     name,
     description,
@@ -233,10 +307,11 @@ select
     node_id,
     attrs
 from sensor pd;
-"""
+""")()
 
-def q_custom_all(start, end):
-    return f"""
+_custom_all = statement(
+    "custom_all",
+    """
     select
     p.node_id,
     s.name as sensor_description,
@@ -250,12 +325,19 @@ def q_custom_all(start, end):
 from packet_data pd
     left join packet p on p.id = pd.packet_id
     left join sensor s on s.id = pd.sensor_id
-where p.sensor_ts BETWEEN '{start}' AND '{end}'
+where p.sensor_ts BETWEEN $1 AND $2
 order by p.sensor_ts;
-    """
+    """,
+    ("unknown", "unknown"),
+)
+
+def q_custom_all(start, end):
+    return _custom_all(start, end)
+
     
-def q_custom_30min(start, end):
-    return f"""
+_custom_30min = statement(
+    "custom_30min",
+    """
 SELECT  p.node_id,
     s.name as sensor_description,
     max(p.sensor_ts) as ts,
@@ -268,13 +350,20 @@ SELECT  p.node_id,
 FROM packet_data pd
     left join packet p on p.id = pd.packet_id
     left join sensor s on s.id = pd.sensor_id
-where p.sensor_ts BETWEEN '{start}' AND '{end}'
+where p.sensor_ts BETWEEN $1 AND $2
 GROUP BY date_trunc('hour', p.sensor_ts), 
     FLOOR(date_part('minute', p.sensor_ts) /30) , p.node_id, s.name
-ORDER BY date_trunc('hour', p.sensor_ts);"""
+ORDER BY date_trunc('hour', p.sensor_ts);""",
+    ("unknown", "unknown"),
+)
 
-def q_custom_1H(start, end):
-    return f"""
+def q_custom_30min(start, end):
+    return _custom_30min(start, end)
+
+
+_custom_1H = statement(
+    "custom_1h",
+    """
 select
     p.node_id,
     s.name as sensor_description,
@@ -288,12 +377,19 @@ select
 from packet_data pd
     left join packet p on p.id = pd.packet_id
     left join sensor s on s.id = pd.sensor_id
-where p.sensor_ts BETWEEN '{start}' AND '{end}'
+where p.sensor_ts BETWEEN $1 AND $2
 group by date_trunc('hour', p.sensor_ts), p.node_id, s.name
-order by date_trunc('hour', p.sensor_ts);"""
+order by date_trunc('hour', p.sensor_ts);""",
+    ("unknown", "unknown"),
+)
 
-def q_custom_H(start, end, H):
-    return f"""
+def q_custom_1H(start, end):
+    return _custom_1H(start, end)
+
+
+_custom_H = statement(
+    "custom_h",
+    """
 select
     p.node_id,
     s.name as sensor_description,
@@ -307,52 +403,109 @@ select
 from packet_data pd
     left join packet p on p.id = pd.packet_id
     left join sensor s on s.id = pd.sensor_id
-where p.sensor_ts BETWEEN '{start}' AND '{end}'
+where p.sensor_ts BETWEEN $1 AND $2
 GROUP BY date_trunc('day', p.sensor_ts), 
-    FLOOR(date_part('hour', p.sensor_ts) /{H}) , p.node_id, s.name
-ORDER BY date_trunc('day', p.sensor_ts);"""
+    FLOOR(date_part('hour', p.sensor_ts) / $3) , p.node_id, s.name
+ORDER BY date_trunc('day', p.sensor_ts);""",
+    ("unknown", "unknown", "integer"),
+)
 
+def q_custom_H(start, end, H):
+    return _custom_H(start, end, H)
 
-def query_appa_compare_years(s_day, s_month, e_day, e_month):
-    return f"""
+
+
+_appa_compare_years = statement(
+    "appa_compare_years",
+    """
        SELECT 
             stazione,
             inquinante,
             ts,
             valore
         FROM appa_data
-        WHERE date_part('month', ts) * 100 + date_part('day', ts) >= '{s_month}{s_day}'::integer -- filter by starting day of period
-        AND date_part('month', ts) * 100 + date_part('day', ts) <= '{e_month}{e_day}'::integer  -- filter by ending day of period
+        WHERE date_part('month', ts) * 100 + date_part('day', ts) >= $1 -- filter by starting day of period
+        AND date_part('month', ts) * 100 + date_part('day', ts) <= $2  -- filter by ending day of period
 
-    """
+    """,
+    ("integer", "integer"),
+)
 
-def q_custom_appa_from_now(times, H):
-    return f"""
+def query_appa_compare_years(s_day, s_month, e_day, e_month):
+    # month * 100 + day, e.g. 15 March -> 315
+    return _appa_compare_years(
+        int(s_month) * 100 + int(s_day), int(e_month) * 100 + int(e_day)
+    )
+
+
+_custom_appa_from_now = statement(
+    "custom_appa_from_now",
+    """
 select
     stazione,
     inquinante,
     min(ts) as ts,
     avg(valore) as valore
 from appa_data
-where ts >= NOW() - interval '{times}'
+where ts >= NOW() - $1
 GROUP BY date_trunc('day', ts), 
-    FLOOR(date_part('hour', ts) /{H}) , stazione, inquinante
-ORDER BY date_trunc('day', ts);"""
+    FLOOR(date_part('hour', ts) / $2) , stazione, inquinante
+ORDER BY date_trunc('day', ts);""",
+    ("interval", "integer"),
+)
 
-def q_custom_appa(start, end, H=1):
-    return f"""
+def q_custom_appa_from_now(times, H):
+    return _custom_appa_from_now(times, H)
+
+
+_custom_appa = statement(
+    "custom_appa",
+    """
 select
     stazione,
     inquinante,
     min(ts),
     avg(valore)
 from appa_data
-where ts BETWEEN '{start}' AND '{end}'
+where ts BETWEEN $1 AND $2
 GROUP BY date_trunc('day', ts), 
-    FLOOR(date_part('hour', ts) /{H}) , stazione, inquinante
-ORDER BY date_trunc('day', ts);"""
+    FLOOR(date_part('hour', ts) / $3) , stazione, inquinante
+ORDER BY date_trunc('day', ts);""",
+    ("unknown", "unknown", "integer"),
+)
+
+def q_custom_appa(start, end, H=1):
+    return _custom_appa(start, end, H)
 
-query_appa_one_data_per_week =  """
+
+query_appa_stations = statement("appa_stations", """
+select distinct stazione from appa_data;""")()
+
+_appa_pollutants = statement(
+    "appa_pollutants",
+    """
+select distinct inquinante as Pollutant from appa_data where stazione = $1;""",
+    ("text",),
+)
+
+def query_appa_pollutants(station):
+    return _appa_pollutants(station)
+
+_appa_station_history = statement(
+    "appa_station_history",
+    """
+select ts, valore
+from appa_data
+where stazione = $1 and inquinante = $2
+    and date_part('year', ts) >= date_part('year', CURRENT_DATE) - 9;""",
+    ("text", "text"),
+)
+
+def query_appa_station_history(station, pollutant):
+    return _appa_station_history(station, pollutant)
+
+
+query_appa_one_data_per_week = statement("appa_one_data_per_week", """
 select
     stazione,
     inquinante,
@@ -360,17 +513,13 @@ select
     avg(valore) as valore
 from appa_data
 group by date_trunc('week', ts),stazione, inquinante
-order by date_trunc('week', ts);"""
+order by date_trunc('week', ts);""")()
 
 
 
-def general_query(avg: bool, time: str, start :str, end :str, interval :int):
-    arr = {0: 'second', 1:'minute', 2:'hour', 3:'day'}
-    
-    key = {i for i in arr if arr[i]==time}
-
-    if avg:
-        return f"""
+_general_avg = statement(
+    "general_avg",
+    """
     SELECT
         p.node_id,
         s.name as sensor_description,
@@ -385,8 +534,19 @@ def general_query(avg: bool, time: str, start :str, end :str, interval :int):
         LEFT JOIN packet p ON p.id = pd.packet_id
         LEFT JOIN sensor s ON s.id = pd.sensor_id
 
-WHERE p.sensor_ts BETWEEN '{start}' AND '{end}'
-GROUP BY date_trunc('{arr[key+1]}', p.sensor_ts), 
-    FLOOR(date_part('{arr[key]}', p.sensor_ts) /{interval}) , p.node_id, s.name
-ORDER BY date_trunc('{arr[key+1]}', p.sensor_ts);"""      
-    
\ No newline at end of file
+WHERE p.sensor_ts BETWEEN $1 AND $2
+GROUP BY date_trunc($3, p.sensor_ts), 
+    FLOOR(date_part($4, p.sensor_ts) / $5) , p.node_id, s.name
+ORDER BY date_trunc($3, p.sensor_ts);""",
+    ("unknown", "unknown", "text", "text", "integer"),
+)
+
+
+def general_query(avg: bool, time: str, start :str, end :str, interval :int):
+    arr = ['second', 'minute', 'hour', 'day']
+    
+    key = arr.index(time)
+
+    if avg:
+        return _general_avg(start, end, arr[key + 1], arr[key], interval)
+    return q_custom_all(start, end)
@@ -0,0 +1,180 @@
+"""
+Stale-while-revalidate store of the period datasets.
+
+Pages register a loader and a refresh interval per dataset. A scheduler
+thread in every worker reloads each dataset once it is older than its
+interval, while readers keep getting the previous copy, so a callback never
+waits on a query for a dataset that was loaded once. The copies live in a
+directory shared by the workers (columnar files memory-mapped on read, see
+frame_cache) and a lock per dataset makes sure only one worker reloads it.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import diskcache
+
+from .frame_cache import FrameFileSystemCache
+
+REFRESHER_DIR = os.getenv("REFRESHER_DIR", "./cache_refresher")
+# seconds between two checks of the scheduler
+TICK = 5
+# a reload running longer than this is considered dead and its lock expires
+LOCK_TIMEOUT = 900
+# seconds before retrying a failed load, doubled on every further failure
+RETRY_AFTER = 10
+RETRY_MAX = 600
+
+Dataset = namedtuple("Dataset", ["name", "loader", "every"])
+
+_datasets = {}
+_values = FrameFileSystemCache(os.path.join(REFRESHER_DIR, "values"), threshold=0)
+_state = diskcache.Cache(os.path.join(REFRESHER_DIR, "state"))
+
+
+
+class RefreshError(Exception):
+    """
+    A dataset never loaded could not be loaded
+    """
+
+
+_wake = threading.Event()
+_started_in = None
+_start_lock = threading.Lock()
+
+
+def register(name: str, loader, every: float):
+    """
+    Registers a dataset
+
+    Args:
+        name (str): the dataset name
+        loader (callable): loads the dataset, without arguments
+        every (float): seconds after which the dataset is reloaded
+    """
+    _datasets[name] = Dataset(name, loader, every)
+
+
+def age(name: str):
+    """
+    Seconds since the dataset was last loaded, None if it never was (or was
+    expired)
+    """
+    loaded_at = _state.get(("loaded_at", name))
+    return None if loaded_at is None else time.time() - loaded_at
+
+
+def refresh(name: str) -> bool:
+    """
+    Reloads a dataset unless another thread or worker is already doing it.
+    A failed load is retried after RETRY_AFTER seconds, doubled on every
+    further failure up to RETRY_MAX.
+
+    Returns:
+        bool: False if the dataset was being reloaded elsewhere
+
+    Raises:
+        Exception: whatever the loader raised
+    """
+    dataset = _datasets[name]
+    if not _state.add(("lock", name), os.getpid(), expire=LOCK_TIMEOUT):
+        return False
+    try:
+        start = time.perf_counter()
+        _values.set(name, dataset.loader(), timeout=0)
+        _state.set(("loaded_at", name), time.time())
+        _state.delete(("failures", name))
+        _state.delete(("retry_at", name))
+        print(f"REFRESHED {name}: {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        failures = _state.get(("failures", name), 0) + 1
+        _state.set(("failures", name), failures)
+        _state.set(
+            ("retry_at", name),
+            time.time() + min(RETRY_AFTER * 2 ** (failures - 1), RETRY_MAX),
+        )
+        _state.set(("error", name), repr(e))
+        print(f"REFRESH {name} FAILED ({failures} in a row): {e}")
+        raise
+    finally:
+        _state.delete(("lock", name))
+    return True
+
+
+def _backing_off(name: str) -> bool:
+    retry_at = _state.get(("retry_at", name))
+    return retry_at is not None and time.time() < retry_at
+
+
+def expire(name: str):
+    """
+    Marks a dataset as stale: the scheduler reloads it at its next check,
+    readers keep getting the current copy meanwhile
+    """
+    _state.delete(("loaded_at", name))
+    _wake.set()
+
+
+def _stale(dataset: Dataset) -> bool:
+    loaded = age(dataset.name)
+    return loaded is None or loaded >= dataset.every
+
+
+def _run():
+    while True:
+        for dataset in list(_datasets.values()):
+            if _stale(dataset) and not _backing_off(dataset.name):
+                try:
+                    refresh(dataset.name)
+                except Exception:
+                    # logged by refresh, retried after the backoff
+                    pass
+        _wake.wait(TICK)
+        _wake.clear()
+
+
+def start():
+    """
+    Starts the scheduler thread of this process (again after a fork)
+    """
+    global _started_in
+    if _started_in == os.getpid():
+        return
+    with _start_lock:
+        if _started_in == os.getpid():
+            return
+        threading.Thread(target=_run, name="refresher", daemon=True).start()
+        _started_in = os.getpid()
+
+
+def get(name: str):
+    """
+    Returns the last loaded copy of a dataset. Only the very first read of a
+    dataset, before the scheduler has loaded it, waits for the query.
+
+    Raises:
+        RefreshError: the dataset was never loaded and its last load failed
+            less than the backoff ago
+        Exception: whatever the loader raised, on the first read
+    """
+    start()
+    value = _values.get(name)
+    if value is not None:
+        if _stale(_datasets[name]):
+            _wake.set()
+        return value
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        if _backing_off(name):
+            raise RefreshError(f"{name}: {_state.get(('error', name))}")
+        if refresh(name):
+            return _values.get(name)
+        # another worker is loading it
+        time.sleep(0.5)
+        value = _values.get(name)
+        if value is not None:
+            return value
+    raise RefreshError(f"{name}: not loaded after {LOCK_TIMEOUT}s")
@@ -0,0 +1,323 @@
+"""
+Pre-aggregated rollups of packet_data and appa_data.
+
+Every resolution has its own table holding one averaged row per node/sensor
+(FBK) or station/pollutant (APPA) and time bucket. The tables are refreshed
+incrementally, recomputing only the buckets that received new rows: FBK
+those of the packets after the last id seen plus those from FBK_LOOKBACK
+before the latest reading (packets committed late with a lower id), APPA
+those from APPA_LOOKBACK before the last reading refreshed. Buckets are
+computed by bucket_sql, the same as the planner re-buckets them. A
+background thread per worker (see start) keeps them up to date, so reads
+never refresh.
+
+Create and backfill them once with:
+
+    cd plotly-app && python -m pages.utils.rollups
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+from db_utils import get_connection, load_data_from_psql
+
+# name -> bucket size in seconds
+FBK_RESOLUTIONS = {
+    "30min": 1800,
+    "1h": 3600,
+    "3h": 3 * 3600,
+    "8h": 8 * 3600,
+    "1d": 86400,
+}
+# name -> bucket size in seconds
+APPA_RESOLUTIONS = {
+    "1h": 3600,
+    "1d": 86400,
+    "1w": 7 * 86400,
+}
+# buckets start from a Monday (1970-01-05 UTC), so weeks start on Mondays;
+# every bucket size used divides a week
+BUCKET_ORIGIN = 4 * 86400
+
+# FBK buckets are recomputed from this far back, late commits included
+FBK_LOOKBACK = timedelta(hours=1)
+# APPA buckets are recomputed from this far back, late readings included
+APPA_LOOKBACK = timedelta(days=2)
+# seconds between two refreshes of the background thread
+REFRESH_EVERY = 300
+
+_ddl = """
+create table if not exists rollup_state (
+    name text primary key,
+    last_id bigint,
+    last_ts timestamptz,
+    refreshed_at timestamptz
+);
+"""
+
+_fbk_ddl = """
+create table if not exists packet_rollup_{name} (
+    node_id integer not null,
+    sensor_id integer not null,
+    ts timestamptz not null,
+    n integer not null,
+    heater_res double precision,
+    signal_res double precision,
+    volt double precision,
+    p double precision,
+    t double precision,
+    rh double precision,
+    primary key (node_id, sensor_id, ts)
+);
+create index if not exists packet_rollup_{name}_ts on packet_rollup_{name} (ts);
+"""
+
+_appa_ddl = """
+create table if not exists appa_rollup_{name} (
+    stazione text not null,
+    inquinante text not null,
+    ts timestamptz not null,
+    n integer not null,
+    valore double precision,
+    primary key (stazione, inquinante, ts)
+);
+create index if not exists appa_rollup_{name}_ts on appa_rollup_{name} (ts);
+"""
+
+
+def bucket_sql(ts: str, seconds) -> str:
+    """
+    SQL of the start of the `seconds` long bucket holding the timestamp
+    expression ts, in UTC from BUCKET_ORIGIN (whatever the session time zone)
+
+    Args:
+        ts (str): the timestamptz expression
+        seconds: the bucket size, a number or a SQL expression (e.g. "$5")
+    """
+    return (
+        f"to_timestamp(floor((extract(epoch from {ts}) - {BUCKET_ORIGIN}) / {seconds})"
+        f" * {seconds} + {BUCKET_ORIGIN})"
+    )
+
+
+# recompute every bucket touched by the packets in (last_id, max_id] or
+# read since `since`
+_fbk_refresh = """
+with touched as (
+    select p.node_id, {bucket} as ts
+    from packet p
+    where p.id > %(last_id)s and p.id <= %(max_id)s
+    union
+    select p.node_id, {bucket} as ts
+    from packet p
+    where p.sensor_ts >= %(since)s
+)
+insert into packet_rollup_{name}
+    (node_id, sensor_id, ts, n, heater_res, signal_res, volt, p, t, rh)
+select
+    p.node_id,
+    pd.sensor_id,
+    b.ts,
+    count(*),
+    avg(pd.r1),
+    avg(pd.r2),
+    avg(pd.volt),
+    avg(p.p),
+    avg(p.t),
+    avg(p.rh)
+from touched b
+    join packet p on p.node_id = b.node_id
+        and p.sensor_ts >= b.ts
+        and p.sensor_ts < b.ts + interval '{seconds} seconds'
+    join packet_data pd on pd.packet_id = p.id
+group by p.node_id, pd.sensor_id, b.ts
+on conflict (node_id, sensor_id, ts) do update set
+    n = excluded.n,
+    heater_res = excluded.heater_res,
+    signal_res = excluded.signal_res,
+    volt = excluded.volt,
+    p = excluded.p,
+    t = excluded.t,
+    rh = excluded.rh;
+"""
+
+_appa_refresh = """
+insert into appa_rollup_{name} (stazione, inquinante, ts, n, valore)
+select
+    stazione,
+    inquinante,
+    {bucket},
+    count(*),
+    avg(valore)
+from appa_data
+where ts >= {since}
+group by stazione, inquinante, {bucket}
+on conflict (stazione, inquinante, ts) do update set
+    n = excluded.n,
+    valore = excluded.valore;
+"""
+
+_available = None
+_checked_at = 0.0
+_started_in = None
+_start_lock = threading.Lock()
+
+
+def available() -> bool:
+    """
+    Whether the rollup tables exist (re-checked every REFRESH_EVERY seconds
+    while they don't, so creating them does not need a restart)
+    """
+    global _available, _checked_at
+    if _available or (_available is not None and time.monotonic() - _checked_at < REFRESH_EVERY):
+        return bool(_available)
+    try:
+        df = load_data_from_psql("select to_regclass('rollup_state') is not null as ok;")
+        _available = bool(df.ok[0])
+    except psycopg2.Error:
+        _available = False
+    _checked_at = time.monotonic()
+    return _available
+
+
+def create_rollups():
+    """
+    Creates the state table and every rollup table, if missing
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute(_ddl)
+                for name in FBK_RESOLUTIONS:
+                    curs.execute(_fbk_ddl.format(name=name))
+                for name in APPA_RESOLUTIONS:
+                    curs.execute(_appa_ddl.format(name=name))
+
+
+def reset_appa():
+    """
+    Empties the APPA rollups and their state, so the next refresh rebuilds
+    them from scratch (after a change of their buckets)
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as curs:
+                for name in APPA_RESOLUTIONS:
+                    curs.execute(f"truncate appa_rollup_{name};")
+                    curs.execute("delete from rollup_state where name = %s;", (f"appa_{name}",))
+
+
+def _state(curs, name: str) -> tuple:
+    curs.execute("select last_id, last_ts from rollup_state where name = %s;", (name,))
+    row = curs.fetchone()
+    return row if row else (0, None)
+
+
+def _save_state(curs, name: str, last_id=None, last_ts=None):
+    curs.execute(
+        """
+        insert into rollup_state (name, last_id, last_ts, refreshed_at)
+        values (%s, %s, %s, now())
+        on conflict (name) do update set
+            last_id = excluded.last_id,
+            last_ts = excluded.last_ts,
+            refreshed_at = excluded.refreshed_at;
+        """,
+        (name, last_id, last_ts),
+    )
+
+
+def refresh() -> bool:
+    """
+    Brings every rollup up to date with the rows inserted since the last
+    refresh. Only one worker refreshes at a time (advisory lock); the others
+    return immediately.
+
+    Returns:
+        bool: False if another process was already refreshing
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute("select pg_try_advisory_xact_lock(hashtext('rollups'));")
+                if not curs.fetchone()[0]:
+                    return False
+
+                curs.execute("select coalesce(max(id), 0), max(sensor_ts) from packet;")
+                max_id, max_sensor_ts = curs.fetchone()
+                for name, seconds in FBK_RESOLUTIONS.items():
+                    last_id, last_ts = _state(curs, f"fbk_{name}")
+                    if max_sensor_ts is None:
+                        continue
+                    # no id check: a late commit below last_id changes no max
+                    since = (
+                        last_ts - FBK_LOOKBACK if last_ts is not None else max_sensor_ts
+                    )
+                    curs.execute(
+                        _fbk_refresh.format(
+                            name=name,
+                            seconds=seconds,
+                            bucket=bucket_sql("p.sensor_ts", seconds),
+                        ),
+                        {"last_id": last_id, "max_id": max_id, "since": since},
+                    )
+                    _save_state(curs, f"fbk_{name}", last_id=max_id, last_ts=max_sensor_ts)
+
+                curs.execute("select max(ts) from appa_data;")
+                max_ts = curs.fetchone()[0]
+                for name, seconds in APPA_RESOLUTIONS.items():
+                    _, last_ts = _state(curs, f"appa_{name}")
+                    if max_ts is None or (last_ts is not None and last_ts >= max_ts):
+                        continue
+                    since = (
+                        last_ts - APPA_LOOKBACK
+                        if last_ts is not None
+                        else datetime(1970, 1, 1, tzinfo=timezone.utc)
+                    )
+                    curs.execute(
+                        _appa_refresh.format(
+                            name=name,
+                            bucket=bucket_sql("ts", seconds),
+                            since=bucket_sql("%(since)s::timestamptz", seconds),
+                        ),
+                        {"since": since},
+                    )
+                    _save_state(curs, f"appa_{name}", last_ts=max_ts)
+    return True
+
+
+def _run():
+    while True:
+        if available():
+            try:
+                refresh()
+            except psycopg2.Error as e:
+                print(f"ROLLUP REFRESH FAILED: {e}")
+        time.sleep(REFRESH_EVERY)
+
+
+def start():
+    """
+    Starts the refresh thread of this process (again after a fork)
+    """
+    global _started_in
+    if _started_in == os.getpid():
+        return
+    with _start_lock:
+        if _started_in == os.getpid():
+            return
+        threading.Thread(target=_run, name="rollups", daemon=True).start()
+        _started_in = os.getpid()
+
+
+if __name__ == "__main__":
+    began = time.perf_counter()
+    create_rollups()
+    if "--reset-appa" in sys.argv:
+        reset_appa()
+    refresh()
+    print(f"rollups refreshed in {time.perf_counter() - began:.1f}s")
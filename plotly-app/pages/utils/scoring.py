@@ -0,0 +1,290 @@
+"""
+Background scoring of new packets into the `prediction` table.
+
+The model outputs of every reading of the fitted node are stored once, keyed
+by (node, ts) and tagged with the model that produced them, so the Fitted
+FBK page reads the current model's outputs through the planner like raw data
+instead of running the model in the request path. The table is filled
+incrementally from the last packet id scored by the model (kept in
+rollup_state, per model name, so a new model rescores every packet):
+the days touched by the new packets are loaded with the wide query, predicted
+in fixed-size batches and upserted. Only one process scores at a time
+(advisory lock); the others skip the run.
+
+Scoring runs in its own process, never in the web workers: they only read
+the table, so none of them loads TensorFlow for it. The model is loaded on
+the first rows to score, not at import.
+
+Create the table and backfill it once with:
+
+    cd plotly-app && python -m pages.utils.scoring
+
+then keep it up to date with the scoring loop, woken by the packet
+notifications and every SCORE_EVERY seconds otherwise:
+
+    cd plotly-app && python -m pages.utils.scoring --loop
+"""
+import math
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db_utils import get_connection, load_data_from_psql, statement
+from . import inference, notify, querys, rollups
+
+# node the model was fitted on, the only one scored
+FITTED_NODE = 1
+PIPELINE_PATH = os.getenv("PIPELINE_PATH", "data/pipeline.pkl")
+MODEL_PATH = os.getenv("MODEL_PATH", "data/model.h5")
+# packets scored per transaction
+SCORE_PACKETS = 50000
+# seconds between two runs without notifications
+SCORE_EVERY = 300
+# seconds between two checks of the table while it is missing
+CHECK_EVERY = 300
+
+_ddl = """
+create table if not exists prediction (
+    node_id integer not null,
+    ts timestamptz not null,
+    model text not null,
+    pm10 double precision,
+    no2 double precision,
+    so2 double precision,
+    o3 double precision,
+    primary key (node_id, ts)
+);
+create index if not exists prediction_ts on prediction (ts);
+"""
+
+# the days (UTC) of the node touched by the packets in (last_id, max_id]
+_touched = """
+select
+    node_id,
+    min(sensor_ts) as start,
+    max(sensor_ts) as end
+from packet
+where id > %(last_id)s and id <= %(max_id)s and node_id = %(node)s
+group by node_id, floor(extract(epoch from sensor_ts) / 86400)
+order by 2;
+"""
+
+_upsert = """
+insert into prediction (node_id, ts, model, pm10, no2, so2, o3)
+values %s
+on conflict (node_id, ts) do update set
+    model = excluded.model,
+    pm10 = excluded.pm10,
+    no2 = excluded.no2,
+    so2 = excluded.so2,
+    o3 = excluded.o3;
+"""
+
+# the latest stored prediction of a node, up to a time
+_scored_until = statement(
+    "scored_until",
+    """
+select max(ts) as ts
+from prediction
+where node_id = $1 and model = $2 and ts <= $3;""",
+    ("integer", "text", "timestamptz"),
+)
+
+_pipeline = None
+_pipeline_model = None
+_pipeline_lock = threading.Lock()
+_available = None
+_checked_at = 0.0
+_wake = threading.Event()
+# per process, like db_utils.pool_stats
+_stats = {"runs": 0, "packets": 0, "rows": 0, "failures": 0}
+
+
+def model_name() -> str:
+    """
+    Names the model by the modification times of its files
+    """
+    return "pipeline-{:.0f}-{:.0f}".format(
+        os.path.getmtime(PIPELINE_PATH), os.path.getmtime(MODEL_PATH)
+    )
+
+
+def pipeline():
+    """
+    Returns the fitted pipeline, loading it (and TensorFlow) on first use and
+    again when the model files change
+    """
+    global _pipeline, _pipeline_model
+    with _pipeline_lock:
+        name = model_name()
+        if _pipeline_model != name:
+            os.environ["CUDA_VISIBLE_DEVICES"] = ""
+            import __main__
+            import joblib
+            import tensorflow as tf
+            from .kerasWrapper import KerasWrapper
+
+            # the pipeline was pickled from a script defining KerasWrapper
+            __main__.KerasWrapper = KerasWrapper
+            loaded = joblib.load(PIPELINE_PATH)
+            # the Keras model is not pickled with the pipeline
+            model = tf.keras.models.load_model(MODEL_PATH)
+            model.compile(loss='mean_absolute_error', optimizer='adam', metrics=['mean_squared_error'])
+            loaded.steps[-1][1].model = model
+            print(f"PREDICTION MODEL LOADED: {name}")
+            _pipeline = loaded
+            _pipeline_model = name
+    return _pipeline
+
+
+def predict(rows):
+    """
+    Model outputs (inference.OUTPUTS columns) of the feature rows
+    """
+    return pipeline().predict(rows)
+
+
+def available() -> bool:
+    """
+    Whether the prediction table exists (re-checked every CHECK_EVERY
+    seconds while it doesn't)
+    """
+    global _available, _checked_at
+    if _available or (_available is not None and time.monotonic() - _checked_at < CHECK_EVERY):
+        return bool(_available)
+    try:
+        df = load_data_from_psql("select to_regclass('prediction') is not null as ok;")
+        _available = bool(df.ok[0])
+    except psycopg2.Error:
+        _available = False
+    _checked_at = time.monotonic()
+    return _available
+
+
+def scored_until(node: int, model: str, end):
+    """
+    Time of the latest reading of the node scored by `model` up to end, None
+    if there is none. The packets are scored in id order, so the readings
+    before it are scored too.
+    """
+    value = load_data_from_psql(_scored_until(node, model, end))["ts"][0]
+    return None if pd.isna(value) else pd.Timestamp(value)
+
+
+def create_table():
+    """
+    Creates the prediction table and the state table, if missing
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute(rollups._ddl)
+                curs.execute(_ddl)
+
+
+def _value(output):
+    # NULL rather than NaN, so the averages skip it
+    return None if math.isnan(output) else float(output)
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+def score(limit: int = SCORE_PACKETS):
+    """
+    Scores the readings of the next `limit` packets not scored yet
+
+    Returns:
+        int | None: the packets scored, None if another process was already
+            scoring
+    """
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute("select pg_try_advisory_xact_lock(hashtext('prediction'));")
+                if not curs.fetchone()[0]:
+                    return None
+
+                model = model_name()
+                state = f"prediction {model}"
+                last_id, _ = rollups._state(curs, state)
+                curs.execute(
+                    "select count(*), max(id) from (select id from packet where id > %s order by id limit %s) t;",
+                    (last_id, limit),
+                )
+                packets, max_id = curs.fetchone()
+                if not packets:
+                    return 0
+                curs.execute(_touched, {"last_id": last_id, "max_id": max_id, "node": FITTED_NODE})
+                for node, start, end in curs.fetchall():
+                    readings = load_data_from_psql(querys.query_fbk_wide(start, end, node))
+                    if not len(readings):
+                        continue
+                    features = readings.drop(columns="ts").to_numpy(dtype=float)
+                    outputs = inference.predict_batches(predict, features)
+                    execute_values(
+                        curs,
+                        _upsert,
+                        [
+                            (node, ts, model, *map(_value, row))
+                            for ts, row in zip(readings["ts"], outputs)
+                        ],
+                        page_size=1000,
+                    )
+                    _stats["rows"] += len(readings)
+                rollups._save_state(curs, state, last_id=max_id)
+    _stats["packets"] += packets
+    return packets
+
+
+def poke():
+    """
+    Wakes the scoring loop (new packets arrived)
+    """
+    _wake.set()
+
+
+def _on_packets(rows: list):
+    poke()
+
+
+def loop():
+    """
+    Scores the new packets until interrupted, after every packet
+    notification and every SCORE_EVERY seconds
+    """
+    notify.subscribe(notify.PACKET_CHANNEL, _on_packets)
+    notify.start()
+    while True:
+        _wake.wait(SCORE_EVERY)
+        _wake.clear()
+        if not available():
+            continue
+        _stats["runs"] += 1
+        try:
+            while score():
+                pass
+        except Exception as e:
+            _stats["failures"] += 1
+            print(f"PREDICTION SCORING FAILED: {e}")
+
+
+if __name__ == "__main__":
+    began = time.perf_counter()
+    create_table()
+    scored = 0
+    while True:
+        packets = score()
+        if not packets:
+            break
+        scored += packets
+        print(f"{scored} packets scored")
+    print(f"predictions stored in {time.perf_counter() - began:.1f}s")
+    if "--loop" in sys.argv:
+        loop()
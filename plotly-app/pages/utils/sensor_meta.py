@@ -0,0 +1,135 @@
+"""
+Cached sensor metadata.
+
+The `sensor` table is small and rarely changes: it is loaded once per
+worker, indexed by (node, sensor name), and reloaded only when its
+fingerprint (an md5 of the rows, checked at most every CHECK_EVERY seconds)
+changes. The install / replacement dates ("active since") are parsed at
+load into a sorted datetime64 array per node, so the ones in a window are
+found by binary search. The latest parameters of every sensor come from one DISTINCT ON
+query for all the nodes, kept for PARAMS_TTL seconds.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from db_utils import load_data_from_psql
+from . import querys
+
+# seconds between two checks of the sensor table fingerprint
+CHECK_EVERY = 60
+# seconds the latest parameters are kept
+PARAMS_TTL = 60
+# how far back the latest parameters are looked for
+PARAMS_LOOKBACK = timedelta(days=1)
+
+
+def _active_since(attrs) -> pd.Timestamp:
+    # as written in the attributes (wall time), like the plot timestamps
+    try:
+        return pd.Timestamp(attrs["active since"]).tz_localize(None)
+    except (KeyError, TypeError, ValueError):
+        return pd.NaT
+
+
+def _wall(value) -> np.datetime64:
+    return pd.Timestamp(value).tz_localize(None).to_datetime64().astype("datetime64[ns]")
+
+
+class SensorMeta:
+    """
+    The sensor table and the latest parameters of the sensors of the given
+    nodes
+
+    Args:
+        nodes (list): the node ids whose parameters are loaded
+    """
+
+    def __init__(self, nodes: list):
+        self.nodes = list(nodes)
+        self._sensors = None
+        self._changes = {}
+        self._fingerprint = None
+        self._checked_at = 0
+        self._params = None
+        self._params_at = 0
+        self._lock = threading.Lock()
+
+    def _load_sensors(self):
+        sensors = load_data_from_psql(querys.query_history_sensor)
+        sensors["active_since"] = pd.to_datetime(sensors["attrs"].map(_active_since))
+        self._sensors = sensors.set_index(["node_id", "name"]).sort_index()
+        self._changes = {
+            node: np.unique(since.dropna().to_numpy(dtype="datetime64[ns]"))
+            for node, since in sensors.groupby("node_id")["active_since"]
+        }
+
+    def sensors(self) -> pd.DataFrame:
+        """
+        Returns the sensor table indexed by (node_id, name), with the parsed
+        "active since" attribute as active_since
+        """
+        with self._lock:
+            if self._sensors is None or time.monotonic() - self._checked_at >= CHECK_EVERY:
+                fingerprint = load_data_from_psql(querys.query_sensor_fingerprint).iat[0, 0]
+                if fingerprint != self._fingerprint or self._sensors is None:
+                    self._load_sensors()
+                    self._fingerprint = fingerprint
+                self._checked_at = time.monotonic()
+            return self._sensors
+
+    def active(self, node: int) -> pd.DataFrame:
+        """
+        Returns the active sensors of a node, indexed by name
+        """
+        sensors = self.sensors()
+        if node not in sensors.index.get_level_values("node_id"):
+            return sensors.iloc[:0].droplevel("node_id")
+        sensors = sensors.loc[node]
+        return sensors[sensors["active"] == True]
+
+    def changes(self, node: int, start=None, end=None) -> np.ndarray:
+        """
+        Returns the sorted, distinct "active since" dates of the sensors
+        (active or not) of a node, strictly between start and end if given
+
+        Args:
+            node (int): the node id
+            start (optional): wall time lower bound. Defaults to None.
+            end (optional): wall time upper bound. Defaults to None.
+
+        Returns:
+            np.ndarray: datetime64[ns] dates
+        """
+        self.sensors()
+        changes = self._changes.get(node, np.array([], dtype="datetime64[ns]"))
+        first = 0 if start is None else np.searchsorted(changes, _wall(start), side="right")
+        last = len(changes) if end is None else np.searchsorted(changes, _wall(end), side="left")
+        return changes[first:last]
+
+    def params(self, node: int) -> pd.DataFrame:
+        """
+        Returns the latest reading of every sensor of a node, indexed by
+        sensor name
+        """
+        with self._lock:
+            if self._params is None or time.monotonic() - self._params_at >= PARAMS_TTL:
+                params = load_data_from_psql(
+                    querys.query_latest_params(self.nodes, PARAMS_LOOKBACK)
+                )
+                self._params = params.set_index(["node_id", "sensor_description"])
+                self._params_at = time.monotonic()
+            params = self._params
+        if node not in params.index.get_level_values("node_id"):
+            return params.iloc[:0].droplevel("node_id")
+        return params.loc[node]
+
+    def expire_params(self):
+        """
+        Makes the next read reload the parameters (new packets arrived)
+        """
+        with self._lock:
+            self._params = None
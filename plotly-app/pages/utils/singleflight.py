@@ -0,0 +1,175 @@
+"""
+Single-flight coalescing of identical concurrent data loads.
+
+Within a worker, calls with the same key that arrive while one is running
+wait for it and get its result instead of running their own query. Across
+workers, the running call holds a lock on the key; the workers queued on the
+lock while it ran are counted, and the result is published only for them:
+each picks it up once and the last one deletes it. A call arriving after the
+load finished runs its own, so coalescing never turns into a cache (no
+result outlives the invalidations of the data it was loaded from).
+
+The lock is an flock on a file per key: the kernel releases it when its
+holder dies, and a waiter retries with exponential backoff rather than
+polling. A waiter that gets no lock within WAIT_TIMEOUT loads on its own.
+"""
+import fcntl
+import functools
+import hashlib
+import os
+import threading
+import time
+
+import diskcache
+
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", "./cache_singleflight")
+# a published result not picked up within this many seconds (its readers
+# died) is dropped
+SHARED_TTL = 60
+# seconds a worker waits for another one's load before running its own
+WAIT_TIMEOUT = 120
+# seconds between two attempts to take a lock, doubled up to BACKOFF_MAX
+BACKOFF_MIN = 0.005
+BACKOFF_MAX = 0.25
+
+LOCK_DIR = os.path.join(SINGLEFLIGHT_DIR, "files")
+os.makedirs(LOCK_DIR, exist_ok=True)
+# counters and published generations of the keys
+_locks = diskcache.Cache(os.path.join(SINGLEFLIGHT_DIR, "locks"))
+# pickled, so every caller gets the dtypes the load returned
+_results = diskcache.Cache(os.path.join(SINGLEFLIGHT_DIR, "results"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+# per worker, like db_utils.pool_stats
+_stats = {"calls": 0, "coalesced": 0, "shared": 0, "timeouts": 0}
+
+
+def stats() -> dict:
+    """
+    Returns the calls made, the calls that waited on a call of the same
+    worker (coalesced), those served by another worker's load (shared) and
+    those that gave up waiting for it (timeouts)
+    """
+    with _calls_lock:
+        return dict(_stats)
+
+
+def _take(key: str, since: int):
+    """
+    Returns the result published for the callers queued before generation
+    `since` ended, None if there is none; the last reader deletes it
+    """
+    published = _locks.get(("published", key))
+    if published is None or published <= since:
+        return None
+    result = _results.get(key)
+    if _locks.decr(("readers", key)) <= 0:
+        _results.delete(key)
+        _locks.delete(("readers", key))
+        _locks.delete(("published", key))
+    return result
+
+
+def _acquire(key: str):
+    """
+    Returns the lock file of the key, locked, or None if it was not free
+    within WAIT_TIMEOUT. Closing the file releases the lock.
+    """
+    path = os.path.join(LOCK_DIR, hashlib.sha1(key.encode()).hexdigest())
+    f = open(path, "ab")
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    delay = BACKOFF_MIN
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                f.close()
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, BACKOFF_MAX)
+
+
+def _load(key: str, fn, args, kwargs):
+    since = _locks.get(("generation", key), 0)
+    _locks.incr(("queued", key))
+    lock = _acquire(key)
+    _locks.decr(("queued", key))
+    if lock is None:
+        with _calls_lock:
+            _stats["timeouts"] += 1
+        return fn(*args, **kwargs)
+    with lock:
+        result = _take(key, since)
+        if result is not None:
+            with _calls_lock:
+                _stats["shared"] += 1
+            return result
+        result = fn(*args, **kwargs)
+        generation = _locks.incr(("generation", key))
+        # the workers queued on the lock meanwhile
+        readers = _locks.get(("queued", key), 0)
+        if readers > 0 and result is not None:
+            _results.set(key, result, expire=SHARED_TTL)
+            _locks.set(("readers", key), readers, expire=SHARED_TTL)
+            _locks.set(("published", key), generation, expire=SHARED_TTL)
+        return result
+
+
+def do(key: str, fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) unless a call with the same key is already
+    running, in which case its result is returned
+
+    Args:
+        key (str): identifies identical loads
+        fn (callable): the load
+    """
+    with _calls_lock:
+        _stats["calls"] += 1
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+        else:
+            _stats["coalesced"] += 1
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _load(key, fn, args, kwargs)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+
+def coalesce(fn):
+    """
+    Decorator: concurrent calls of fn with the same arguments share one load
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = f"{fn.__module__}.{fn.__qualname__}{args!r}{sorted(kwargs.items())!r}"
+        return do(key, fn, *args, **kwargs)
+
+    return wrapper
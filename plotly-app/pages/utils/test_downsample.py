@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pages.utils import downsample
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_indices_are_bounded_sorted_and_keep_the_ends(method):
+    y = np.sin(np.linspace(0, 20, 1000))
+    idx = downsample.METHODS[method](np.arange(1000), y, 100)
+    assert len(idx) <= 100
+    assert idx[0] == 0 and idx[-1] == 999
+    assert (np.diff(idx) > 0).all()
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_short_series_are_kept(method):
+    assert downsample.METHODS[method](np.arange(10), np.arange(10.0), 50).tolist() == list(range(10))
+
+
+def test_minmax_keeps_the_spikes():
+    y = np.zeros(1000)
+    y[123], y[777] = 50.0, -50.0
+    idx = downsample.minmax_indices(np.arange(1000), y, 20)
+    assert 123 in idx and 777 in idx
+
+
+def test_lttb_keeps_the_peak():
+    y = np.zeros(1000)
+    y[500] = 10.0
+    assert 500 in downsample.lttb_indices(np.arange(1000), y, 50)
+
+
+def test_lttb_takes_datetimes():
+    x = pd.Series(pd.date_range("2024-01-01", periods=500, freq="min", tz="UTC"))
+    idx = downsample.lttb_indices(x, np.random.default_rng(0).normal(size=500), 50)
+    assert len(idx) == 50
+
+
+def test_downsample_keeps_types_and_drops_nans():
+    x = pd.Series(np.arange(200))
+    y = pd.Series(np.where(np.arange(200) % 10 == 0, np.nan, 1.0))
+    dx, dy = downsample.downsample(x, y, 20)
+    assert isinstance(dx, pd.Series) and isinstance(dy, pd.Series)
+    assert len(dy) <= 20 and dy.notna().all()
+    kept_x, kept_y = downsample.downsample(x, y, None)
+    assert kept_x is x and kept_y is y
+
+
+def test_downsample_frame_per_trace():
+    df = pd.DataFrame({
+        "ts": np.tile(np.arange(300), 2),
+        "value": np.random.default_rng(0).normal(size=600),
+        "sensor": ["a"] * 300 + ["b"] * 300,
+    })
+    kept = downsample.downsample_frame(df, "ts", "value", 30, by="sensor")
+    assert kept.groupby("sensor").size().to_dict() == {"a": 30, "b": 30}
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from pages.utils import figures
+
+
+def long_frame():
+    return pd.DataFrame({
+        "ts": pd.to_datetime(["2024-01-01 00:01", "2024-01-01 00:00", "2024-01-01 00:00", "2024-01-01 00:01"]),
+        "sensor": ["b", "a", "b", "b"],
+        "r": [3.0, 1.0, 2.0, 4.0],
+    })
+
+
+def test_pivot_sorts_and_keeps_the_last_duplicate():
+    wide = figures.pivot(long_frame(), "ts", "sensor", ["r"])
+    assert wide.columns == ["a", "b"]
+    assert wide.index.is_monotonic_increasing
+    np.testing.assert_array_equal(wide.arrays["r"], [[1.0, 2.0], [np.nan, 4.0]])
+
+
+def test_series_skip_the_missing_readings():
+    wide = figures.pivot(long_frame(), "ts", "sensor", ["r"])
+    series = {column: (x, y) for column, x, y in wide.series("r")}
+    assert len(series["a"][0]) == 1 and series["a"][1].tolist() == [1.0]
+    assert series["b"][1].tolist() == [2.0, 4.0]
+
+
+def test_traces_one_per_column():
+    wide = figures.pivot(long_frame(), "ts", "sensor", ["r"])
+    traces = figures.traces(wide, "r", mode="lines")
+    assert [trace.name for trace in traces] == ["a", "b"]
+    assert traces[1].mode == "lines"
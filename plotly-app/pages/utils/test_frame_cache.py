@@ -0,0 +1,70 @@
+import decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pages.utils import frame_cache
+
+
+def roundtrip(value):
+    return frame_cache.loads(frame_cache.dumps(value))
+
+
+def test_roundtrip_keeps_values_and_dtypes():
+    df = pd.DataFrame({
+        "f64": [1.5, np.nan, 3.0],
+        "f32": np.array([1, 2, 3], dtype=np.float32),
+        "i": np.array([1, 2, 3], dtype=np.int16),
+        "b": [True, False, True],
+        "ts": pd.date_range("2024-03-31", periods=3, freq="h"),
+        "ts_local": pd.date_range("2024-03-31", periods=3, freq="h", tz="Europe/Rome"),
+        "nullable": pd.array([1, None, 3], dtype="Int64"),
+        "cat": pd.Categorical(["a", "b", "a"], ordered=True),
+    })
+    out = roundtrip(df)
+    pd.testing.assert_frame_equal(out, df)
+
+
+def test_string_columns_come_back_with_their_dtype():
+    # a hit must return what a miss returns
+    df = pd.DataFrame({
+        "obj": pd.Series(["a", None, "b"], dtype=object),
+        "str": pd.Series(["a", "b", None]),
+        "string": pd.Series(["a", None, "c"], dtype="string"),
+    })
+    out = roundtrip(df)
+    assert out.dtypes.to_dict() == df.dtypes.to_dict()
+    assert (out["str"] == "a").tolist() == [True, False, False]
+
+
+def test_decimal_columns_are_floats():
+    df = pd.DataFrame({"d": [decimal.Decimal("1.5"), decimal.Decimal("2")]})
+    assert roundtrip(df)["d"].tolist() == [1.5, 2.0]
+
+
+def test_index_and_containers():
+    df = pd.DataFrame({"v": [1.0, 2.0]}, index=pd.Index(["x", "y"], name="k"))
+    out = roundtrip((df, df.reset_index()))
+    assert isinstance(out, tuple)
+    pd.testing.assert_frame_equal(out[0], df)
+    pd.testing.assert_frame_equal(out[1], df.reset_index())
+    ranged = pd.DataFrame({"v": [1.0, 2.0]}, index=pd.RangeIndex(10, 14, 2))
+    pd.testing.assert_frame_equal(roundtrip(ranged), ranged)
+
+
+@pytest.mark.parametrize("value", [{"a": 1}, pd.DataFrame({"o": [object()]})])
+def test_anything_else_is_pickled(value):
+    data = frame_cache.dumps(value)
+    assert data.startswith(frame_cache.PICKLED)
+    assert type(frame_cache.loads(data)) is type(value)
+
+
+def test_read_after_other_data(tmp_path):
+    path = tmp_path / "frame"
+    with open(path, "wb") as f:
+        f.write(b"xyz")
+        frame_cache.write(pd.DataFrame({"v": np.arange(5.0)}), f, start=3)
+    data = path.read_bytes()
+    out = frame_cache.read(memoryview(data), base=3)
+    assert out["v"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from pages.utils import health
+
+
+def readings(sensor, signal_res, start="2024-01-01 00:00", freq="1min", **values):
+    ts = pd.date_range(start, periods=len(signal_res), freq=freq, tz="UTC")
+    df = pd.DataFrame({"node_id": 1, "sensor_description": sensor, "ts": ts, "signal_res": signal_res})
+    df["heater_res"] = values.get("heater_res", 100.0)
+    df["volt"] = values.get("volt", 1.0)
+    return df
+
+
+def test_assess_flags_per_sensor():
+    df = pd.concat([
+        readings("flat", [5.0] * 30),
+        readings("moving", [float(i) + 1 for i in range(30)]),
+        readings("stuck", [1.0, 2.0] + [3.0] * 20),
+        readings("hot", [1.0, 2.0, 3.0], volt=9.0),
+    ])
+    stats = health.assess(df.sample(frac=1, random_state=0))
+    assert stats.loc[(1, "flat"), "saturated"]
+    assert not stats.loc[(1, "moving"), "saturated"]
+    assert stats.loc[(1, "moving"), "longest_flat"] == pd.Timedelta(0)
+    assert stats.loc[(1, "stuck"), "longest_flat"] == pd.Timedelta(minutes=19)
+    assert stats.loc[(1, "hot"), "out_of_range"]
+    assert not stats.loc[(1, "moving"), "out_of_range"]
+    assert stats.loc[(1, "moving"), "readings"] == 30
+
+
+def test_assess_measures_gaps_within_a_sensor_only():
+    df = pd.concat([
+        readings("a", [1.0, 2.0]),
+        readings("a", [3.0], start="2024-01-01 00:10"),
+        readings("b", [1.0], start="2024-01-01 05:00"),
+    ])
+    stats = health.assess(df)
+    assert stats.loc[(1, "a"), "max_gap"] == pd.Timedelta(minutes=9)
+    assert stats.loc[(1, "b"), "max_gap"] == pd.Timedelta(0)
+
+
+def test_assess_of_nothing():
+    assert health.assess(pd.DataFrame(columns=health.COLUMNS)).empty
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pages.utils import inference
+
+TILE = inference.TILE
+
+
+def test_tile_range_stops_at_a_boundary_end():
+    start = inference.EPOCH + 10 * TILE
+    assert list(inference.tile_range(start, start + TILE)) == [10]
+    assert list(inference.tile_range(start, start)) == [10]
+    assert list(inference.tile_range(start - pd.Timedelta(seconds=1), start + TILE)) == [9, 10]
+
+
+def test_predict_batches_pads_the_last_batch():
+    shapes = []
+
+    def predict(rows):
+        shapes.append(rows.shape)
+        return rows[:, :1].repeat(len(inference.OUTPUTS), axis=1)
+
+    features = np.arange(10.0).reshape(5, 2)
+    out = inference.predict_batches(predict, features, batch_size=2)
+    # every call sees the same shape, the padding is dropped
+    assert shapes == [(2, 2)] * 3
+    assert out.shape == (5, len(inference.OUTPUTS))
+    assert out[:, 0].tolist() == [0.0, 2.0, 4.0, 6.0, 8.0]
+
+
+def test_predict_batches_of_nothing():
+    out = inference.predict_batches(lambda rows: rows, np.empty((0, 2)))
+    assert out.shape == (0, len(inference.OUTPUTS))
+
+
+@pytest.fixture
+def service(tmp_path):
+    loads = []
+
+    def load(node, start, end):
+        loads.append((start, end))
+        ts = pd.date_range(start, end, freq="6h")
+        return pd.DataFrame({"ts": ts, "x": np.arange(len(ts), dtype=float)})
+
+    def predict(rows):
+        return np.repeat(rows, len(inference.OUTPUTS), axis=1)
+
+    svc = inference.InferenceService(predict, load, model="test", directory=str(tmp_path), batch_size=4)
+    svc.loads = loads
+    return svc
+
+
+def test_predictions_are_cached_per_tile(service):
+    start = inference.EPOCH + 10 * TILE
+    df = service.predictions(1, start, start + 2 * TILE)
+    assert len(service.loads) == 1
+    assert len(df) == 8 and df["ts"].max() < start + 2 * TILE
+    service.predictions(1, start, start + 2 * TILE)
+    assert len(service.loads) == 1
+
+
+def test_invalidate_drops_the_tile_of_a_reading_on_its_start(service):
+    start = inference.EPOCH + 10 * TILE
+    service.predictions(1, start, start + 2 * TILE)
+    service.invalidate(1, start + TILE, start + TILE)
+    service.predictions(1, start, start + 2 * TILE)
+    assert service.loads[-1][0] == start + TILE
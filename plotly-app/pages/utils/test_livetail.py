@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pages.utils import livetail, planner
+
+
+def frame(ts, packet_ids=None):
+    ts = pd.to_datetime(ts).astype("datetime64[ns]")
+    return pd.DataFrame({
+        "packet_id": packet_ids if packet_ids is not None else np.arange(len(ts)),
+        "ts": ts,
+    })
+
+
+def test_ring_buffer_appends_grows_and_evicts():
+    buffer = livetail.RingBuffer(capacity=2)
+    buffer.append(frame(["2024-01-01 00:00", "2024-01-01 00:01"]))
+    buffer.append(frame(["2024-01-01 00:02", "2024-01-01 00:03"], [2, 3]))
+    assert len(buffer) == 4
+    buffer.evict(np.datetime64("2024-01-01T00:02"))
+    assert buffer.frame(np.datetime64("2024-01-01T00:00"))["packet_id"].tolist() == [2, 3]
+    assert buffer.latest() == np.datetime64("2024-01-01T00:03")
+
+
+def test_ring_buffer_frame_since():
+    buffer = livetail.RingBuffer()
+    assert buffer.frame(np.datetime64("2024-01-01")).empty
+    assert buffer.latest() is None
+    buffer.append(frame(["2024-01-01 00:00", "2024-01-01 00:05"]))
+    assert len(buffer.frame(np.datetime64("2024-01-01T00:05"))) == 1
+
+
+def reading(packet_id, sensor_id, ts):
+    row = dict(packet_id=packet_id, sensor_id=sensor_id, node_id=1,
+               sensor_description=f"s{sensor_id}", ts=ts)
+    return {**row, **{column: 1.0 for column in planner.FBK_COLUMNS}}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """
+    The rows the poll query returns, every row from `since` on
+    """
+    rows = []
+    monkeypatch.setattr(
+        livetail, "load_data_from_psql",
+        lambda query: pd.DataFrame([r for r in rows if r["ts"] >= query.params[0]]),
+    )
+    return rows
+
+
+def test_poll_keeps_late_commits_once(table):
+    now = pd.Timestamp.now(tz="UTC").floor("s")
+    table += [reading(1, 1, now - pd.Timedelta("5min")), reading(3, 1, now - pd.Timedelta("2min"))]
+    tail = livetail.LiveTail([1])
+    assert tail.poll() == 2
+    # packet 2 committed after packet 3, and a packet_data row landed late
+    table += [reading(2, 1, now - pd.Timedelta("3min")), reading(3, 2, now - pd.Timedelta("2min"))]
+    assert tail.poll() == 2
+    assert tail.poll() == 0
+    df = tail.period("last hour")
+    assert len(df) == 4
+    assert df["ts"].is_monotonic_increasing
+    assert tail.latest(1) == now - pd.Timedelta("2min")
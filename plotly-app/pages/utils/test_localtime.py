@@ -0,0 +1,40 @@
+import pandas as pd
+
+from pages.utils import localtime
+
+
+def test_to_local_follows_dst():
+    utc = pd.Series(pd.to_datetime([
+        "2024-01-15 12:00",  # CET
+        "2024-07-15 12:00",  # CEST
+        "2024-03-31 00:59",  # just before the spring change
+        "2024-03-31 01:00",  # just after it
+    ], utc=True))
+    local = localtime.to_local(utc)
+    assert str(local.dt.tz) == localtime.DISPLAY_TZ
+    assert localtime.wall(local).dt.strftime("%H:%M").tolist() == ["13:00", "14:00", "01:59", "03:00"]
+
+
+def test_to_local_takes_naive_values_and_strings_as_utc():
+    expected = localtime.to_local(pd.Series([pd.Timestamp("2024-07-15 12:00", tz="UTC")]))
+    assert localtime.to_local(["2024-07-15 12:00"]).equals(expected)
+    assert localtime.to_local(pd.Series([pd.Timestamp("2024-07-15 12:00")])).equals(expected)
+
+
+def test_wall_drops_only_the_zone():
+    index = pd.DatetimeIndex(["2024-07-15 14:00"]).tz_localize(localtime.DISPLAY_TZ)
+    assert localtime.wall(index)[0] == pd.Timestamp("2024-07-15 14:00")
+    naive = pd.Series(pd.to_datetime(["2024-07-15 14:00"]))
+    assert localtime.wall(naive) is naive
+
+
+def test_to_utc_round_trips_wall_times():
+    assert localtime.to_utc("2024-07-15 14:00") == pd.Timestamp("2024-07-15 12:00", tz="UTC")
+    assert localtime.to_utc("2024-01-15 13:00") == pd.Timestamp("2024-01-15 12:00", tz="UTC")
+
+
+def test_to_utc_on_dst_changes():
+    # 02:30 does not exist on the spring change: moved forward to 03:00 CEST
+    assert localtime.to_utc("2024-03-31 02:30") == pd.Timestamp("2024-03-31 01:00", tz="UTC")
+    # 02:30 happens twice on the autumn change: the summer time one
+    assert localtime.to_utc("2024-10-27 02:30") == pd.Timestamp("2024-10-27 00:30", tz="UTC")
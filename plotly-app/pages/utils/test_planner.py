@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from pages.utils import planner, rollups
+
+
+@pytest.fixture
+def with_rollups(monkeypatch):
+    monkeypatch.setattr(rollups, "available", lambda: True)
+
+
+@pytest.fixture
+def without_rollups(monkeypatch):
+    monkeypatch.setattr(rollups, "available", lambda: False)
+
+
+def test_bucket_size():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert planner.bucket_size(start, start + timedelta(days=1), 1440) == 60
+    # rounded up, so there are never more than `points` buckets
+    assert planner.bucket_size(start, start + timedelta(seconds=1001), 10) == 101
+    assert planner.bucket_size(start, start, 10) == 1
+
+
+def test_bucket_size_takes_naive_values_as_utc():
+    naive = pd.Timestamp("2024-01-01 00:00")
+    aware = pd.Timestamp("2024-01-01 02:00", tz="Europe/Rome")  # 01:00 UTC
+    assert planner.bucket_size(naive, aware, 60) == 60
+
+
+def test_pick_raw(without_rollups):
+    assert planner._pick(30, rollups.FBK_RESOLUTIONS, planner.FBK_RAW_STEP) == ("raw", 0)
+    # raw buckets are rounded up to a multiple of the raw step
+    assert planner._pick(90, rollups.FBK_RESOLUTIONS, planner.FBK_RAW_STEP) == ("raw", 120)
+    assert planner._pick(86400, rollups.FBK_RESOLUTIONS, planner.FBK_RAW_STEP) == ("raw", 86400)
+
+
+def test_pick_rollup(with_rollups):
+    pick = lambda bucket: planner._pick(bucket, rollups.FBK_RESOLUTIONS, planner.FBK_RAW_STEP)
+    assert pick(3600) == ("1h", 3600)
+    # up to ROLLUP_SLACK times coarser than the bucket
+    assert pick(2500) == ("1h", 3600)
+    # a multiple of the rollup, so its rows never straddle two buckets
+    assert pick(4000) == ("1h", 7200)
+    # no rollup close enough: raw data re-bucketed
+    assert pick(1000) == ("raw", 1020)
+
+
+def test_plan_fbk(with_rollups):
+    end = datetime(2024, 1, 8, tzinfo=timezone.utc)
+    plan = planner.plan_fbk(end - timedelta(days=30), end, nodes=[1])
+    assert plan.source == "30min"
+    assert plan.bucket_seconds == 1800
+    assert plan.query.params[-1] == plan.bucket_seconds
+    raw = planner.plan_fbk(end - timedelta(hours=1), end, nodes=[1])
+    assert (raw.source, raw.bucket_seconds) == ("raw", 0)
@@ -0,0 +1,77 @@
+import time
+
+import diskcache
+import pandas as pd
+import pytest
+
+from pages.utils import refresher
+from pages.utils.frame_cache import FrameFileSystemCache
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(refresher, "_values", FrameFileSystemCache(str(tmp_path / "values"), threshold=0))
+    monkeypatch.setattr(refresher, "_state", diskcache.Cache(str(tmp_path / "state")))
+    monkeypatch.setattr(refresher, "_datasets", {})
+    # no scheduler thread: the tests drive the loads
+    monkeypatch.setattr(refresher, "start", lambda: None)
+
+
+def counting_loader(calls, fail=False):
+    def load():
+        calls.append(1)
+        if fail:
+            raise ValueError("no database")
+        return pd.DataFrame({"v": [1.0, 2.0]})
+
+    return load
+
+
+def test_first_read_loads_then_serves_the_copy():
+    calls = []
+    refresher.register("d", counting_loader(calls), every=3600)
+    assert refresher.get("d")["v"].tolist() == [1.0, 2.0]
+    assert refresher.get("d")["v"].tolist() == [1.0, 2.0]
+    assert len(calls) == 1
+    assert refresher.age("d") < 60
+
+
+def test_expire_keeps_serving_the_copy():
+    calls = []
+    refresher.register("d", counting_loader(calls), every=3600)
+    refresher.get("d")
+    refresher.expire("d")
+    assert refresher.age("d") is None
+    assert refresher.get("d") is not None
+    assert len(calls) == 1
+
+
+def test_failed_first_read_raises_then_backs_off():
+    calls = []
+    refresher.register("d", counting_loader(calls, fail=True), every=3600)
+    with pytest.raises(ValueError):
+        refresher.get("d")
+    with pytest.raises(refresher.RefreshError, match="no database"):
+        refresher.get("d")
+    assert len(calls) == 1
+
+
+def test_backoff_doubles_up_to_the_max(monkeypatch):
+    monkeypatch.setattr(refresher, "RETRY_MAX", 25)
+    refresher.register("d", counting_loader([], fail=True), every=3600)
+    waits = []
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            refresher.refresh("d")
+        waits.append(round(refresher._state.get(("retry_at", "d")) - time.time()))
+    assert waits == [refresher.RETRY_AFTER, 2 * refresher.RETRY_AFTER, 25]
+
+
+def test_a_success_clears_the_backoff():
+    calls = []
+    refresher.register("d", counting_loader(calls, fail=True), every=3600)
+    with pytest.raises(ValueError):
+        refresher.refresh("d")
+    refresher.register("d", counting_loader(calls), every=3600)
+    assert refresher.refresh("d")
+    assert not refresher._backing_off("d")
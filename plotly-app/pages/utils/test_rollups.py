@@ -0,0 +1,20 @@
+import pandas as pd
+
+from pages.utils import rollups
+
+
+def test_buckets_start_on_a_monday():
+    assert pd.Timestamp(rollups.BUCKET_ORIGIN, unit="s").day_name() == "Monday"
+
+
+def test_every_bucket_size_divides_a_week():
+    # so every bucket boundary is one of the coarser sizes' too
+    for seconds in [*rollups.FBK_RESOLUTIONS.values(), *rollups.APPA_RESOLUTIONS.values()]:
+        assert (7 * 86400) % seconds == 0
+
+
+def test_bucket_sql():
+    assert rollups.bucket_sql("ts", "$5") == (
+        f"to_timestamp(floor((extract(epoch from ts) - {rollups.BUCKET_ORIGIN}) / $5)"
+        f" * $5 + {rollups.BUCKET_ORIGIN})"
+    )
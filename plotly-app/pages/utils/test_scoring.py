@@ -0,0 +1,34 @@
+import math
+
+import pandas as pd
+
+from pages.utils import planner, scoring
+
+
+def test_prediction_plans_filter_by_model():
+    start = pd.Timestamp("2024-01-01", tz="UTC")
+    raw = planner.plan_predictions(start, start + pd.Timedelta(hours=1), "m1", nodes=[3])
+    assert raw.bucket_seconds == 0
+    assert "model = $4" in raw.query.statement.sql and raw.query.params[3] == "m1"
+    hourly = planner.plan_predictions(start, start + pd.Timedelta(days=1), "m1", bucket_seconds=3600)
+    assert hourly.bucket_seconds == 3600
+    assert hourly.query.params[3:] == ("m1", 3600)
+
+
+def test_scored_until(monkeypatch):
+    seen = []
+
+    def load(query):
+        seen.append(query.params)
+        return pd.DataFrame({"ts": [pd.Timestamp("2024-01-01 10:30", tz="UTC") if query.params[0] == 1 else pd.NaT]})
+
+    monkeypatch.setattr(scoring, "load_data_from_psql", load)
+    end = pd.Timestamp("2024-01-02", tz="UTC")
+    assert scoring.scored_until(1, "m1", end) == pd.Timestamp("2024-01-01 10:30", tz="UTC")
+    assert scoring.scored_until(2, "m1", end) is None
+    assert seen[0] == (1, "m1", end)
+
+
+def test_nan_outputs_are_stored_as_null():
+    assert scoring._value(math.nan) is None
+    assert scoring._value(1.5) == 1.5
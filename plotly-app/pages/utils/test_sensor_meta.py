@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pages.utils import querys, sensor_meta
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """
+    The sensor table the queries return
+    """
+    state = {"rows": [
+        dict(node_id=1, name="a", active=True, attrs={"active since": "2024-01-10 08:00"}),
+        dict(node_id=1, name="b", active=True, attrs={"active since": "2024-02-01"}),
+        dict(node_id=1, name="c", active=False, attrs={"active since": "2024-01-10 08:00"}),
+        dict(node_id=1, name="d", active=True, attrs={}),
+        dict(node_id=6, name="a", active=True, attrs={"active since": "2023-05-01"}),
+    ], "fingerprint": "v1", "loads": 0}
+
+    def load(query):
+        if query is querys.query_sensor_fingerprint:
+            return pd.DataFrame({"md5": [state["fingerprint"]]})
+        assert query is querys.query_history_sensor
+        state["loads"] += 1
+        return pd.DataFrame(state["rows"])
+
+    monkeypatch.setattr(sensor_meta, "load_data_from_psql", load)
+    return state
+
+
+def test_changes_are_distinct_and_sorted(table):
+    meta = sensor_meta.SensorMeta([1, 6])
+    np.testing.assert_array_equal(
+        meta.changes(1),
+        np.array(["2024-01-10T08:00", "2024-02-01T00:00"], dtype="datetime64[ns]"),
+    )
+    assert len(meta.changes(42)) == 0
+
+
+def test_changes_strictly_within_the_window(table):
+    meta = sensor_meta.SensorMeta([1])
+    assert len(meta.changes(1, "2024-01-10 08:00", "2024-02-01")) == 0
+    assert len(meta.changes(1, "2024-01-10", "2024-02-02")) == 2
+    # tz-aware bounds are compared by wall time
+    assert len(meta.changes(1, pd.Timestamp("2024-01-20", tz="Europe/Rome"))) == 1
+
+
+def test_active_sensors(table):
+    meta = sensor_meta.SensorMeta([1])
+    assert sorted(meta.active(1).index) == ["a", "b", "d"]
+    assert meta.active(42).empty
+
+
+def test_sensors_reload_only_when_the_fingerprint_changes(table, monkeypatch):
+    monkeypatch.setattr(sensor_meta, "CHECK_EVERY", 0)
+    meta = sensor_meta.SensorMeta([1])
+    meta.sensors()
+    meta.sensors()
+    assert table["loads"] == 1
+    table["fingerprint"] = "v2"
+    table["rows"] = table["rows"][:1]
+    assert len(meta.sensors()) == 1
+    assert table["loads"] == 2
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import diskcache
+import pandas as pd
+import pytest
+
+from pages.utils import singleflight
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "LOCK_DIR", str(tmp_path))
+    monkeypatch.setattr(singleflight, "_locks", diskcache.Cache(str(tmp_path / "locks")))
+    monkeypatch.setattr(singleflight, "_results", diskcache.Cache(str(tmp_path / "results")))
+
+
+def slow_load(calls, delay=0.3):
+    def load():
+        calls.append(1)
+        time.sleep(delay)
+        return pd.DataFrame({"v": [1, 2]}, dtype="int32")
+
+    return load
+
+
+def run_together(*targets):
+    threads = []
+    results = [None] * len(targets)
+    for i, target in enumerate(targets):
+        def run(i=i, target=target):
+            results[i] = target()
+
+        threads.append(threading.Thread(target=run))
+        threads[-1].start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_load():
+    calls = []
+    load = slow_load(calls)
+    results = run_together(*[lambda: singleflight.do("k", load)] * 3)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_queued_workers_get_the_result_with_its_dtypes():
+    # two _load calls stand for two workers queued on the same key
+    calls = []
+    load = slow_load(calls)
+    first, second = run_together(
+        lambda: singleflight._load("k", load, (), {}),
+        lambda: singleflight._load("k", load, (), {}),
+    )
+    assert len(calls) == 1
+    assert second["v"].dtype == first["v"].dtype == "int32"
+    # nothing is kept for later calls
+    singleflight._load("k", load, (), {})
+    assert len(calls) == 2
+
+
+def test_waiting_too_long_loads_directly(monkeypatch):
+    monkeypatch.setattr(singleflight, "WAIT_TIMEOUT", 0.05)
+    calls = []
+    load = slow_load(calls)
+    run_together(
+        lambda: singleflight._load("k", load, (), {}),
+        lambda: singleflight._load("k", load, (), {}),
+    )
+    assert len(calls) == 2
+    assert singleflight.stats()["timeouts"] >= 1
+
+
+def test_errors_reach_every_waiting_call():
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            singleflight.do("k", fail)
+        except ValueError as e:
+            return e
+
+    errors = run_together(call, call)
+    assert all(isinstance(e, ValueError) for e in errors)
@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from pages.utils import planner, tiles
+
+SPAN = pd.Timedelta(seconds=tiles.tile_span("30min"))
+
+
+def test_tile_range_stops_at_a_boundary_end():
+    start = tiles.EPOCH + 10 * SPAN
+    assert list(tiles.tile_range(start, start + SPAN, "30min")) == [10]
+    assert list(tiles.tile_range(start, start + SPAN + pd.Timedelta(seconds=1), "30min")) == [10, 11]
+    assert list(tiles.tile_range(start + pd.Timedelta(seconds=1), start + 2 * SPAN, "30min")) == [10, 11]
+
+
+def test_tile_range_of_an_empty_window_is_its_tile():
+    start = tiles.EPOCH + 10 * SPAN
+    assert list(tiles.tile_range(start, start, "30min")) == [10]
+
+
+def test_tile_range_takes_naive_values_as_utc():
+    aware = tiles.EPOCH + 10 * SPAN
+    naive = aware.tz_localize(None)
+    assert tiles.tile_range(naive, naive + SPAN, "30min") == tiles.tile_range(aware, aware + SPAN, "30min")
+
+
+def test_tile_bounds():
+    assert tiles.tile_bounds(3, "30min") == (tiles.EPOCH + 3 * SPAN, tiles.EPOCH + 4 * SPAN)
+
+
+def test_pick_resolution():
+    end = pd.Timestamp("2024-01-01", tz="UTC")
+    assert tiles.pick_resolution(end - pd.Timedelta(hours=1), end) == "raw"
+    assert tiles.pick_resolution(end - pd.Timedelta(days=90), end) == "30min"
+    assert tiles.pick_resolution(end - pd.Timedelta(days=3650), end) == "1d"
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """
+    Replaces the planner load by one reading per bucket, recording the calls
+    """
+    calls = []
+
+    def load_fbk(start, end, nodes, bucket_seconds):
+        calls.append((start, end))
+        ts = pd.date_range(start, end, freq=pd.Timedelta(seconds=bucket_seconds))
+        df = pd.DataFrame({"node_id": nodes[0], "sensor_description": "a", "ts": ts})
+        for column in planner.FBK_COLUMNS:
+            df[column] = 1.0
+        return df
+
+    monkeypatch.setattr(planner, "load_fbk", load_fbk)
+    return calls
+
+
+def test_window_fetches_missing_tiles_once(tmp_path, loads):
+    cache = tiles.TileCache(str(tmp_path))
+    start = tiles.EPOCH + 10 * SPAN
+    end = start + 2 * SPAN
+    df = cache.window(1, start, end, points=1000)
+    # two tiles in one query, not the one starting at end
+    assert loads == [(start, end - pd.Timedelta(microseconds=1))]
+    assert df["ts"].min() == start and df["ts"].max() < end
+    assert len(df) == 2 * tiles.TILE_POINTS
+    cache.window(1, start, end, points=1000)
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_invalidate_drops_the_tile_of_a_reading_on_its_start(tmp_path, loads):
+    cache = tiles.TileCache(str(tmp_path))
+    start = tiles.EPOCH + 10 * SPAN
+    cache.window(1, start, start + 2 * SPAN, points=1000)
+    cache.invalidate(1, start + SPAN, start + SPAN)
+    cache.window(1, start, start + 2 * SPAN, points=1000)
+    assert loads[-1] == (start + SPAN, start + 2 * SPAN - pd.Timedelta(microseconds=1))
+
+
+def test_load_assembles_the_nodes_sorted_by_ts(tmp_path, loads):
+    cache = tiles.TileCache(str(tmp_path))
+    start = tiles.EPOCH + 10 * SPAN
+    df = cache.load([2, 1], start, start + SPAN, points=1000, transform=lambda df: df.assign(seen=True))
+    assert sorted(df["node_id"].unique()) == [1, 2]
+    assert len(df) == 2 * tiles.TILE_POINTS
+    assert df["ts"].is_monotonic_increasing
+    assert df["seen"].all()
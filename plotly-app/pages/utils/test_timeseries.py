@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from pages.utils import timeseries
+
+
+def series(n=10, freq="30min"):
+    df = pd.DataFrame({
+        "ts": pd.date_range("2024-01-01", periods=n, freq=freq, tz="UTC"),
+        "v": np.arange(n, dtype=float),
+        "sensor_description": ["a", "b"] * (n // 2),
+    })
+    return timeseries.TimeSeries(df.iloc[::-1])
+
+
+def test_frame_is_sorted():
+    assert series().frame["ts"].is_monotonic_increasing
+
+
+def test_window_bounds():
+    ts = series()
+    start, end = pd.Timestamp("2024-01-01 01:00", tz="UTC"), pd.Timestamp("2024-01-01 02:00", tz="UTC")
+    # start excluded, end included
+    assert ts.window(start, end)["v"].tolist() == [3.0, 4.0]
+    assert len(ts.window()) == 10
+    assert ts.window(end=start)["v"].tolist() == [0.0, 1.0, 2.0]
+
+
+def test_last():
+    ts = series()
+    assert ts.last("1h")["v"].tolist() == [8.0, 9.0]
+    empty = timeseries.TimeSeries(series().frame.iloc[:0])
+    assert empty.last("1h").empty
+
+
+def test_resample_by_group():
+    df = series(n=8).resample("1h", by="sensor_description")
+    assert len(df) == 8
+    assert df[df["sensor_description"] == "a"]["v"].tolist() == [0.0, 2.0, 4.0, 6.0]
+    assert series(n=8).resample("2h", span="1h")["v"].tolist() == [6.5]
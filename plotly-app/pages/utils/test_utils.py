@@ -0,0 +1,48 @@
+import logging
+
+import pandas as pd
+
+from pages.utils import localtime, utils
+
+
+def raw_fbk():
+    return pd.DataFrame({
+        "node_id": [1, 1, 1, 6],
+        "sensor_description": ["a", "a", "b", "a"],
+        "ts": pd.to_datetime(["2024-07-01 10:00", "2024-07-01 10:00", "2024-07-01 10:00", "2024-07-01 10:00"], utc=True),
+        "heater_res": [1.0, 1.0, 2.0, 3.0],
+        "signal_res": [1e6, 1e6, 2e6, 3e6],
+        "volt": [1.0, 1.0, 2.0, 3.0],
+        "p": 1000.0,
+        "t": 20.0,
+        "rh": 50.0,
+    })
+
+
+def test_filter_fbk_data_casts_to_the_schema():
+    df = utils.filter_fbk_data(raw_fbk())
+    assert {name: str(dtype) for name, dtype in df.dtypes.items()} == utils.FBK_SCHEMA
+    assert df["ts"].iloc[0] == pd.Timestamp("2024-07-01 12:00", tz=localtime.DISPLAY_TZ)
+
+
+def test_filter_fbk_data_drops_repeated_readings_only():
+    df = utils.filter_fbk_data(raw_fbk())
+    assert len(df) == 3
+    assert sorted(zip(df["node_id"], df["sensor_description"])) == [(1, "a"), (1, "b"), (6, "a")]
+
+
+def test_filter_fbk_data_logs_memory_when_debugging(caplog):
+    with caplog.at_level(logging.DEBUG, logger=utils.logger.name):
+        utils.filter_fbk_data(raw_fbk())
+    assert "FBK FRAME MEMORY" in caplog.text
+
+
+def test_fold_sum_count_matches_a_groupby_of_the_whole():
+    df = pd.DataFrame({"k": ["a", "b", "a", "c", "a"], "v": [1.0, 2.0, None, 4.0, 5.0]})
+    sums, counts = utils.fold_sum_count([df.iloc[:2], df.iloc[2:4], df.iloc[4:]], "k")
+    pd.testing.assert_frame_equal(sums / counts, df.groupby("k").mean(), check_dtype=False)
+    assert counts.loc["a", "v"] == 2
+
+
+def test_fold_sum_count_of_no_chunks():
+    assert utils.fold_sum_count([], "k") == (None, None)
@@ -0,0 +1,245 @@
+"""
+Time-tiled cache of FBK sensor series.
+
+Series are cached as fixed-size tiles keyed by (node, sensor, resolution,
+tile). A tile holds TILE_POINTS buckets of its resolution and is aligned on
+the epoch, so the same tile serves every window that overlaps it: periods,
+custom ranges and zooms are all assembled from tiles, and only the tiles not
+seen yet are fetched. Past tiles never change and never expire; only the
+tile holding "now" is refetched after LIVE_TTL seconds.
+
+The tiles live in a diskcache directory shared by every worker.
+"""
+import os
+import threading
+
+import diskcache
+import pandas as pd
+
+from . import planner
+
+# name -> bucket seconds (0: raw readings); 5min has no rollup, its tiles
+# average the raw readings
+RESOLUTIONS = {
+    "raw": 0,
+    "5min": 300,
+    "30min": 1800,
+    "3h": 3 * 3600,
+    "1d": 86400,
+}
+# buckets per tile (raw tiles assume one reading per FBK_RAW_STEP)
+TILE_POINTS = 720
+# seconds the tile holding "now" is kept before it is fetched again
+LIVE_TTL = 60
+# shared tile store, least recently used tiles evicted past the size limit
+TILES_DIR = os.getenv("TILES_DIR", "./cache_tiles")
+TILES_SIZE_LIMIT = int(os.getenv("TILES_SIZE_LIMIT", 2**30))
+
+EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def tile_span(resolution: str) -> int:
+    """
+    Seconds covered by one tile of the given resolution
+    """
+    return (RESOLUTIONS[resolution] or planner.FBK_RAW_STEP) * TILE_POINTS
+
+
+def pick_resolution(start, end, points: int = planner.DEFAULT_POINTS) -> str:
+    """
+    Coarsest resolution not (much) coarser than the bucket giving `points`
+    buckets between start and end (same rule as the planner)
+    """
+    bucket = planner.bucket_size(start, end, points)
+    resolution = "raw"
+    for name, seconds in sorted(RESOLUTIONS.items(), key=lambda item: item[1]):
+        if 0 < seconds <= bucket * planner.ROLLUP_SLACK:
+            resolution = name
+    return resolution
+
+
+def tile_range(start, end, resolution: str) -> range:
+    """
+    Indices of the tiles covering [start, end) (the tile of start if empty)
+    """
+    span = pd.Timedelta(seconds=tile_span(resolution))
+    first = int((planner._as_utc(start) - EPOCH) // span)
+    # ceil, so an end on a tile boundary does not add the next tile
+    stop = -int((EPOCH - planner._as_utc(end)) // span)
+    return range(first, max(stop, first + 1))
+
+
+def tile_bounds(tile: int, resolution: str) -> tuple:
+    span = pd.Timedelta(seconds=tile_span(resolution))
+    return EPOCH + tile * span, EPOCH + (tile + 1) * span
+
+
+class TileCache:
+    """
+    Tiles of the FBK sensor series. Every fetched tile also stores the list of
+    sensors it contained, under the (node, None, resolution, tile) key, so a
+    sensor missing from a tile is a hit too.
+
+    Args:
+        directory (str, optional): the diskcache directory. Defaults to TILES_DIR.
+        size_limit (int, optional): bytes stored before evicting. Defaults to TILES_SIZE_LIMIT.
+    """
+
+    def __init__(self, directory: str = TILES_DIR, size_limit: int = TILES_SIZE_LIMIT):
+        self._tiles = diskcache.Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+        # per worker, like db_utils.pool_stats
+        self._stats = {"hits": 0, "misses": 0, "fetches": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _get(self, key):
+        return self._tiles.get(key)
+
+    def _set(self, key, df, ttl=None):
+        self._tiles.set(key, df, expire=ttl)
+
+    def stats(self) -> dict:
+        """
+        Tile hits/misses of this worker and size of the shared store
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else None
+        stats["tiles"] = len(self._tiles)
+        stats["bytes"] = self._tiles.volume()
+        return stats
+
+    def clear(self):
+        self._tiles.clear()
+
+    def invalidate(self, node: int, start, end):
+        """
+        Drops the tiles of every resolution overlapping [start, end], after
+        readings were inserted there
+        """
+        # the reading at end belongs to the tile starting there
+        end = planner._as_utc(end) + pd.Timedelta(microseconds=1)
+        for resolution in RESOLUTIONS:
+            for tile in tile_range(start, end, resolution):
+                sensors = self._get((node, None, resolution, tile))
+                self._tiles.delete((node, None, resolution, tile))
+                for sensor in sensors or []:
+                    self._tiles.delete((node, sensor, resolution, tile))
+        self._count("invalidations")
+
+    def _fetch(self, node: int, resolution: str, tiles: list):
+        """
+        Loads a contiguous run of tiles with one query and stores them
+        """
+        self._count("fetches")
+        start, _ = tile_bounds(tiles[0], resolution)
+        _, end = tile_bounds(tiles[-1], resolution)
+        df = planner.load_fbk(
+            start,
+            end - pd.Timedelta(microseconds=1),
+            nodes=[node],
+            bucket_seconds=RESOLUTIONS[resolution],
+        )
+        df["ts"] = pd.to_datetime(df["ts"], utc=True)
+        span = pd.Timedelta(seconds=tile_span(resolution))
+        tile_of = (df["ts"] - EPOCH) // span
+        now = pd.Timestamp.now(tz="UTC")
+        for tile in tiles:
+            # the tile holding "now" is still growing
+            ttl = LIVE_TTL if tile_bounds(tile, resolution)[1] > now else None
+            in_tile = df[tile_of == tile]
+            sensors = []
+            for sensor, group in in_tile.groupby("sensor_description"):
+                self._set((node, sensor, resolution, tile), group.reset_index(drop=True), ttl)
+                sensors.append(sensor)
+            self._set((node, None, resolution, tile), sensors, ttl)
+
+    def _read(self, node: int, resolution: str, tile: int, sensors=None):
+        """
+        Returns the frames of one tile, None if any of them is missing
+        """
+        present = self._get((node, None, resolution, tile))
+        if present is None:
+            return None
+        frames = []
+        for sensor in present:
+            if sensors is not None and sensor not in sensors:
+                continue
+            df = self._get((node, sensor, resolution, tile))
+            if df is None:
+                return None
+            frames.append(df)
+        return frames
+
+    def window(self, node: int, start, end, points: int = planner.DEFAULT_POINTS, sensors=None) -> pd.DataFrame:
+        """
+        Returns the readings of a node with start <= ts < end, at the coarsest
+        resolution giving at least `points` per trace, fetching only the
+        tiles not cached yet
+
+        Args:
+            node (int): the node id
+            start, end: the window
+            points (int, optional): minimum points per trace
+            sensors (list, optional): sensor names to return. Defaults to all.
+
+        Returns:
+            pd.DataFrame: planner.load_fbk columns, sorted by ts
+        """
+        resolution = pick_resolution(start, end, points)
+        tiles = list(tile_range(start, end, resolution))
+
+        missing = [t for t in tiles if self._get((node, None, resolution, t)) is None]
+        self._count("misses", len(missing))
+        self._count("hits", len(tiles) - len(missing))
+        # one query per run of consecutive missing tiles
+        run = []
+        for tile in missing:
+            if run and tile != run[-1] + 1:
+                self._fetch(node, resolution, run)
+                run = []
+            run.append(tile)
+        if run:
+            self._fetch(node, resolution, run)
+
+        frames = []
+        for tile in tiles:
+            tile_frames = self._read(node, resolution, tile, sensors)
+            if tile_frames is None:
+                # partly evicted or expired meanwhile: fetch it again
+                self._fetch(node, resolution, [tile])
+                tile_frames = self._read(node, resolution, tile, sensors) or []
+            frames.extend(tile_frames)
+        if not frames:
+            return pd.DataFrame(columns=["node_id", "sensor_description", "ts"] + planner.FBK_COLUMNS)
+        df = pd.concat(frames, ignore_index=True).sort_values("ts", kind="stable")
+        start, end = planner._as_utc(start), planner._as_utc(end)
+        return df[(df["ts"] >= start) & (df["ts"] < end)].reset_index(drop=True)
+
+    def load(self, nodes, start, end, points: int = planner.DEFAULT_POINTS, sensors=None, transform=None) -> pd.DataFrame:
+        """
+        Assembles the readings of several nodes from tiles, see window
+
+        Args:
+            nodes (list): the node ids
+            transform (callable, optional): applied to the assembled frame
+
+        Returns:
+            pd.DataFrame: planner.load_fbk columns, sorted by ts
+        """
+        df = pd.concat(
+            [self.window(node, start, end, points, sensors) for node in nodes],
+            ignore_index=True,
+        ).sort_values("ts", kind="stable", ignore_index=True)
+        return transform(df) if transform else df
+
+
+fbk_tiles = TileCache()
@@ -0,0 +1,67 @@
+"""
+Time-indexed frames sliced by binary search.
+
+A TimeSeries sorts its frame by the time column once; a window is then two
+searchsorted calls on the timestamps and a positional slice of the frame (a
+view until written to, with copy-on-write).
+"""
+import pandas as pd
+
+
+class TimeSeries:
+    """
+    A frame kept sorted by its time column
+
+    Args:
+        df (pd.DataFrame): the data
+        ts (str, optional): the time column. Defaults to "ts".
+    """
+
+    def __init__(self, df: pd.DataFrame, ts: str = "ts"):
+        if not df[ts].is_monotonic_increasing:
+            df = df.sort_values(ts, kind="stable", ignore_index=True)
+        self.frame = df
+        self.ts = ts
+        self._index = pd.DatetimeIndex(df[ts])
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def window(self, start=None, end=None) -> pd.DataFrame:
+        """
+        Returns the rows with start < ts <= end (either bound optional)
+        """
+        first = 0 if start is None else self._index.searchsorted(start, side="right")
+        last = len(self) if end is None else self._index.searchsorted(end, side="right")
+        return self.frame.iloc[first:last]
+
+    def last(self, span) -> pd.DataFrame:
+        """
+        Returns the rows within `span` (e.g. "7D") of the latest timestamp,
+        like DataFrame.last on a time index
+        """
+        if not len(self):
+            return self.frame
+        return self.window(self._index[-1] - pd.Timedelta(span))
+
+    def resample(self, freq: str, span=None, by=None) -> pd.DataFrame:
+        """
+        Returns the mean of the numeric columns per `freq` bucket (and per
+        `by` group) of the last `span`
+
+        Args:
+            freq (str): the bucket frequency, e.g. "1h"
+            span (optional): the window, see last. Defaults to everything.
+            by (str | list, optional): further grouping columns. Defaults to
+                None.
+
+        Returns:
+            pd.DataFrame: the buckets, with the time column
+        """
+        by = [by] if isinstance(by, str) else list(by or [])
+        window = self.frame if span is None else self.last(span)
+        return (
+            window.groupby([pd.Grouper(key=self.ts, freq=freq), *by])
+            .mean(numeric_only=True)
+            .reset_index()
+        )
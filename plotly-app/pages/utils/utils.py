@@ -1,19 +1,65 @@
 import pandas as pd
+import logging
 import os
-from db_utils import load_data_from_psql
 from datetime import date
-from . import querys
+from . import planner, tiles, singleflight, localtime, timeseries
 
 # paths relative to THIS script
 FBK_FILE_PATH = "../../../FBK data/data_fbk_from_db.csv"
 APPA_FILE_PATH = "../../data/21_22_APPA.csv"
 PREDICTION_FILE_PATH = "../../data/appa1_predictions.csv"
 
+# dtypes of the normalised FBK frames: float32 where its 7 significant
+# digits are enough, float64 for the resistances (they span many decades)
+FBK_SCHEMA = {
+    "node_id": "category",
+    "sensor_description": "category",
+    "ts": f"datetime64[ns, {localtime.DISPLAY_TZ}]",
+    "heater_res": "float64",
+    "signal_res": "float64",
+    "volt": "float32",
+    "p": "float32",
+    "t": "float32",
+    "rh": "float32",
+}
+
+
+logger = logging.getLogger(__name__)
+
+
+def _memory(dataframe: pd.DataFrame) -> int:
+    return int(dataframe.memory_usage(deep=True).sum())
+
+
+def dedupe_fbk(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drops the repeated (node, sensor, ts) readings of a frame normalised by
+    filter_fbk_data, comparing integer keys: the category codes and the
+    timestamps as int64
+
+    Args:
+        dataframe (pd.DataFrame): the normalised data
+
+    Returns:
+        pd.DataFrame: the data without the repeated readings
+    """
+    sensors = dataframe["sensor_description"].cat
+    keys = pd.DataFrame(
+        {
+            "series": dataframe["node_id"].cat.codes.to_numpy(dtype="int64")
+            * (len(sensors.categories) + 1)
+            + sensors.codes.to_numpy(dtype="int64"),
+            "ts": pd.DatetimeIndex(dataframe["ts"]).asi8,
+        }
+    )
+    repeated = keys.duplicated().to_numpy()
+    return dataframe[~repeated] if repeated.any() else dataframe
 
 
 def filter_fbk_data(dataframe: pd.DataFrame) -> pd.DataFrame:
     """
-    Filters the data given as input
+    Normalises FBK data to FBK_SCHEMA in one cast (timestamps in the
+    displayed time zone) and drops the repeated readings
 
     Args:
         dataframe (pd.DataFrame): the starting dataframe
@@ -21,36 +67,21 @@ def filter_fbk_data(dataframe: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: the filtered dataframe
     """
-    #dataframe = dataframe.drop(
-    #    ["node_name", "g", "h", "th", "cfg", "iaq", "co2", "voc", "iac_comp"], axis=1
-    #)
-    dataframe["ts"] = pd.to_datetime(dataframe["ts"], utc=True)
-    # Set CEST Summer time zone
-    dataframe["ts"] += pd.Timedelta(hours=2)
-    dataframe["heater_res"] = dataframe["heater_res"].astype(float) 
-    dataframe["signal_res"] = dataframe["signal_res"].astype(float)
-    
-    #dataframe.rename(columns = {'heater_res':'signal_res', 'signal_res':'heater_res'}, inplace = True) #data are passed wrong in the db
-    
-    dataframe["volt"] = dataframe["volt"].astype(float)
-    dataframe["p"] = dataframe["p"].astype(float)
-    dataframe["t"] = dataframe["t"].astype(float)
-    dataframe["rh"] = dataframe["rh"].astype(float)
-    
-    #dataframe["sensor_description"] = (
-     #   dataframe["sensor_description"].str.split(pat="_").str.get(0)
-    #)
-    
-    #dataframe['sensor_description'] = dataframe.apply (lambda row: str(row['sensor_description'])+'_'+df_sensor.loc[int(row["sensor_description"])]["description"].split("_")[0] , axis=1)
-    """try:
-        dataframe['sensor_description'] = dataframe.apply (lambda row: row['sensor_description'].split('_')[0] +"_"+row['sensor_description'].split('_')[-1].split("-")[-1] ,axis=1)
-    except Exception as e:
-        print(e)
-        print("Usually this error with empty dataframe")"""
-        
-    dataframe.drop_duplicates(["sensor_description", "ts", "node_id"], inplace=True)
-
-    #print(dataframe)
+    # the deep memory scan is a pass over every object: only when debugging
+    measure = logger.isEnabledFor(logging.DEBUG)
+    before = _memory(dataframe) if measure else None
+    dataframe["ts"] = localtime.to_local(dataframe["ts"])
+    dataframe = dataframe.astype(
+        {name: dtype for name, dtype in FBK_SCHEMA.items() if name in dataframe}
+    )
+    dataframe = dedupe_fbk(dataframe)
+    if measure:
+        logger.debug(
+            "FBK FRAME MEMORY: %.2f MB -> %.2f MB (%d rows)",
+            before / 2**20,
+            _memory(dataframe) / 2**20,
+            len(dataframe),
+        )
     return dataframe
 
 
@@ -94,117 +125,111 @@ def get_prediction_data() -> pd.DataFrame:
         encoding="windows-1252",
     )
     
-def query_custom(start_date, end_date)-> pd.DataFrame:
-    
-    
-    if start_date is not None and end_date is not None:
-        start_date_object = date.fromisoformat(start_date)
-        end_date_object = date.fromisoformat(end_date)
-        
-        days_range = (end_date_object - start_date_object).days
-        
-        start_date_string = start_date_object.strftime('%Y-%m-%d')
-        
-        end_date_string = end_date_object.strftime('%Y-%m-%d')
-
-        if(days_range <= 3):
-            fbk_data = load_data_from_psql(querys.q_custom_all(start_date_string, end_date_string))
-            
-        elif(days_range > 3 and days_range <= 7):
-            fbk_data = load_data_from_psql(querys.q_custom_30min(start_date_string, end_date_string))
-            
-        elif(days_range > 7 and days_range <= 30):
-            fbk_data = load_data_from_psql(querys.q_custom_1H(start_date_string, end_date_string))
-            
-        elif(days_range > 30 and days_range <= 90):
-            fbk_data = load_data_from_psql(querys.q_custom_H(start_date_string, end_date_string, 2))
-            
-        elif(days_range > 90):
-            fbk_data = load_data_from_psql(querys.q_custom_H(start_date_string, end_date_string, 3))
-        
-    else:
-        return pd.DataFrame    
-    return filter_fbk_data(fbk_data)
+@singleflight.coalesce
+def query_custom(start_date, end_date, nodes=None, points=planner.DEFAULT_POINTS)-> pd.DataFrame:
+    """
+    Loads the FBK data of a custom date range, with about `points` points
+    per sensor trace (see planner). With nodes given the range is assembled
+    from the shared tile cache.
 
+    Args:
+        start_date (str): iso start date
+        end_date (str): iso end date
+        nodes (list, optional): node ids to load. Defaults to all.
+        points (int, optional): maximum points per trace
 
+    Returns:
+        pd.DataFrame: the filtered data
+    """
+    if start_date is None or end_date is None:
+        return pd.DataFrame()
+
+    start_date_object = date.fromisoformat(start_date)
+    end_date_object = date.fromisoformat(end_date)
+
+    if nodes is not None:
+        return tiles.fbk_tiles.load(
+            nodes, start_date_object, end_date_object, points, transform=filter_fbk_data
+        )
+
+    # bounded by `points` however long the range: fetched in one go
+    return planner.load_fbk(
+        start_date_object.strftime('%Y-%m-%d'),
+        end_date_object.strftime('%Y-%m-%d'),
+        nodes=nodes,
+        points=points,
+        transform=filter_fbk_data,
+    )
 
 
-def verify_period(period, df):
-    if period == "last 6 months":
-         # make hour average
-        df = df.groupby(
-            [pd.Grouper(key="ts", freq="3H"), pd.Grouper("sensor_description")]
-        ).mean(numeric_only=True)
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("180D")
-        df = df.reset_index()
-        return df
-    elif period == "last month":
-        # make hour average
-        df = df.groupby(
-            [pd.Grouper(key="ts", freq="1H"), pd.Grouper("sensor_description")]
-        ).mean(numeric_only=True)
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("30D")
-        df = df.reset_index()
-        return df
-    elif period == "last week":
-        # make hour average
-        df = df.groupby(
-            [pd.Grouper(key="ts", freq="1H"), pd.Grouper("sensor_description")]
-        ).mean(numeric_only=True)
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("7D")
-        df = df.reset_index()
-        return df
-    elif period == "last day":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("1D")
-        df = df.reset_index()
+def fold_sum_count(chunks, by) -> tuple:
+    """
+    Incremental groupby: accumulates the per-group sums and non-null counts
+    of the numeric columns chunk by chunk
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): the chunks to fold over
+        by: the groupby keys, or a callable returning them for a chunk
+
+    Returns:
+        tuple: (sums, counts) dataframes indexed by the group keys
+    """
+    sums, counts = None, None
+    for chunk in chunks:
+        groups = chunk.groupby(by(chunk) if callable(by) else by)
+        chunk_sums = groups.sum(numeric_only=True)
+        chunk_counts = groups.count()[chunk_sums.columns]
+        if sums is None:
+            sums, counts = chunk_sums, chunk_counts
+        else:
+            sums = sums.add(chunk_sums, fill_value=0)
+            counts = counts.add(chunk_counts, fill_value=0)
+    return sums, counts
+
+
+# period -> (window, resampling frequency or None)
+PERIOD_WINDOWS = {
+    "last 6 months": ("180D", "3h"),
+    "last month": ("30D", "1h"),
+    "last week": ("7D", "1h"),
+    "last day": ("1D", None),
+    "last hour": ("1h", None),
+}
+
+
+def _as_series(df) -> timeseries.TimeSeries:
+    if isinstance(df, timeseries.TimeSeries):
         return df
-    elif period == "last hour":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("1h")
-        df = df.reset_index()
+    return timeseries.TimeSeries(df)
+
 
-    return df
+def verify_period(period, df):
+    """
+    Restricts the data to the selected period, averaging it per sensor for
+    the longer ones
 
+    Args:
+        period (str): one of the dashboard periods
+        df (TimeSeries | pd.DataFrame): the data
 
-def verify_period_TPH(period, df):
-    if period == "last 6 months":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("180D")
-        df = df.reset_index()
-        return df
-    elif period == "last month":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("30D")
-        df = df.reset_index()
-        return df
-    elif period == "last week":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("7D")
-        df = df.reset_index()
-        return df
-    elif period == "last day":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("1D")
-        df = df.reset_index()
-        return df
-    elif period == "last hour":
-        df = df.reset_index()
-        df = df.set_index("ts")
-        df = df.last("1h")
-        df = df.reset_index()
+    Returns:
+        pd.DataFrame: the data of the period
+    """
+    series = _as_series(df)
+    if period not in PERIOD_WINDOWS:
+        return series.frame
+    span, freq = PERIOD_WINDOWS[period]
+    if freq is None:
+        return series.last(span)
+    return series.resample(freq, span, by="sensor_description")
 
-    return df
 
+def verify_period_TPH(period, df):
+    """
+    Restricts the temperature, pressure and humidity data to the selected
+    period, see verify_period
+    """
+    series = _as_series(df)
+    if period not in PERIOD_WINDOWS:
+        return series.frame
+    return series.last(PERIOD_WINDOWS[period][0])
@@ -0,0 +1,53 @@
+import re
+
+import pytest
+from psycopg2.extensions import adapt
+
+import db_utils
+from db_utils import BoundQuery, statement
+
+
+class Cursor:
+    """
+    Quotes parameters like a cursor's mogrify, without a connection
+    """
+
+    def mogrify(self, template, params):
+        return adapt(params[0]).getquoted()
+
+
+def test_inline_quotes_placeholders():
+    query = statement("test_inline", "select * from t where a = $1 and b = $2", ("text", "integer"))
+    sql = db_utils._inline(Cursor(), query("x'y", 3))
+    assert sql == "select * from t where a = 'x''y' and b = 3"
+
+
+def test_inline_keeps_literals_identifiers_and_comments():
+    query = statement(
+        "test_inline_quoted",
+        """select '$1', "$1", 'it''s $2' -- $1
+from t where a = $1""",
+        ("integer",),
+    )
+    sql = db_utils._inline(Cursor(), query(7))
+    assert sql == """select '$1', "$1", 'it''s $2' -- $1
+from t where a = 7"""
+
+
+def test_inline_passes_plain_sql_through():
+    assert db_utils._inline(Cursor(), "select 1") == "select 1"
+
+
+def test_statement_checks_parameter_count():
+    query = statement("test_count", "select $1", ("integer",))
+    assert isinstance(query(1), BoundQuery)
+    with pytest.raises(TypeError):
+        query()
+
+
+def test_statement_names_are_identifiers():
+    # PREPARE takes an unquoted identifier
+    from pages.utils import livetail, planner, querys, scoring  # noqa: F401 (registers them)
+
+    for name in db_utils.STATEMENTS:
+        assert re.fullmatch(r"[a-z_][a-z0-9_]*", name), name